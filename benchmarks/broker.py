@@ -0,0 +1,137 @@
+'''A minimal in-process MQTT 3.1.1 broker for the benchmarks
+
+It accepts any number of clients, each served by a thread of its own,
+and implements just enough of the protocol for MQTTClient: CONNECT,
+SUBSCRIBE, PUBLISH at QoS 0, 1 and 2, PINGREQ and DISCONNECT. Nothing
+is routed, every PUBLISH is handed to a callback with the
+time.perf_counter() time at which it was read.
+'''
+
+import socket
+import threading
+import time
+from typing import Callable
+
+CONNECT = 1
+PUBLISH = 3
+PUBREL = 6
+SUBSCRIBE = 8
+PINGREQ = 12
+DISCONNECT = 14
+
+CONNACK = b'\x20\x02\x00\x00'
+PINGRESP = b'\xd0\x00'
+
+
+class Broker(threading.Thread):
+    '''A stand-in broker listening on a free port of 127.0.0.1
+
+    Parameters
+    ----------
+    on_publish : Callable[[str, bytes, float], None]
+        called with the topic, payload and receive time of each PUBLISH
+
+    Attributes
+    ----------
+    port : int
+        the port on which the broker listens
+    clients : int
+        the number of clients connected
+    cpu_seconds : float
+        the CPU time used by the threads serving the clients which have
+        disconnected
+    closed : threading.Event
+        set whenever the last connected client disconnects
+
+    Example
+    -------
+    broker = Broker(lambda topic, payload, received: print(topic))
+    broker.start()
+    client.port = broker.port
+    '''
+
+    def __init__(self, on_publish: Callable[[str, bytes, float], None]):
+        super().__init__(name='Broker', daemon=True)
+        self.on_publish = on_publish
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(128)
+        self.port = self.server.getsockname()[1]
+        self.clients = 0
+        self.cpu_seconds = 0.0
+        self.closed = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self) -> None:
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.clients += 1
+                self.closed.clear()
+            threading.Thread(
+                target=self._serve, args=(conn,), name='Broker-client', daemon=True
+            ).start()
+
+    def stop(self) -> None:
+        '''close the listening socket, no more clients are accepted'''
+        self.server.close()
+
+    def _serve(self, conn: socket.socket) -> None:
+        with conn:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            stream = conn.makefile('rb')
+            try:
+                while self._packet(conn, stream):
+                    pass
+            except (OSError, ValueError):
+                pass
+        with self._lock:
+            self.cpu_seconds += time.thread_time()
+            self.clients -= 1
+            if not self.clients:
+                self.closed.set()
+
+    def _packet(self, conn: socket.socket, stream) -> bool:
+        header = stream.read(1)
+        if not header:
+            return False
+        length = 0
+        for shift in range(0, 28, 7):
+            byte = stream.read(1)[0]
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+        body = stream.read(length)
+        received = time.perf_counter()
+        kind = header[0] >> 4
+        if kind == PUBLISH:
+            qos = (header[0] >> 1) & 3
+            size = int.from_bytes(body[:2], 'big')
+            topic = body[2 : 2 + size].decode('utf-8')
+            offset = 2 + size
+            if qos:
+                packet_id = body[offset : offset + 2]
+                offset += 2
+                # PUBACK for QoS 1, PUBREC for QoS 2
+                conn.sendall((b'\x40\x02' if qos == 1 else b'\x50\x02') + packet_id)
+            self.on_publish(topic, body[offset:], received)
+        elif kind == PUBREL:
+            conn.sendall(b'\x70\x02' + body[:2])
+        elif kind == CONNECT:
+            conn.sendall(CONNACK)
+        elif kind == SUBSCRIBE:
+            # one granted QoS 0 per topic filter
+            topics, offset = 0, 2
+            while offset < len(body):
+                offset += 2 + int.from_bytes(body[offset : offset + 2], 'big') + 1
+                topics += 1
+            conn.sendall(bytes([0x90, 2 + topics]) + body[:2] + bytes(topics))
+        elif kind == PINGREQ:
+            conn.sendall(PINGRESP)
+        elif kind == DISCONNECT:
+            return False
+        return True
@@ -0,0 +1,109 @@
+'''Benchmark of the BME280 compensation on bursts of raw measurements
+
+A burst of raw measurements of a simulated BME280 is compensated one
+measurement at a time with bme280.compensated_readings, as
+bme280.sample() does, and as a batch with BME280Compensation, with the
+plain loop and, when numpy is installed, with numpy. The report gives
+the microseconds per measurement of each at each burst size.
+
+Example
+-------
+python -m benchmarks.compensation --number 2000
+'''
+
+import argparse
+import json
+import sys
+import timeit
+import types
+from typing import Dict, List, Sequence
+
+import bme280
+
+from benchmarks.pipeline import report
+from example.pi_bme280 import compensation
+from example.pi_bme280.simulator import BME280_SIMULATED_CALIBRATION, SimulatedBME280
+
+
+def raw_burst(size: int, seed: int = 1) -> Dict[str, List[int]]:
+    '''return a burst of raw measurements of a simulated BME280'''
+    device = SimulatedBME280(seed=seed)
+    burst = {field: [] for field in device.raw}
+    for _ in range(size):
+        device.measure()
+        for field, value in device.raw.items():
+            burst[field].append(value)
+    return burst
+
+
+def run_compensation(
+    number: int = 1000, sizes: Sequence[int] = (1, 10, 100)
+) -> List[Dict]:
+    '''compensate bursts of each size with each method and return the results
+
+    Parameters
+    ----------
+    number : int
+        the bursts compensated for each timing. Default: 1000
+    sizes : Sequence[int]
+        the measurements in each burst. Default: (1, 10, 100)
+    '''
+    params = bme280.params(BME280_SIMULATED_CALIBRATION)
+    compensator = compensation.BME280Compensation(params)
+    results = []
+    for size in sizes:
+        burst = raw_burst(size)
+        columns = (burst['temperature'], burst['pressure'], burst['humidity'])
+        readings = [
+            types.SimpleNamespace(temperature=t, pressure=p, humidity=h)
+            for t, p, h in zip(*columns)
+        ]
+        methods = {
+            'library': lambda: [
+                bme280.compensated_readings(raw, params) for raw in readings
+            ],
+            'loop': lambda: compensator._loop(*columns),
+        }
+        if compensation.numpy is not None:
+            methods['numpy'] = lambda: compensator._vectorized(*columns)
+        baseline = None
+        for method, compensate in methods.items():
+            # the best of three runs, as the others include interference
+            seconds = min(timeit.repeat(compensate, number=number, repeat=3))
+            us = seconds * 1e6 / number / size
+            baseline = baseline or us
+            results.append(
+                {
+                    'method': method,
+                    'burst': size,
+                    'us_per_reading': round(us, 3),
+                    'speedup': round(baseline / us, 2),
+                }
+            )
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--number', type=int, default=1000, help='bursts timed, default(1000)'
+    )
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[1, 10, 100],
+        help='measurements per burst, default(1 10 100)',
+    )
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args(argv)
+    results = run_compensation(args.number, args.sizes)
+    print(report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
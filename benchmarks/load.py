@@ -0,0 +1,320 @@
+'''Load test with many simulated BME280s in one process
+
+Each simulated BME280 on the SMBusSimulator gets a BME280_Device, and
+the devices are shared out between the clients: by default each has a
+client of its own, as if every device were a separate Raspberry Pi,
+--clients serves several devices from each connection. They publish to
+a broker: the in-process stand-in by default, or a real one with
+--broker. Bus latency, I/O errors and NACKs can be injected.
+
+The report gives the messages per second against the offered load, the
+failed samples, the CPU time per message, the RSS and the number of
+threads, and with the stand-in broker the latency percentiles.
+
+Example
+-------
+python -m benchmarks.load --devices 200 --rate 2 --duration 30
+python -m benchmarks.load --devices 200 --clients 4
+python -m benchmarks.load --devices 50 --broker mqtt.local --error-rate 0.01
+'''
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+from benchmarks.broker import Broker
+from benchmarks.pipeline import (
+    PipelineBME280,
+    identity,
+    max_rss_mb,
+    percentile,
+    report,
+    rss_mb,
+    wait_until,
+)
+from example.pi_bme280.device import BME280_Device
+from example.pi_bme280.simulator import SimulatedBME280
+from ha_mqtt_pi_smbus.async_mqtt_client import (
+    AsyncioLoop_Thread,
+    AsyncMQTTClient,
+    AsyncSMBus_Scheduler,
+)
+from ha_mqtt_pi_smbus.config import Config
+from ha_mqtt_pi_smbus.device import SMBus_Scheduler_Thread
+from ha_mqtt_pi_smbus.metrics import MetricsRegistry
+from ha_mqtt_pi_smbus.mqtt_client import MQTTClient
+from ha_mqtt_pi_smbus.simulator import SMBusSimulator
+
+ADDRESSES = (0x76, 0x77)
+
+
+def run_load(
+    devices: int = 100,
+    rate: float = 1.0,
+    duration: float = 10.0,
+    mode: str = 'asyncio',
+    broker: str = None,
+    port: int = 1883,
+    username: str = None,
+    password: str = None,
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    nack_rate: float = 0.0,
+    seed: int = None,
+    clients: int = None,
+) -> Dict[str, Any]:
+    '''run the devices for a while and return the results
+
+    Parameters
+    ----------
+    devices : int
+        the number of simulated BME280s, two on each bus. Default: 100
+    rate : float
+        the samples per second of each device. Default: 1.0
+    duration : float
+        the seconds for which samples are taken. Default: 10.0
+    mode : str
+        'asyncio' for AsyncMQTTClients sharing one loop, 'thread' for
+        MQTTClients and a scheduler thread per bus. Default: 'asyncio'
+    broker : str
+        the host of the broker. Default: None, the in-process stand-in
+    port : int
+        the port of the broker. Default: 1883
+    username : str
+        the username for the broker. Default: None
+    password : str
+        the password for the broker. Default: None
+    latency : float
+        the seconds added to each bus transaction. Default: 0.0
+    error_rate : float
+        the probability of an I/O error in a bus transaction.
+        Default: 0.0
+    nack_rate : float
+        the probability of a NACK in a bus transaction. Default: 0.0
+    seed : int
+        the seed of the simulated devices and errors. Default: None
+    clients : int
+        the number of clients between which the devices are shared.
+        Default: None, one for each device
+    '''
+    latencies = []
+    lock = threading.Lock()
+
+    def on_publish(topic: str, payload: bytes, received: float) -> None:
+        if topic.endswith('/state'):
+            sampled_at = json.loads(payload)['sampled_at']
+            with lock:
+                latencies.append(received - sampled_at)
+
+    stand_in = None
+    if broker is None:
+        stand_in = Broker(on_publish)
+        stand_in.start()
+        broker, port = '127.0.0.1', stand_in.port
+    config = Config(
+        {
+            'mqtt': {
+                'broker': broker,
+                'port': port,
+                'username': username,
+                'password': password,
+                'diagnostics_interval': 0,
+                'publish_summary_interval': 0,
+            }
+        }
+    )
+    metrics = MetricsRegistry()
+    simulator = SMBusSimulator(latency=latency, seed=seed)
+    buses = [
+        (1 + i // len(ADDRESSES), ADDRESSES[i % len(ADDRESSES)]) for i in range(devices)
+    ]
+    for i, (bus, address) in enumerate(buses):
+        simulator.add_device(
+            bus, address, SimulatedBME280(seed=None if seed is None else seed + i)
+        )
+    clients = [None] * min(clients or devices, devices)
+    with identity(), simulator:
+        if mode == 'asyncio':
+            # sampling starts once the clients have connected
+            scheduler = AsyncSMBus_Scheduler(startup_delay=3600, metrics=metrics)
+            schedulers = {bus: scheduler for bus, _ in buses}
+        else:
+            schedulers = {
+                bus: SMBus_Scheduler_Thread(bus, startup_delay=0, metrics=metrics)
+                for bus, _ in buses
+            }
+        bme280s = []
+        for i, (bus, address) in enumerate(buses):
+            bme280 = PipelineBME280(bus=bus, address=address)
+            device = BME280_Device(
+                f'sim{i}',
+                f'sim{i}/state',
+                'Bosch',
+                'BME280',
+                bme280,
+                1 / rate,
+                scheduler=schedulers[bus],
+                object_id=f'sim{i}',
+            )
+            bme280s.append(bme280)
+            n = i % len(clients)
+            if clients[n] is not None:
+                clients[n].add_device(device, bme280)
+            elif mode == 'asyncio':
+                clients[n] = AsyncMQTTClient(
+                    f'sim{n}',
+                    device,
+                    bme280,
+                    config,
+                    scheduler=scheduler,
+                    metrics=metrics,
+                )
+            else:
+                clients[n] = MQTTClient(
+                    f'sim{n}', device, bme280, config, metrics=metrics
+                )
+        for client in clients:
+            client.connect_mqtt()
+            client.loop_start()
+        if not wait_until(lambda: all(c.state.connected for c in clients), 30):
+            raise Exception('the clients did not all connect to the broker')
+        for client in clients:
+            client.publish_discovery()
+        # errors are injected once the calibration has been read
+        simulator.error_rate = error_rate
+        simulator.nack_rate = nack_rate
+
+        rss_before = rss_mb()
+        published = metrics.counter('mqtt_published_total', '', ('topic',))
+        before = sum(published.get(topic=f'sim{i}/state') for i in range(devices))
+        if mode == 'asyncio':
+            scheduler.startup_delay = 0
+            # adding a device again restarts its sampling
+            for bme280 in bme280s:
+                scheduler.add_device(bme280, 1 / rate)
+        else:
+            for bus_scheduler in schedulers.values():
+                bus_scheduler.start()
+        cpu = time.process_time()
+        start = time.perf_counter()
+        time.sleep(duration)
+        if mode == 'asyncio':
+            scheduler.stop()
+        else:
+            for bus_scheduler in schedulers.values():
+                bus_scheduler.clear_do_run()
+            for bus_scheduler in schedulers.values():
+                bus_scheduler.join()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        threads = threading.active_count()
+        rss_after = rss_mb()
+        messages = (
+            sum(published.get(topic=f'sim{i}/state') for i in range(devices)) - before
+        )
+
+        simulator.error_rate = simulator.nack_rate = 0.0
+        for client in clients:
+            client.clear_discovery()
+            client.loop_stop()
+            client.disconnect_mqtt()
+        if mode == 'asyncio':
+            AsyncioLoop_Thread.stop_all()
+        if stand_in is not None:
+            stand_in.closed.wait(5)
+            stand_in.stop()
+
+    failures = metrics.counter('smbus_sample_failures_total', '', ('bus', 'address'))
+    with lock:
+        latencies = sorted(latencies)
+    result = {
+        'mode': mode,
+        'devices': devices,
+        'clients': len(clients),
+        'rate': rate,
+        'duration': round(elapsed, 3),
+        'offered_per_sec': round(devices * rate, 1),
+        'messages': messages,
+        'messages_per_sec': round(messages / elapsed, 1),
+        'sample_failures': sum(
+            failures.get(bus=bus, address=hex(address)) for bus, address in buses
+        ),
+        'bus_transactions': simulator.transactions,
+        'bus_errors': simulator.errors,
+        'cpu_ms_per_msg': round(cpu * 1000 / max(messages, 1), 4),
+        'threads': threads,
+        'rss_mb': round(rss_after, 1),
+        'rss_growth_mb': round(rss_after - rss_before, 2),
+        'max_rss_mb': round(max_rss_mb(), 1),
+    }
+    if stand_in is not None:
+        result['latency_p50_ms'] = round(percentile(latencies, 0.5) * 1000, 3)
+        result['latency_p99_ms'] = round(percentile(latencies, 0.99) * 1000, 3)
+        result['latency_max_ms'] = round(percentile(latencies, 1.0) * 1000, 3)
+    return result
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--devices', type=int, default=100, help='simulated BME280s, default(100)'
+    )
+    parser.add_argument(
+        '--clients', type=int, help='clients sharing the devices, default(devices)'
+    )
+    parser.add_argument(
+        '--rate', type=float, default=1.0, help='samples per second, default(1)'
+    )
+    parser.add_argument(
+        '--duration', type=float, default=10.0, help='seconds, default(10)'
+    )
+    parser.add_argument(
+        '--mode',
+        choices=('asyncio', 'thread'),
+        default='asyncio',
+        help='default(asyncio)',
+    )
+    parser.add_argument('--broker', help='broker host, default(in-process stand-in)')
+    parser.add_argument('--port', type=int, default=1883, help='default(1883)')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument(
+        '--latency', type=float, default=0.0, help='seconds per bus transaction'
+    )
+    parser.add_argument(
+        '--error-rate', type=float, default=0.0, help='I/O error probability'
+    )
+    parser.add_argument('--nack-rate', type=float, default=0.0, help='NACK probability')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args(argv)
+    # injected errors are counted in the report rather than logged
+    logging.getLogger('ha_mqtt_pi_smbus').setLevel(logging.CRITICAL)
+    result = run_load(
+        args.devices,
+        args.rate,
+        args.duration,
+        args.mode,
+        args.broker,
+        args.port,
+        args.username,
+        args.password,
+        args.latency,
+        args.error_rate,
+        args.nack_rate,
+        args.seed,
+        args.clients,
+    )
+    print(report([result]))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,362 @@
+'''Benchmark of the sample-to-publish pipeline
+
+A simulated BME280 is sampled by the scheduler at a fixed rate and
+every sample is published by MQTTClient (or AsyncMQTTClient) to an
+in-process stand-in broker. Each payload carries the time.perf_counter()
+time at which its sample started, so the broker measures the end-to-end
+latency of every message.
+
+The report gives the latency percentiles, messages per second, CPU time
+per message (excluding the broker thread) and the resident set size.
+Results can be saved with --json and compared with a saved baseline with
+--baseline, which exits with status 1 when a run is worse than the
+baseline by more than --tolerance.
+
+Example
+-------
+python -m benchmarks.pipeline --rate 500 --duration 10 --json bench.json
+python -m benchmarks.pipeline --baseline bench.json
+'''
+
+import argparse
+import contextlib
+import json
+import resource
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+from benchmarks.broker import Broker
+from example.pi_bme280.device import (
+    BME280,
+    BME280_CTRL_MEAS,
+    BME280_MEASUREMENT_REGISTERS,
+    BME280_MODE_FORCED,
+    BME280_Device,
+)
+from example.pi_bme280.simulator import SimulatedBME280
+from ha_mqtt_pi_smbus.async_mqtt_client import (
+    AsyncioLoop_Thread,
+    AsyncMQTTClient,
+    AsyncSMBus_Scheduler,
+)
+from ha_mqtt_pi_smbus.config import Config
+from ha_mqtt_pi_smbus.device import SMBus_Scheduler_Thread
+from ha_mqtt_pi_smbus.environ import get_cpu_info
+from ha_mqtt_pi_smbus.metrics import MetricsRegistry
+from ha_mqtt_pi_smbus.mqtt_client import MQTTClient
+from ha_mqtt_pi_smbus.simulator import SMBusSimulator
+
+STATE_TOPIC = 'bench/state'
+
+# higher is better for these results, lower for the rest
+HIGHER_IS_BETTER = ('messages_per_sec',)
+COMPARED = ('messages_per_sec', 'latency_p50_ms', 'latency_p99_ms', 'cpu_ms_per_msg')
+
+
+class AlternatingBME280(SimulatedBME280):
+    '''A simulated BME280 whose temperature alternates by about 2
+    degrees on each measurement, so every sample is published'''
+
+    def measure(self) -> None:
+        self.measurements += 1
+        self.raw['temperature'] = self.start['temperature'] + 400 * (
+            self.measurements % 2
+        )
+        self._store()
+
+
+class PipelineBME280(BME280):
+    '''A BME280 whose forced-mode conversion takes no time and whose
+    data carries the time at which it was sampled'''
+
+    sampled_at: float = 0.0
+
+    def read_raw(self) -> Dict[str, int]:
+        self._smbus.write_byte_data(
+            self.address, BME280_CTRL_MEAS, BME280_MODE_FORCED
+        )
+        return self.read_registers(BME280_MEASUREMENT_REGISTERS)
+
+    def sample(self) -> None:
+        sampled_at = time.perf_counter()
+        super().sample()
+        self.sampled_at = sampled_at
+
+    def getdata(self) -> Dict[str, Any]:
+        data = super().getdata()
+        data['sampled_at'] = self.sampled_at
+        return data
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    '''return the value below which the fraction of the values lie
+
+    Parameters
+    ----------
+    values : List[float]
+        the sorted values
+    fraction : float
+        between 0 and 1
+    '''
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def rss_mb() -> float:
+    '''return the current resident set size in MiB'''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return max_rss_mb()
+
+
+def max_rss_mb() -> float:
+    '''return the peak resident set size in MiB'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def wait_until(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def identity() -> contextlib.AbstractContextManager:
+    '''off a Raspberry Pi, use the hardware model the tests use'''
+    try:
+        get_cpu_info()
+        return contextlib.nullcontext()
+    except (KeyError, OSError):
+        return patch(
+            'ha_mqtt_pi_smbus.device.get_cpu_info',
+            return_value={'cpu': {'Model': 'benchmark'}},
+        )
+
+
+def run_pipeline(
+    mode: str = 'thread', rate: float = 200.0, duration: float = 5.0, qos: int = 0
+) -> Dict[str, Any]:
+    '''run the pipeline once and return its results
+
+    Parameters
+    ----------
+    mode : str
+        'thread' for MQTTClient with SMBus_Scheduler_Thread, 'asyncio'
+        for AsyncMQTTClient with AsyncSMBus_Scheduler. Default: 'thread'
+    rate : float
+        the samples per second. Default: 200.0
+    duration : float
+        the seconds for which samples are taken. Default: 5.0
+    qos : int
+        the quality of service of the published state. Default: 0
+    '''
+    latencies = []
+    lock = threading.Lock()
+
+    def on_publish(topic: str, payload: bytes, received: float) -> None:
+        if topic == STATE_TOPIC:
+            sampled_at = json.loads(payload)['sampled_at']
+            with lock:
+                latencies.append(received - sampled_at)
+
+    broker = Broker(on_publish)
+    broker.start()
+    config = Config(
+        {
+            'mqtt': {
+                'broker': '127.0.0.1',
+                'port': broker.port,
+                'qos': qos,
+                'diagnostics_interval': 0,
+                'publish_summary_interval': 0,
+            }
+        }
+    )
+    metrics = MetricsRegistry()
+    simulator = SMBusSimulator()
+    simulator.add_device(1, 0x76, AlternatingBME280())
+    with identity(), simulator:
+        bme280 = PipelineBME280(bus=1, address=0x76)
+        if mode == 'asyncio':
+            # sampling starts once the client has connected
+            scheduler = AsyncSMBus_Scheduler(startup_delay=1.0, metrics=metrics)
+        else:
+            scheduler = SMBus_Scheduler_Thread(1, startup_delay=0, metrics=metrics)
+        device = BME280_Device(
+            'bench',
+            STATE_TOPIC,
+            'Bosch',
+            'BME280',
+            bme280,
+            1 / rate,
+            scheduler=scheduler,
+        )
+        if mode == 'asyncio':
+            client = AsyncMQTTClient(
+                'bench', device, bme280, config, scheduler=scheduler, metrics=metrics
+            )
+        else:
+            client = MQTTClient('bench', device, bme280, config, metrics=metrics)
+        client.connect_mqtt()
+        client.loop_start()
+        if not wait_until(lambda: client.state.connected, 5):
+            raise Exception('the client did not connect to the broker')
+        client.publish_discovery(device)
+
+        rss_before = rss_mb()
+        if mode == 'asyncio':
+            wait_until(lambda: bme280.sequence > 0, 5)
+        else:
+            scheduler.start()
+        cpu = time.process_time()
+        start = time.perf_counter()
+        time.sleep(duration)
+        if mode == 'asyncio':
+            scheduler.stop()
+        else:
+            scheduler.clear_do_run()
+            scheduler.join()
+        elapsed = time.perf_counter() - start
+        published = metrics['mqtt_published_total']
+        wait_until(
+            lambda: len(latencies) >= published.get(topic=STATE_TOPIC), 2
+        )
+        cpu = time.process_time() - cpu
+        rss_after = rss_mb()
+
+        client.clear_discovery(device)
+        client.loop_stop()
+        client.disconnect_mqtt()
+        broker.closed.wait(2)
+        if mode == 'asyncio':
+            AsyncioLoop_Thread.stop_all()
+        broker.stop()
+
+    with lock:
+        latencies = sorted(latencies)
+    messages = len(latencies)
+    samples = metrics['smbus_samples_total'].get(bus=1, address='0x76')
+    return {
+        'mode': mode,
+        'rate': rate,
+        'qos': qos,
+        'duration': round(elapsed, 3),
+        'samples': samples,
+        'messages': messages,
+        'messages_per_sec': round(messages / elapsed, 1),
+        'missed_deadlines': scheduler.missed_deadlines,
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'latency_p90_ms': round(percentile(latencies, 0.9) * 1000, 3),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'latency_max_ms': round(percentile(latencies, 1.0) * 1000, 3),
+        'latency_mean_ms': round(
+            statistics.fmean(latencies) * 1000 if latencies else float('nan'), 3
+        ),
+        'cpu_ms_per_msg': round(
+            (cpu - broker.cpu_seconds) * 1000 / max(messages, 1), 4
+        ),
+        'rss_mb': round(rss_after, 1),
+        'rss_growth_mb': round(rss_after - rss_before, 2),
+        'max_rss_mb': round(max_rss_mb(), 1),
+    }
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> List[str]:
+    '''return a description of each result worse than its baseline
+
+    Parameters
+    ----------
+    results : List[Dict[str, Any]]
+        the results of this run
+    baseline : List[Dict[str, Any]]
+        the saved results, matched by mode, rate and qos
+    tolerance : float
+        the fraction by which a result may be worse than its baseline
+    '''
+    regressions = []
+    saved = {(b['mode'], b['rate'], b['qos']): b for b in baseline}
+    for result in results:
+        base = saved.get((result['mode'], result['rate'], result['qos']))
+        if base is None:
+            continue
+        for key in COMPARED:
+            old, new = base[key], result[key]
+            if key in HIGHER_IS_BETTER:
+                worse = new < old * (1 - tolerance)
+            else:
+                worse = new > old * (1 + tolerance)
+            if worse:
+                regressions.append(f'{result["mode"]} {key}: {old} -> {new}')
+    return regressions
+
+
+def report(results: List[Dict[str, Any]]) -> str:
+    '''return the results as a table'''
+    keys = list(results[0])
+    width = max(len(key) for key in keys)
+    lines = []
+    for key in keys:
+        values = ''.join(f'{str(result[key]):>14}' for result in results)
+        lines.append(f'{key:<{width}}{values}')
+    return '\n'.join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--mode',
+        choices=('thread', 'asyncio', 'both'),
+        default='both',
+        help='the client to benchmark, default(both)',
+    )
+    parser.add_argument(
+        '--rate', type=float, default=200.0, help='samples per second, default(200)'
+    )
+    parser.add_argument(
+        '--duration', type=float, default=5.0, help='seconds per run, default(5)'
+    )
+    parser.add_argument(
+        '--qos', type=int, choices=(0, 1, 2), default=0, help='default(0)'
+    )
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--baseline', help='compare with the results in this file')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.25,
+        help='the fraction by which a result may be worse than the baseline, '
+        + 'default(0.25)',
+    )
+    args = parser.parse_args(argv)
+    modes = ('thread', 'asyncio') if args.mode == 'both' else (args.mode,)
+    results = [run_pipeline(mode, args.rate, args.duration, args.qos) for mode in modes]
+    print(report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+'''Benchmark of the JSON serializers on the published payloads
+
+Each installed serializer (see ha_mqtt_pi_smbus.serializer) encodes the
+state of a simulated BME280, as returned by getdata(), and the
+discovery payload of its BME280_Device. The report gives the
+microseconds per encoding and the size of the payload for each.
+
+Example
+-------
+python -m benchmarks.serializers --number 20000
+'''
+
+import argparse
+import json
+import sys
+import timeit
+from typing import Any, Dict, List
+
+from benchmarks.pipeline import identity, report
+from example.pi_bme280.device import BME280, BME280_Device
+from example.pi_bme280.simulator import SimulatedBME280
+from ha_mqtt_pi_smbus.serializer import available_serializers, get_serializer
+from ha_mqtt_pi_smbus.simulator import SMBusSimulator
+
+
+def payloads() -> Dict[str, Any]:
+    '''return the state and discovery payload of a simulated BME280'''
+    simulator = SMBusSimulator()
+    simulator.add_device(1, 0x76, SimulatedBME280(noise=0))
+    with identity(), simulator:
+        bme280 = BME280(bus=1, address=0x76)
+        bme280.sample()
+        device = BME280_Device('bench', 'bench/state', 'Bosch', 'BME280', bme280, 60)
+        return {'state': bme280.getdata(), 'discovery': device.discovery_payload}
+
+
+def run_serializers(number: int = 10000, names: List[str] = None) -> List[Dict]:
+    '''encode the payloads with each serializer and return the results
+
+    Parameters
+    ----------
+    number : int
+        the encodings of each payload timed. Default: 10000
+    names : List[str]
+        the serializers. Default: None, every one installed
+    '''
+    objects = payloads()
+    results = []
+    for name in names or available_serializers():
+        serializer = get_serializer(name)
+        result = {'serializer': name}
+        for payload, obj in objects.items():
+            # the best of three runs, as the others include interference
+            seconds = min(
+                timeit.repeat(lambda: serializer.dumps(obj), number=number, repeat=3)
+            )
+            result[f'{payload}_us'] = round(seconds * 1e6 / number, 3)
+            result[f'{payload}_bytes'] = len(serializer.dumps(obj))
+        results.append(result)
+    baseline = next((r for r in results if r['serializer'] == 'json'), None)
+    for result in results:
+        for payload in objects:
+            result[f'{payload}_speedup'] = (
+                round(baseline[f'{payload}_us'] / result[f'{payload}_us'], 2)
+                if baseline
+                else None
+            )
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--number', type=int, default=10000, help='encodings timed, default(10000)'
+    )
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args(argv)
+    results = run_serializers(args.number)
+    print(report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,63 @@
 import datetime
 import logging
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Sequence
 
 import bme280
 
+from example.pi_bme280.compensation import BME280Compensation
 from ha_mqtt_pi_smbus.device import (
     HADevice,
     HASensor,
+    Reading,
+    SMBus_Scheduler_Thread,
     SMBusDevice,
     SMBusDevice_Sampler_Thread,
+    SMBusRegister,
+    SMBusRegisterMap,
 )
 
+# Calibration (trimming) registers, see section 4.2.2 of the BME280
+# datasheet. dig_H4 and dig_H5 share register 0xE5 and are assembled
+# from the e4, e5 and e6 bytes.
+BME280_CALIBRATION_REGISTERS = SMBusRegisterMap(
+    [
+        SMBusRegister('dig_T1', 0x88, 2),
+        SMBusRegister('dig_T2', 0x8A, 2, signed=True),
+        SMBusRegister('dig_T3', 0x8C, 2, signed=True),
+        SMBusRegister('dig_P1', 0x8E, 2),
+        SMBusRegister('dig_P2', 0x90, 2, signed=True),
+        SMBusRegister('dig_P3', 0x92, 2, signed=True),
+        SMBusRegister('dig_P4', 0x94, 2, signed=True),
+        SMBusRegister('dig_P5', 0x96, 2, signed=True),
+        SMBusRegister('dig_P6', 0x98, 2, signed=True),
+        SMBusRegister('dig_P7', 0x9A, 2, signed=True),
+        SMBusRegister('dig_P8', 0x9C, 2, signed=True),
+        SMBusRegister('dig_P9', 0x9E, 2, signed=True),
+        SMBusRegister('dig_H1', 0xA1),
+        SMBusRegister('dig_H2', 0xE1, 2, signed=True),
+        SMBusRegister('dig_H3', 0xE3, signed=True),
+        SMBusRegister('e4', 0xE4, signed=True),
+        SMBusRegister('e5', 0xE5, signed=True),
+        SMBusRegister('e6', 0xE6, signed=True),
+        SMBusRegister('dig_H6', 0xE7, signed=True),
+    ]
+)
+
+# Raw ADC output registers 0xF7 to 0xFE, read in a single burst as
+# recommended by section 4 of the BME280 datasheet.
+BME280_MEASUREMENT_REGISTERS = SMBusRegisterMap(
+    [
+        SMBusRegister('pressure', 0xF7, 3, byteorder='big', shift=4),
+        SMBusRegister('temperature', 0xFA, 3, byteorder='big', shift=4),
+        SMBusRegister('humidity', 0xFD, 2, byteorder='big'),
+    ]
+)
+
+BME280_CTRL_HUM = 0xF2
+BME280_CTRL_MEAS = 0xF4
+BME280_MODE_FORCED = 1
+
 
 class Temperature(HASensor):
     '''Definition for a Bosch BME280 Temperature Sensor on Home Assistant MQTT 
@@ -25,6 +72,15 @@ class Temperature(HASensor):
     expire_after : int
         the expiry for sensor, after which the sensor will be marked
         unavailable
+    deadband : float
+        the change in value below which the state is not republished
+    max_silence : float
+        the maximum seconds between state publications
+    history : int
+        the number of sampled values kept, see HASensor. Default: 0
+    statistics : Sequence[str]
+        the statistics published for the sensor, see HASensor.
+        Default: ()
     '''
     units: str = f'{chr(176)}C'
     device_class = 'temperature'
@@ -34,6 +90,10 @@ class Temperature(HASensor):
         sensor_name: str = None,
         basename: str = 'homeassistant',
         expire_after: int = 120,
+        deadband: float = 0.0,
+        max_silence: float = None,
+        history: int = 0,
+        statistics: Sequence[str] = (),
     ):
         super().__init__(
             self.units,
@@ -41,6 +101,10 @@ class Temperature(HASensor):
             basename=basename,
             device_class=self.device_class,
             expire_after=expire_after,
+            deadband=deadband,
+            max_silence=max_silence,
+            history=history,
+            statistics=statistics,
         )
 
 
@@ -57,6 +121,15 @@ class Pressure(HASensor):
     expire_after : int
         the expiry for sensor, after which the sensor will be marked
         unavailable
+    deadband : float
+        the change in value below which the state is not republished
+    max_silence : float
+        the maximum seconds between state publications
+    history : int
+        the number of sampled values kept, see HASensor. Default: 0
+    statistics : Sequence[str]
+        the statistics published for the sensor, see HASensor.
+        Default: ()
     '''
     units: str = 'mbar'
     device_class = 'pressure'
@@ -66,6 +139,10 @@ class Pressure(HASensor):
         sensor_name: str = None,
         basename: str = 'homeassistant',
         expire_after: int = 120,
+        deadband: float = 0.0,
+        max_silence: float = None,
+        history: int = 0,
+        statistics: Sequence[str] = (),
     ):
         super().__init__(
             self.units,
@@ -73,6 +150,10 @@ class Pressure(HASensor):
             basename=basename,
             device_class=self.device_class,
             expire_after=expire_after,
+            deadband=deadband,
+            max_silence=max_silence,
+            history=history,
+            statistics=statistics,
         )
 
 
@@ -89,6 +170,15 @@ class Humidity(HASensor):
     expire_after : int
         the expiry for sensor, after which the sensor will be marked
         unavailable
+    deadband : float
+        the change in value below which the state is not republished
+    max_silence : float
+        the maximum seconds between state publications
+    history : int
+        the number of sampled values kept, see HASensor. Default: 0
+    statistics : Sequence[str]
+        the statistics published for the sensor, see HASensor.
+        Default: ()
     '''
     units: str = '%'
     device_class = 'humidity'
@@ -98,6 +188,10 @@ class Humidity(HASensor):
         sensor_name: str = None,
         basename: str = 'homeassistant',
         expire_after: int = 120,
+        deadband: float = 0.0,
+        max_silence: float = None,
+        history: int = 0,
+        statistics: Sequence[str] = (),
     ):
         super().__init__(
             self.units,
@@ -105,6 +199,10 @@ class Humidity(HASensor):
             basename=basename,
             device_class=self.device_class,
             expire_after=expire_after,
+            deadband=deadband,
+            max_silence=max_silence,
+            history=history,
+            statistics=statistics,
         )
 
 
@@ -129,15 +227,42 @@ class BME280_Device(HADevice):
     smbus_device : SMBusDivice
         The sensor device's interface object. This object communicates
         with the physical device to retrieve the sensor data.
-    polling_interval : int
-        The interval at which data will be sampled from the device and
-        placed in the device object.
+    polling_interval : float
+        The interval in seconds at which data will be sampled from the
+        device and placed in the device object.
     basename : str
         The basename of the MQTT topics used to communicate to Home
         Assistant. Default: 'homeassistant'
     expire_after : int
         the expiry for the device, after which the sensor in the device 
         will be marked unavailable
+    startup_delay : float
+        the number of seconds to wait before the first sample.
+        Default: 10.0
+    scheduler : SMBus_Scheduler_Thread
+        a scheduler shared by the devices on the bus. When supplied the
+        device is added to it rather than starting a sampler thread of
+        its own, and startup_delay is ignored. Default: None
+    deadband : Dict[str, float]
+        the deadband of each sensor keyed by device class, e.g.
+        {'temperature': 0.1}. Sensors not listed publish every change.
+        Default: None
+    max_silence : float
+        the maximum seconds between state publications. Default: None,
+        half of expire_after
+    object_id : str
+        the id in the discovery topic of the device, see HADevice.
+        Default: None, the serial number of the host
+    history : int
+        the number of sampled values of each sensor kept in memory, see
+        HASensor. Default: 0, none
+    statistics : Dict[str, Sequence[str]]
+        the statistics of each sensor keyed by device class, e.g.
+        {'temperature': ('min', 'max', 'mean')}, see HASensor.
+        Default: None
+    statistics_window : float
+        the seconds over which the statistics are computed, see
+        HADevice. Default: None, every sample is published
 
     Example
     -------
@@ -153,42 +278,73 @@ class BME280_Device(HADevice):
         manufacturer: str,
         model: str,
         smbus_device: SMBusDevice,
-        polling_interval: int,
+        polling_interval: float,
         basename: str = 'homeassistant',
         expire_after: int = 120,
+        startup_delay: float = 10.0,
+        scheduler: SMBus_Scheduler_Thread = None,
+        deadband: Dict[str, float] = None,
+        max_silence: float = None,
+        object_id: str = None,
+        history: int = 0,
+        statistics: Dict[str, Sequence[str]] = None,
+        statistics_window: float = None,
     ):
+        deadband = deadband or {}
+        statistics = statistics or {}
         super().__init__(
             [
-                Temperature(
-                    name,
-                    basename=basename,
-                    expire_after=expire_after,
-                ),
-                Pressure(
+                sensor(
                     name,
                     basename=basename,
                     expire_after=expire_after,
-                ),
-                Humidity(
-                    name,
-                    basename=basename,
-                    expire_after=expire_after,
-                ),
+                    deadband=deadband.get(sensor.device_class, 0.0),
+                    max_silence=max_silence,
+                    history=history,
+                    statistics=statistics.get(sensor.device_class, ()),
+                )
+                for sensor in (Temperature, Pressure, Humidity)
             ],
             name,
             state_topic,
             manufacturer,
             model,
+            object_id=object_id,
+            statistics_window=statistics_window,
         )
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
         self.smbus_device = smbus_device
-        self.sampler_thread = SMBusDevice_Sampler_Thread(smbus_device, polling_interval)
+        self.sampler_thread = None
+        if scheduler is not None:
+            scheduler.add_device(smbus_device, polling_interval)
+            return
+        self.sampler_thread = SMBusDevice_Sampler_Thread(
+            smbus_device, polling_interval, startup_delay=startup_delay
+        )
         self.sampler_thread.start()
 
     def getdata(self) -> Dict[str, Any]:
         return self.smbus_device.getdata()
 
 
+class BME280Reading(Reading):
+    '''A sample of a BME280, see Reading
+
+    Parameters
+    ----------
+    last_update : datetime.datetime
+        the time of the sample
+    temperature : float
+        the temperature in degrees Celsius
+    pressure : float
+        the pressure in mbar
+    humidity : float
+        the relative humidity in %
+    '''
+
+    __slots__ = ('temperature', 'pressure', 'humidity')
+
+
 class BME280(SMBusDevice):
     '''Definition for a SMBus device which communicated over I2C
 
@@ -200,6 +356,9 @@ class BME280(SMBusDevice):
     address : int
         The address of the sensor device on the I2C bus. For a BME280
         this is either 0x76(118) or 0x77(119).
+    oversampling : int
+        The oversampling setting used for all three measurements, one of
+        the bme280.oversampling values. Default: bme280.oversampling.x1
 
     Example
     -------
@@ -208,24 +367,126 @@ class BME280(SMBusDevice):
 
     '''
 
-    last_update: datetime = datetime.datetime.now()
-    temperature: float = -32.0 * 5 / 9
-    pressure: float = 0.0
-    humidity: float = 0.0
-
-    def __init__(self, bus: int = 1, address: int = 0x76):
+    def __init__(
+        self,
+        bus: int = 1,
+        address: int = 0x76,
+        oversampling: int = bme280.oversampling.x1,
+    ):
         super().__init__(bus)
         self.bus = bus
         self.address = address
-        self._calibration_params = bme280.load_calibration_params(
-            self._smbus, self.address
+        self.oversampling = oversampling
+        self._calibration_params = self.load_calibration_params()
+        self._compensation = BME280Compensation(self._calibration_params)
+        self.reading = BME280Reading(
+            last_update=datetime.datetime.now(),
+            temperature=-32.0 * 5 / 9,
+            pressure=0.0,
+            humidity=0.0,
         )
 
+    @property
+    def temperature(self) -> float:
+        '''the temperature of the current reading'''
+        return self.reading.temperature
+
+    @temperature.setter
+    def temperature(self, value: float) -> None:
+        self.reading = self.reading.replace(temperature=value)
+
+    @property
+    def pressure(self) -> float:
+        '''the pressure of the current reading'''
+        return self.reading.pressure
+
+    @pressure.setter
+    def pressure(self, value: float) -> None:
+        self.reading = self.reading.replace(pressure=value)
+
+    @property
+    def humidity(self) -> float:
+        '''the humidity of the current reading'''
+        return self.reading.humidity
+
+    @humidity.setter
+    def humidity(self, value: float) -> None:
+        self.reading = self.reading.replace(humidity=value)
+
+    def load_calibration_params(self) -> bme280.params:
+        '''read the calibration parameters of the device
+
+        All the trimming registers are read in one combined bus
+        transaction rather than one transaction per parameter.
+
+        Parameters
+        ----------
+        None
+
+        Return
+        ------
+        bme280.params : the compensation parameters used by
+        bme280.compensated_readings
+        '''
+        values = self.read_registers(BME280_CALIBRATION_REGISTERS)
+        e4 = values.pop('e4')
+        e5 = values.pop('e5')
+        e6 = values.pop('e6')
+        params = bme280.params(values)
+        params.dig_H4 = e4 << 4 | e5 & 0x0F
+        params.dig_H5 = ((e5 >> 4) & 0x0F) | (e6 << 4)
+        return params
+
+    def read_raw(self) -> Dict[str, int]:
+        '''trigger a forced-mode measurement and read the raw ADC values
+
+        Parameters
+        ----------
+        None
+
+        Return
+        ------
+        Dict[str, int] : the uncompensated 'temperature', 'pressure' and
+        'humidity' ADC values
+        '''
+        osrs = self.oversampling
+        self._smbus.write_byte_data(self.address, BME280_CTRL_HUM, osrs)
+        self._smbus.write_byte_data(
+            self.address,
+            BME280_CTRL_MEAS,
+            osrs << 5 | osrs << 2 | BME280_MODE_FORCED,
+        )
+        # maximum measurement time, see section 9.1 of the datasheet
+        time.sleep(0.00125 + 0.0023 * 3 * (1 << osrs) + 0.000575 * 2)
+        return self.read_registers(BME280_MEASUREMENT_REGISTERS)
+
+    def read_compensated(self) -> Dict[str, float]:
+        '''take one measurement and compensate it
+
+        Parameters
+        ----------
+        None
+
+        Return
+        ------
+        Dict[str, float] : the 'temperature' in degrees Celsius, the
+        'pressure' in mbar and the 'humidity' in %
+        '''
+        raw = self.read_raw()
+        data = self._compensation(
+            [raw['temperature']], [raw['pressure']], [raw['humidity']]
+        )
+        return {field: column[0] for field, column in data.items()}
+
     def sample(self) -> None:
         '''makes one sample of the device
 
         The sampled data is retained in the device for later collection
-        with the data() method.
+        with the getdata() method. The new BME280Reading replaces the
+        previous one in a single assignment, so getdata() never sees a
+        partly updated sample. A burst of measurements is taken and
+        filtered when set_conditioning() was called; the raw values of
+        the burst are compensated together, see BME280Compensation.
 
         Parameters
         ----------
@@ -236,12 +497,11 @@ class BME280(SMBusDevice):
         bme280.sample()
 
         '''
-        super().sample()
-        data = bme280.sample(self._smbus, self.address, self._calibration_params)
-        self.last_update = datetime.datetime.now()
-        self.temperature = data.temperature
-        self.pressure = data.pressure
-        self.humidity = data.humidity
+        raw = self.read_burst(self.read_raw)
+        values = self.condition(
+            self._compensation(raw['temperature'], raw['pressure'], raw['humidity'])
+        )
+        self.reading = BME280Reading(last_update=datetime.datetime.now(), **values)
 
     def getdata(self) -> Dict[str, Any]:
         '''returns sampled data
@@ -259,14 +519,15 @@ class BME280(SMBusDevice):
         A dict structure containing pertinent data.
 
         '''
+        reading = self.reading
         return {
-            'last_update': self.last_update.strftime('%m/%d/%Y %H:%M:%S'),
+            'last_update': reading.last_update.strftime('%m/%d/%Y %H:%M:%S'),
             'bus': self.bus,
             'address': self.address,
-            'temperature': round(self.temperature, 1),
+            'temperature': round(reading.temperature, 1),
             'temperature_units': f'{chr(176)}C',
-            'pressure': round(self.pressure, 1),
+            'pressure': round(reading.pressure, 1),
             'pressure_units': 'mbar',
-            'humidity': round(self.humidity, 1),
+            'humidity': round(reading.humidity, 1),
             'humidity_units': '%',
         }
@@ -1,6 +1,8 @@
 import logging
 from typing import Any, Dict
 
+from ha_mqtt_pi_smbus.aggregation import STATISTICS
+from ha_mqtt_pi_smbus.conditioning import FILTERS
 from ha_mqtt_pi_smbus.config import Config
 from ha_mqtt_pi_smbus.parsing import Parser
 from ha_mqtt_pi_smbus.util import auto_int
@@ -28,7 +30,68 @@ class BME280Parser(Parser):
             type=str,
         )
         self.add_argument(
-            '-I', '--bme280_polling_interval', help='BME280 polling interval', type=int
+            '-I',
+            '--bme280_polling_interval',
+            help='BME280 polling interval in seconds, fractions allowed',
+            type=float,
+        )
+        self.add_argument(
+            '--bme280_startup_delay',
+            help='BME280 delay in seconds before the first sample',
+            type=float,
+        )
+        for field in ('temperature', 'pressure', 'humidity'):
+            self.add_argument(
+                f'--bme280_{field}_deadband',
+                help=f'BME280 {field} change below which the state is not republished',
+                type=float,
+            )
+        self.add_argument(
+            '--bme280_max_silence',
+            help='BME280 maximum seconds between state publications',
+            type=float,
+        )
+        self.add_argument(
+            '--bme280_history_size',
+            help='BME280 number of samples of each sensor kept in memory',
+            type=int,
+        )
+        self.add_argument(
+            '--bme280_statistics_window',
+            help='BME280 seconds over which the statistics are published, 0 for none',
+            type=float,
+        )
+        self.add_argument(
+            '--bme280_statistics',
+            help='BME280 statistics published for each sensor',
+            nargs='+',
+            choices=STATISTICS,
+        )
+        self.add_argument(
+            '--bme280_burst',
+            help='BME280 number of measurements filtered into each sample',
+            type=int,
+        )
+        self.add_argument(
+            '--bme280_filter',
+            help='BME280 filter of the measurements of each sample',
+            choices=FILTERS,
+        )
+        self.add_argument(
+            '--bme280_ema_alpha',
+            help='BME280 weight of the latest sample for the ema filter',
+            type=float,
+        )
+        self.add_argument(
+            '--bme280_hampel_threshold',
+            help='BME280 deviations beyond which the hampel filter rejects a '
+            + 'measurement',
+            type=float,
+        )
+        self.add_argument(
+            '--bme280_simulate',
+            help='simulate the BME280, for running without I2C hardware',
+            action='store_true',
         )
 
     def parse_args(self):
@@ -45,14 +108,50 @@ class BME280Parser(Parser):
             bme280['sensor_name'] = self.args.bme280_sensor_name
         if self.args.bme280_polling_interval is not None:
             bme280['polling_interval'] = self.args.bme280_polling_interval
+        if self.args.bme280_startup_delay is not None:
+            bme280['startup_delay'] = self.args.bme280_startup_delay
+        for field in ('temperature', 'pressure', 'humidity'):
+            value = getattr(self.args, f'bme280_{field}_deadband')
+            if value is not None:
+                bme280[f'{field}_deadband'] = value
+        if self.args.bme280_max_silence is not None:
+            bme280['max_silence'] = self.args.bme280_max_silence
+        if self.args.bme280_history_size is not None:
+            bme280['history_size'] = self.args.bme280_history_size
+        if self.args.bme280_statistics_window is not None:
+            bme280['statistics_window'] = self.args.bme280_statistics_window
+        if self.args.bme280_statistics is not None:
+            bme280['statistics'] = self.args.bme280_statistics
+        for field in ('burst', 'filter', 'ema_alpha', 'hampel_threshold'):
+            value = getattr(self.args, f'bme280_{field}')
+            if value is not None:
+                bme280[field] = value
+        if self.args.bme280_simulate:
+            bme280['simulate'] = True
         self._config_dict['bme280'] = bme280    
 
 
 class Bme280Config():
+    '''The BME280 options, the class attributes are the defaults of the
+    options which are not given'''
+
     address: int
     bus: int
     sensor_name: str
-    polling_interval: int
+    polling_interval: float
+    startup_delay: float = 10.0
+    temperature_deadband: float = 0.0
+    pressure_deadband: float = 0.0
+    humidity_deadband: float = 0.0
+    max_silence: float = None
+    history_size: int = 0
+    statistics_window: float = 0.0
+    statistics: tuple = ()
+    burst: int = 1
+    filter: str = None
+    ema_alpha: float = 0.3
+    hampel_threshold: float = 3.0
+    simulate: bool = False
 
     #def __init__(self, args:Dict[str, Any] = None):
     #    if 'args' == None:
@@ -78,6 +177,20 @@ class Bme280Config():
         config.address = self.address
         config.sensor_name = self.sensor_name
         config.polling_interval = self.polling_interval
+        config.startup_delay = self.startup_delay
+        config.temperature_deadband = self.temperature_deadband
+        config.pressure_deadband = self.pressure_deadband
+        config.humidity_deadband = self.humidity_deadband
+        config.max_silence = self.max_silence
+        config.history_size = self.history_size
+        config.statistics_window = self.statistics_window
+        config.statistics = tuple(self.statistics)
+        config.burst = self.burst
+        config.filter = self.filter
+        config.ema_alpha = self.ema_alpha
+        config.hampel_threshold = self.hampel_threshold
+        config.simulate = self.simulate
+        return config
 
     def sanitize(self):
         return self
@@ -2,11 +2,15 @@ import atexit
 import logging
 import sys
 
-from example.pi_bme280.parsing import BME280Parser
+from example.pi_bme280.parsing import Bme280Config, BME280Parser
 from example.pi_bme280.device import BME280, BME280_Device
-from ha_mqtt_pi_smbus.config import Config
+from example.pi_bme280.simulator import SimulatedBME280
+from ha_mqtt_pi_smbus.async_mqtt_client import AsyncMQTTClient, AsyncSMBus_Scheduler
+from ha_mqtt_pi_smbus.conditioning import Conditioner
+from ha_mqtt_pi_smbus.config import Config, dict_to_config
 from ha_mqtt_pi_smbus.hamqtt_logging import loggerConfig
 from ha_mqtt_pi_smbus.mqtt_client import MQTTClient
+from ha_mqtt_pi_smbus.simulator import SMBusSimulator
 from ha_mqtt_pi_smbus.web_server import HAFlask
 
 app = None
@@ -30,13 +34,40 @@ def main(args):
     parser = BME280Parser()
     parser.parse_args()
     config = Config(parser._config_dict)
+    # the BME280 options not given take the defaults of Bme280Config
+    config.bme280 = dict_to_config(vars(config.bme280), Bme280Config())
 
     # logger Setup
     loggerConfig()
     logger = logging.getLogger(__name__)
 
+    # a simulated BME280 stands in for the hardware
+    if config.bme280.simulate:
+        simulator = SMBusSimulator()
+        simulator.add_device(
+            config.bme280.bus, config.bme280.address, SimulatedBME280()
+        )
+        simulator.install()
+
     # BME280 Setup
     bme280 = BME280(bus=config.bme280.bus, address=config.bme280.address)
+    if config.bme280.burst > 1 or config.bme280.filter is not None:
+        bme280.set_conditioning(
+            config.bme280.burst,
+            {
+                field: Conditioner(
+                    config.bme280.filter or 'median',
+                    alpha=config.bme280.ema_alpha,
+                    threshold=config.bme280.hampel_threshold,
+                )
+                for field in ('temperature', 'pressure', 'humidity')
+            },
+        )
+
+    # the asyncio mode samples on the event loop rather than a thread
+    scheduler = None
+    if config.mqtt.asyncio:
+        scheduler = AsyncSMBus_Scheduler(startup_delay=config.bme280.startup_delay)
 
     # Device setup
     device = BME280_Device(
@@ -48,10 +79,26 @@ def main(args):
         polling_interval=config.bme280.polling_interval,
         expire_after=config.mqtt.expire_after,
         basename='homeassistant',
+        startup_delay=config.bme280.startup_delay,
+        deadband={
+            field: getattr(config.bme280, f'{field}_deadband')
+            for field in ('temperature', 'pressure', 'humidity')
+        },
+        max_silence=config.bme280.max_silence,
+        history=config.bme280.history_size,
+        statistics={
+            field: config.bme280.statistics
+            for field in ('temperature', 'pressure', 'humidity')
+        },
+        statistics_window=config.bme280.statistics_window,
+        scheduler=scheduler,
     )
 
     # MQTT Setup
-    client = MQTTClient('bme280', device, bme280, config)
+    if scheduler is None:
+        client = MQTTClient('bme280', device, bme280, config)
+    else:
+        client = AsyncMQTTClient('bme280', device, bme280, config, scheduler=scheduler)
 
     # define the Flask web server
     app = HAFlask(__name__, config, client, device)
@@ -0,0 +1,126 @@
+import random
+
+from example.pi_bme280.device import BME280_CTRL_MEAS
+from ha_mqtt_pi_smbus.simulator import SimulatedDevice
+
+BME280_CHIP_ID = 0xD0
+
+# trimming values of the Bosch reference driver test vectors
+BME280_SIMULATED_CALIBRATION = {
+    'dig_T1': 27504,
+    'dig_T2': 26435,
+    'dig_T3': -1000,
+    'dig_P1': 36477,
+    'dig_P2': -10685,
+    'dig_P3': 3024,
+    'dig_P4': 2855,
+    'dig_P5': 140,
+    'dig_P6': -7,
+    'dig_P7': 15500,
+    'dig_P8': -14600,
+    'dig_P9': 6000,
+    'dig_H1': 75,
+    'dig_H2': 362,
+    'dig_H3': 0,
+    'dig_H4': 324,
+    'dig_H5': 0,
+    'dig_H6': 30,
+}
+
+
+class SimulatedBME280(SimulatedDevice):
+    '''A BME280 on the SMBusSimulator
+
+    The register file holds the chip id and the trimming parameters. Each
+    write of a measurement mode to ctrl_meas takes a new measurement: the
+    raw ADC values take a random walk around the starting values, so the
+    compensated readings drift the way a real room does.
+
+    Parameters
+    ----------
+    temperature : int
+        the starting raw temperature ADC value. Default: 519888, ~25 C
+    pressure : int
+        the starting raw pressure ADC value. Default: 415148, ~1007 mbar
+    humidity : int
+        the starting raw humidity ADC value. Default: 30000
+    noise : int
+        the standard deviation, in ADC counts, of each step of the walk.
+        Default: 50
+    seed : int
+        the seed of the walk. Default: None
+
+    Attributes
+    ----------
+    measurements : int
+        the number of measurements taken
+
+    Example
+    -------
+    simulator = SMBusSimulator()
+    for bus in range(1, 101):
+        simulator.add_device(bus, 0x76, SimulatedBME280(seed=bus))
+    simulator.install()
+    bme280s = [BME280(bus=bus, address=0x76) for bus in range(1, 101)]
+    '''
+
+    def __init__(
+        self,
+        temperature: int = 519888,
+        pressure: int = 415148,
+        humidity: int = 30000,
+        noise: int = 50,
+        seed: int = None,
+    ):
+        super().__init__()
+        self.start = {
+            'temperature': temperature,
+            'pressure': pressure,
+            'humidity': humidity,
+        }
+        self.raw = dict(self.start)
+        self.noise = noise
+        self.measurements = 0
+        self._random = random.Random(seed)
+        self.registers[BME280_CHIP_ID] = 0x60
+        cal = BME280_SIMULATED_CALIBRATION
+        names = ['dig_T1', 'dig_T2', 'dig_T3'] + [f'dig_P{n}' for n in range(1, 10)]
+        for i, name in enumerate(names):
+            self.registers[0x88 + 2 * i : 0x8A + 2 * i] = cal[name].to_bytes(
+                2, 'little', signed=cal[name] < 0
+            )
+        self.registers[0xA1] = cal['dig_H1']
+        self.registers[0xE1:0xE3] = cal['dig_H2'].to_bytes(2, 'little', signed=True)
+        self.registers[0xE3] = cal['dig_H3']
+        self.registers[0xE4] = cal['dig_H4'] >> 4
+        self.registers[0xE5] = (cal['dig_H4'] & 0x0F) | ((cal['dig_H5'] & 0x0F) << 4)
+        self.registers[0xE6] = cal['dig_H5'] >> 4
+        self.registers[0xE7] = cal['dig_H6']
+        self._store()
+
+    def write(self, register: int, data: bytes) -> None:
+        super().write(register, data)
+        if register <= BME280_CTRL_MEAS < register + len(data):
+            if data[BME280_CTRL_MEAS - register] & 0x03:
+                self.measure()
+
+    def measure(self) -> None:
+        '''take a measurement, moving each raw value one step
+
+        Parameters
+        ----------
+        None
+        '''
+        for name, start in self.start.items():
+            # the walk is kept within 5% of its starting value
+            step = round(self._random.gauss(0, self.noise))
+            self.raw[name] = min(
+                max(self.raw[name] + step, int(start * 0.95)), int(start * 1.05)
+            )
+        self.measurements += 1
+        self._store()
+
+    def _store(self) -> None:
+        self.registers[0xF7:0xFA] = (self.raw['pressure'] << 4).to_bytes(3, 'big')
+        self.registers[0xFA:0xFD] = (self.raw['temperature'] << 4).to_bytes(3, 'big')
+        self.registers[0xFD:0xFF] = self.raw['humidity'].to_bytes(2, 'big')
@@ -0,0 +1,150 @@
+'''Windowed statistics of the sampled values of a device
+
+When a device samples far more often than Home Assistant needs to
+record, the publishers hold the samples of each window and publish the
+state once per window, with the min, max, mean, stddev and/or last
+value of each sensor over the window added as extra fields (see
+HAStatisticSensor). Short transients still show in the min and max.
+
+The values of a window are kept in an array.array of doubles and are
+summarized in one pass, with numpy when it is installed.
+
+Example
+-------
+aggregator = WindowAggregator(device.sensors, 60.0)
+if aggregator.add(data, time.monotonic()):
+    client.publish_state(device, data)    # with the temperature_mean, ...
+'''
+
+import array
+import math
+from typing import Any, Dict, Sequence
+
+from ha_mqtt_pi_smbus.util import numpy
+
+# the statistics which can be published, in the order they are added
+STATISTICS = ('min', 'max', 'mean', 'stddev', 'last')
+
+
+def summarize(
+    values: Sequence[float], statistics: Sequence[str] = STATISTICS
+) -> Dict[str, float]:
+    '''compute statistics of a window of values
+
+    Parameters
+    ----------
+    values : Sequence[float]
+        the values of the window, an array.array('d') is summarized
+        without copying when numpy is installed
+    statistics : Sequence[str]
+        the names of the statistics, see STATISTICS. Default: all
+
+    Return
+    ------
+    Dict[str, float] : each statistic by name, None for every statistic
+    of an empty window. stddev is the population standard deviation.
+    '''
+    if not len(values):
+        return {name: None for name in statistics}
+    if numpy is not None:
+        if isinstance(values, array.array):
+            window = numpy.frombuffer(values, dtype=numpy.float64)
+        else:
+            window = numpy.asarray(values, dtype=numpy.float64)
+        functions = {
+            'min': window.min,
+            'max': window.max,
+            'mean': window.mean,
+            'stddev': window.std,
+            'last': lambda: window[-1],
+        }
+        return {name: float(functions[name]()) for name in statistics}
+    mean = math.fsum(values) / len(values)
+    functions = {
+        'min': lambda: min(values),
+        'max': lambda: max(values),
+        'mean': lambda: mean,
+        'stddev': lambda: math.sqrt(
+            math.fsum((value - mean) ** 2 for value in values) / len(values)
+        ),
+        'last': lambda: values[-1],
+    }
+    return {name: float(functions[name]()) for name in statistics}
+
+
+class WindowAggregator:
+    '''Collect the samples of a device in tumbling windows
+
+    Parameters
+    ----------
+    sensors : Sequence[HASensor]
+        the sensors of the device, those with statistics are aggregated
+    window : float
+        the length of each window in seconds
+
+    Attributes
+    ----------
+    held : int
+        the number of samples which were held for a later window
+    windows : int
+        the number of windows which were summarized
+
+    Example
+    -------
+    aggregator = WindowAggregator(device.sensors, 60.0)
+    aggregator.add({'temperature': 21.5}, time.monotonic())
+    '''
+
+    def __init__(self, sensors: Sequence[Any], window: float):
+        if window <= 0:
+            raise Exception(f'window ({window}) must be greater than 0')
+        self.window = window
+        self.sensors = [
+            sensor for sensor in sensors if sensor.statistics and not sensor.diagnostic
+        ]
+        self._values = {sensor.state_field: array.array('d') for sensor in self.sensors}
+        self._end = None
+        self.held = 0
+        self.windows = 0
+
+    def add(self, data: Dict[str, Any], now: float) -> bool:
+        '''add a sample to the current window
+
+        When the window has ended, the statistics of each sensor over
+        the window are added to data as <state_field>_<statistic>
+        fields and the window is restarted.
+
+        Parameters
+        ----------
+        data : Dict[str, Any]
+            the sampled data, the statistics are added to it
+        now : float
+            the time.monotonic() time of the sample
+
+        Return
+        ------
+        bool : True if the window ended and data is to be published,
+        False if the sample was held
+        '''
+        if self._end is None:
+            self._end = now + self.window
+        for sensor in self.sensors:
+            value = data.get(sensor.state_field)
+            if isinstance(value, (int, float)):
+                self._values[sensor.state_field].append(value)
+        if now < self._end:
+            self.held += 1
+            return False
+        for sensor in self.sensors:
+            values = self._values[sensor.state_field]
+            for name, value in summarize(values, sensor.statistics).items():
+                data[f'{sensor.state_field}_{name}'] = (
+                    None if value is None else round(value, 3)
+                )
+            del values[:]
+        # the windows stay on a fixed grid unless samples stopped
+        self._end += self.window
+        if self._end <= now:
+            self._end = now + self.window
+        self.windows += 1
+        return True
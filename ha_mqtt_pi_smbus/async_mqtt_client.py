@@ -0,0 +1,828 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Any, Callable, Coroutine, Dict
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import MQTTErrorCode
+
+from ha_mqtt_pi_smbus.config import BasicConfig
+from ha_mqtt_pi_smbus.device import (
+    HADevice,
+    SamplerMetrics,
+    SMBusDevice,
+    next_deadline,
+)
+from ha_mqtt_pi_smbus.metrics import MetricsRegistry
+from ha_mqtt_pi_smbus.mqtt_client import (
+    MQTTClient,
+    Rediscovery,
+    Replay,
+    StateFilter,
+)
+
+
+class AsyncioLoop_Thread(threading.Thread):
+    '''The thread which runs the asyncio event loop shared by every
+    asynchronous client and scheduler in the process
+
+    The loop is started the first time get() is called. Work is handed to
+    it from other threads with submit() and call().
+
+    Example
+    -------
+    loop_thread = AsyncioLoop_Thread.get()
+    future = loop_thread.submit(coroutine())
+    '''
+
+    _instance: AsyncioLoop_Thread = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> AsyncioLoop_Thread:
+        '''Return the running loop thread, starting it if necessary'''
+        with cls._instance_lock:
+            if cls._instance is None or not cls._instance.is_alive():
+                cls._instance = cls()
+                cls._instance.start()
+                cls._instance._started.wait()
+            return cls._instance
+
+    @classmethod
+    def stop_all(cls) -> None:
+        '''Stop the shared loop thread, cancelling everything it runs'''
+        with cls._instance_lock:
+            instance = cls._instance
+            cls._instance = None
+        if instance is not None:
+            instance.stop()
+
+    def __init__(self):
+        super().__init__(name='asyncio', daemon=True)
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+
+    def run(self) -> None:
+        '''the thread execution method, runs the loop until stop()
+
+        Parameters
+        ----------
+        None
+        '''
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        try:
+            self.loop.run_forever()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True)
+            )
+        finally:
+            self.loop.close()
+
+    def in_loop(self) -> bool:
+        '''Return True when called from the loop thread'''
+        return threading.get_ident() == self.ident
+
+    def submit(self, coroutine: Coroutine) -> concurrent.futures.Future:
+        '''Run a coroutine on the loop
+
+        Parameters
+        ----------
+        coroutine : Coroutine
+            the coroutine to run
+
+        Return
+        ------
+        concurrent.futures.Future : the result of the coroutine, cancelling
+        it cancels the coroutine
+        '''
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def call(self, callback: Callable, *args: Any) -> None:
+        '''Call a function on the loop, immediately when already in the
+        loop thread
+
+        Parameters
+        ----------
+        callback : Callable
+            the function to call
+        args : Any
+            the arguments of the function
+        '''
+        if self.in_loop():
+            callback(*args)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def call_and_wait(self, callback: Callable, *args: Any) -> Any:
+        '''Call a function on the loop and wait for its result, the
+        function is called directly when the loop is not running
+
+        Parameters
+        ----------
+        callback : Callable
+            the function to call
+        args : Any
+            the arguments of the function
+
+        Return
+        ------
+        Any : the result of the function
+        '''
+        if self.in_loop() or not self.loop.is_running():
+            return callback(*args)
+        future = concurrent.futures.Future()
+
+        def run_callback():
+            try:
+                future.set_result(callback(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        self.loop.call_soon_threadsafe(run_callback)
+        return future.result()
+
+    def stop(self) -> None:
+        '''Stop the loop and wait for the thread to exit
+
+        Parameters
+        ----------
+        None
+        '''
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join()
+
+
+class AsyncioHelper:
+    '''Drive the socket of a paho client from the asyncio loop
+
+    paho notifies the helper when its socket opens, closes and has data
+    to write, the helper registers the socket with the loop so that
+    loop_read() and loop_write() are called when the socket is ready,
+    and calls loop_misc() every second for the keepalive. This replaces
+    the network thread of paho's loop_start().
+
+    Parameters
+    ----------
+    loop_thread : AsyncioLoop_Thread
+        the thread running the loop
+    client : mqtt.Client
+        the client whose socket is driven
+    on_connection_lost : Callable[[], None]
+        called on the loop when paho closes the socket, e.g. after the
+        broker dropped the connection. Default: None
+    '''
+
+    def __init__(
+        self,
+        loop_thread: AsyncioLoop_Thread,
+        client: mqtt.Client,
+        on_connection_lost: Callable[[], None] = None,
+    ):
+        self.loop_thread = loop_thread
+        self.loop = loop_thread.loop
+        self.client = client
+        self.on_connection_lost = on_connection_lost
+        self.fd = None
+        self.misc = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+        sock = client.socket()
+        if sock is not None:
+            self.on_socket_open(client, None, sock)
+            if client.want_write():
+                self.on_socket_register_write(client, None, sock)
+
+    def on_socket_open(self, client: mqtt.Client, userdata: Any, sock) -> None:
+        self.loop_thread.call(self._open, sock.fileno())
+
+    def on_socket_close(self, client: mqtt.Client, userdata: Any, sock) -> None:
+        self.loop_thread.call(self._lost)
+
+    def on_socket_register_write(
+        self, client: mqtt.Client, userdata: Any, sock
+    ) -> None:
+        self.loop_thread.call(self._add_writer, sock.fileno())
+
+    def on_socket_unregister_write(
+        self, client: mqtt.Client, userdata: Any, sock
+    ) -> None:
+        self.loop_thread.call(self._remove_writer, sock.fileno())
+
+    def close(self) -> None:
+        '''Stop driving the socket and remove the callbacks from the client
+
+        Parameters
+        ----------
+        None
+        '''
+        self.client.on_socket_open = None
+        self.client.on_socket_close = None
+        self.client.on_socket_register_write = None
+        self.client.on_socket_unregister_write = None
+        # wait, so the socket cannot be closed while still registered
+        self.loop_thread.call_and_wait(self._close)
+
+    def _open(self, fd: int) -> None:
+        self._close()
+        self.fd = fd
+        self.loop.add_reader(fd, self.client.loop_read)
+        self.misc = self.loop.create_task(self._misc_loop())
+
+    def _lost(self) -> None:
+        self._close()
+        if self.on_connection_lost is not None:
+            self.on_connection_lost()
+
+    def _close(self) -> None:
+        if self.misc is not None:
+            self.misc.cancel()
+            self.misc = None
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.loop.remove_writer(self.fd)
+            self.fd = None
+
+    def _add_writer(self, fd: int) -> None:
+        # the socket may have been closed by another thread since the
+        # write was registered, e.g. by a disconnect after loop_stop()
+        sock = self.client.socket()
+        if fd == self.fd and sock is not None and sock.fileno() == fd:
+            self.loop.add_writer(fd, self.client.loop_write)
+
+    def _remove_writer(self, fd: int) -> None:
+        if fd == self.fd:
+            self.loop.remove_writer(fd)
+
+    async def _misc_loop(self) -> None:
+        while self.client.loop_misc() == MQTTErrorCode.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class AsyncSMBus_Scheduler:
+    '''Sample any number of SMBusDevices as coroutines on the shared loop
+
+    Each device is sampled by a coroutine on its own drift-free grid.
+    The I2C transfers themselves block, so they run on one worker thread
+    which also serializes all access to the buses. A publisher waits for
+    the samples of a device with wait_for_sample().
+
+    The scheduler has the add_device() and remove_device() of
+    SMBus_Scheduler_Thread, so it may be passed as the scheduler of a
+    device, and devices on any bus may be added.
+
+    Parameters
+    ----------
+    startup_delay : float
+        The number of seconds to wait before the first sample of each
+        device. Default: 10.0
+    loop_thread : AsyncioLoop_Thread
+        The loop on which the devices are sampled. Default: the shared
+        AsyncioLoop_Thread
+    metrics : MetricsRegistry
+        The registry in which the sample counts and durations are kept
+        (see SamplerMetrics). Default: REGISTRY
+
+    Example
+    -------
+    scheduler = AsyncSMBus_Scheduler()
+    bme280 = BME280(bus=1, address=0x76)
+    device = BME280_Device('office', 'office/state', 'Bosch', 'BME280',
+        bme280, 60, scheduler=scheduler)
+    client = AsyncMQTTClient('bme280', device, bme280, config,
+        scheduler=scheduler)
+    '''
+
+    def __init__(
+        self,
+        startup_delay: float = 10.0,
+        loop_thread: AsyncioLoop_Thread = None,
+        metrics: MetricsRegistry = None,
+    ):
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.startup_delay = startup_delay
+        self.loop_thread = loop_thread or AsyncioLoop_Thread.get()
+        self.metrics = SamplerMetrics(metrics)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='SMBus'
+        )
+        self._condition = asyncio.Condition()
+        self._tasks: Dict[int, concurrent.futures.Future] = {}
+        self._missed: Dict[int, int] = {}
+
+    @property
+    def missed_deadlines(self) -> int:
+        '''the total number of deadlines missed by all the devices'''
+        return sum(self._missed.values())
+
+    def add_device(self, smbus_device: SMBusDevice, polling_interval: float) -> None:
+        '''add a device to the schedule
+
+        Parameters
+        ----------
+        smbus_device : SMBusDevice
+            the device to be sampled
+        polling_interval : float
+            the interval in seconds between samples of the device
+        '''
+        if polling_interval <= 0:
+            raise Exception(
+                f'polling_interval ({polling_interval}) must be greater than 0'
+            )
+        self.remove_device(smbus_device)
+        self._missed[id(smbus_device)] = 0
+        self._tasks[id(smbus_device)] = self.loop_thread.submit(
+            self._sample(smbus_device, polling_interval)
+        )
+
+    def remove_device(self, smbus_device: SMBusDevice) -> None:
+        '''remove a device from the schedule
+
+        Parameters
+        ----------
+        smbus_device : SMBusDevice
+            the device which is no longer to be sampled
+        '''
+        task = self._tasks.pop(id(smbus_device), None)
+        if task is not None:
+            task.cancel()
+
+    def stop(self) -> None:
+        '''stop sampling every device
+
+        Parameters
+        ----------
+        None
+        '''
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._executor.shutdown(wait=False)
+
+    async def wait_for_sample(self, smbus_device: SMBusDevice, sequence: int) -> int:
+        '''wait until the device has a sample newer than sequence
+
+        Parameters
+        ----------
+        smbus_device : SMBusDevice
+            a device added to the scheduler
+        sequence : int
+            the sequence number of the last sample seen by the caller
+
+        Return
+        ------
+        int : the sequence number of the newest sample
+        '''
+        async with self._condition:
+            await self._condition.wait_for(lambda: smbus_device.sequence != sequence)
+            return smbus_device.sequence
+
+    async def _sample(self, smbus_device: SMBusDevice, polling_interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(self.startup_delay)
+        deadline = loop.time()
+        while True:
+            try:
+                await loop.run_in_executor(
+                    self._executor, self.metrics.sample, smbus_device
+                )
+            except Exception:
+                self.__logger.exception('sampling %s failed', smbus_device)
+            else:
+                smbus_device.notify_sample()
+                async with self._condition:
+                    self._condition.notify_all()
+            deadline, missed = next_deadline(deadline, polling_interval, loop.time())
+            if missed:
+                self._missed[id(smbus_device)] += missed
+                self.metrics.missed_deadlines(smbus_device, missed)
+                self.__logger.debug(
+                    '%s missed %s deadline(s)', smbus_device, missed
+                )
+            await asyncio.sleep(deadline - loop.time())
+
+
+class AsyncMQTT_Publisher(StateFilter):
+    '''The coroutine which publishes the state of a device each time the
+    scheduler samples it
+
+    Parameters
+    ----------
+    client : AsyncMQTTClient
+        the client used to publish
+    device : HADevice
+        the description of the data to be published
+    smbus_device : SMBusDevice
+        the device which contains the data to be sent
+    scheduler : AsyncSMBus_Scheduler
+        the scheduler sampling the smbus_device
+
+    Attributes
+    ----------
+    future : concurrent.futures.Future
+        the coroutine running on the loop, None until it is submitted
+    '''
+
+    def __init__(
+        self,
+        client: AsyncMQTTClient,
+        device: HADevice,
+        smbus_device: SMBusDevice,
+        scheduler: AsyncSMBus_Scheduler,
+    ):
+        self.client = client
+        self.device = device
+        self.smbus_device = smbus_device
+        self.scheduler = scheduler
+        self.data = self.smbus_device.getdata()
+        self.sequence = 0
+        self.future = None
+
+    async def run(self) -> None:
+        '''publish each sample which passes should_publish() until
+        cancelled
+
+        Parameters
+        ----------
+        None
+        '''
+        while True:
+            self.sequence = await self.scheduler.wait_for_sample(
+                self.smbus_device, self.sequence
+            )
+            self.data = self.smbus_device.getdata()
+            self.device.record_history(self.data)
+            self.data['state'] = 'OK'
+            now = time.monotonic()
+            if not self.aggregate(self.data, now):
+                continue
+            if not self.should_publish(self.data, now):
+                self.record_suppressed()
+                continue
+            self.client.publish_state(self.device, self.data)
+            self.record_published(self.data, now)
+
+
+class AsyncMQTT_Rediscovery(Rediscovery):
+    '''The coroutine which announces every device of a client again when
+    Home Assistant comes online, see Rediscovery
+
+    Parameters
+    ----------
+    client : AsyncMQTTClient
+        the client whose devices are announced
+
+    Attributes
+    ----------
+    future : concurrent.futures.Future
+        the coroutine running on the loop, None until it is submitted
+    '''
+
+    def __init__(self, client: AsyncMQTTClient):
+        self.plan(client)
+        self.future = None
+
+    async def run(self) -> None:
+        '''announce the devices until done or cancelled
+
+        Parameters
+        ----------
+        None
+        '''
+        for entry in self.entries:
+            await asyncio.sleep(self.next_delay())
+            self.announce(entry)
+
+
+class AsyncMQTT_Replay(Replay):
+    '''The coroutine which publishes the messages kept in the store of a
+    client once it has reconnected, see Replay
+
+    Parameters
+    ----------
+    client : AsyncMQTTClient
+        the client whose store is replayed
+
+    Attributes
+    ----------
+    future : concurrent.futures.Future
+        the coroutine running on the loop, None until it is submitted
+    '''
+
+    def __init__(self, client: AsyncMQTTClient):
+        self.plan(client)
+        self.future = None
+
+    async def run(self) -> None:
+        '''publish the stored messages until done or cancelled
+
+        Parameters
+        ----------
+        None
+        '''
+        while True:
+            await asyncio.sleep(self.bucket.take())
+            if not self.replay_next():
+                return
+
+
+class AsyncMQTTClient(MQTTClient):
+    '''a MQTTClient whose network traffic, sampling and publishing all run
+    on the shared asyncio loop
+
+    The public methods are those of MQTTClient and may be called from any
+    thread. loop_start() attaches the client's socket to the loop instead
+    of starting a network thread, and the state is published by a
+    coroutine instead of a MQTT_Publisher_Thread, so any number of clients
+    share the loop thread and the scheduler's I2C worker thread.
+
+    Parameters
+    ----------
+    client_prefix : str
+        a name prefix which is used to build a unique connection to MQTT
+    device : HADevice
+        the device containing the description of the data to be sent
+    smbus_device : SMBusDevice
+        the physical device instance from which data is obtained, it
+        must be added to the scheduler, as must those of the devices
+        added with add_device()
+    config : Config
+        the configuration, see MQTTClient
+    scheduler : AsyncSMBus_Scheduler
+        the scheduler sampling the smbus_device
+    metrics : MetricsRegistry
+        the registry in which the client's metrics are kept, see
+        MQTTClient. Default: REGISTRY
+
+    Attributes
+    ----------
+    helper : AsyncioHelper
+        drives the client's socket, None until loop_start()
+    publisher : AsyncMQTT_Publisher
+        publishes the state of device, None while not discovered
+    reconnect_min_delay : float
+        the seconds before the first attempt to reconnect after the
+        connection was lost, doubled after each failed attempt
+    reconnect_max_delay : float
+        the most seconds between attempts to reconnect
+    '''
+
+    # the defaults of paho's reconnect_delay_set()
+    reconnect_min_delay: float = 1.0
+    reconnect_max_delay: float = 120.0
+
+    def __init__(
+        self,
+        client_prefix: str,
+        device: HADevice,
+        smbus_device: SMBusDevice,
+        config: BasicConfig = None,
+        scheduler: AsyncSMBus_Scheduler = None,
+        metrics: MetricsRegistry = None,
+    ):
+        super().__init__(client_prefix, device, smbus_device, config, metrics)
+        if scheduler is None:
+            raise Exception('scheduler cannot be None')
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.scheduler = scheduler
+        self.loop_thread = scheduler.loop_thread
+        self.helper = None
+        self._diagnostics_future = None
+        self._flush_future = None
+        # True from connect_mqtt() until disconnect(), while a lost
+        # connection is re-established
+        self._connection_wanted = False
+        self._reconnect_future = None
+
+    def connect_mqtt(self) -> int:
+        '''Initiate a connection to the MQTT broker, see
+        MQTTClient.connect_mqtt()
+
+        The connection is re-established whenever it is lost, until
+        disconnect() is called.
+        '''
+        self._connection_wanted = True
+        return super().connect_mqtt()
+
+    def disconnect(self, *args, **kwargs) -> MQTTErrorCode:
+        '''disconnect from the MQTT broker and stop reconnecting, see
+        MQTTClient.disconnect()'''
+        self._connection_wanted = False
+        if self._reconnect_future is not None:
+            self._reconnect_future.cancel()
+            self._reconnect_future = None
+        return super().disconnect(*args, **kwargs)
+
+    def loop_start(self) -> MQTTErrorCode:
+        '''Attach the client's socket to the asyncio loop
+
+        Unlike paho's loop_start() it may be called more than once.
+        '''
+        if self.helper is None:
+            self.helper = AsyncioHelper(
+                self.loop_thread, self, on_connection_lost=self._connection_lost
+            )
+        return MQTTErrorCode.MQTT_ERR_SUCCESS
+
+    def _connection_lost(self) -> None:
+        '''start reconnecting, as paho's loop_start() would, unless the
+        client was disconnected on purpose'''
+        if not self._connection_wanted:
+            return
+        if self._reconnect_future is not None and not self._reconnect_future.done():
+            return
+        self.__logger.warning('connection to the broker lost, reconnecting')
+        self._reconnect_future = self.loop_thread.submit(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        '''reconnect with an exponential backoff until connected or
+        disconnect() is called
+
+        paho's reconnect() blocks while the socket connects, so it runs
+        in the loop's executor. The new socket is attached to the loop
+        by the helper's on_socket_open(), and on_connect() starts the
+        replay of the store.
+        '''
+        delay = self.reconnect_min_delay
+        while self._connection_wanted:
+            await asyncio.sleep(delay)
+            if not self._connection_wanted:
+                return
+            try:
+                rc = await asyncio.get_running_loop().run_in_executor(
+                    None, self.reconnect
+                )
+                if rc == MQTTErrorCode.MQTT_ERR_SUCCESS:
+                    return
+                self.__logger.warning('reconnect failed: %s', rc)
+            except OSError as e:
+                self.__logger.warning('reconnect failed: %s', e)
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    def loop_stop(self) -> MQTTErrorCode:
+        '''Detach the client's socket from the asyncio loop'''
+        if self.helper is not None:
+            self.helper.close()
+            self.helper = None
+        return MQTTErrorCode.MQTT_ERR_SUCCESS
+
+    def disconnect_mqtt(self) -> int:
+        '''disconnect from the MQTT broker
+
+        While the socket is attached to the loop, the disconnection runs
+        on the loop so that the socket is removed from the loop before
+        paho closes it.
+        '''
+        if self.helper is None:
+            return super().disconnect_mqtt()
+        return self.loop_thread.call_and_wait(super().disconnect_mqtt)
+
+    @property
+    def publisher(self) -> AsyncMQTT_Publisher | None:
+        '''the publisher of device, None while it is not discovered'''
+        return self.publisher_thread
+
+    def _start_publisher(self, entry: MQTTClient.Entry) -> None:
+        '''start the coroutine publishing the state of the device of the
+        entry'''
+        entry.publisher = AsyncMQTT_Publisher(
+            self, entry.device, entry.smbus_device, self.scheduler
+        )
+        entry.publisher.future = self.loop_thread.submit(entry.publisher.run())
+
+    def _stop_publisher(self, entry: MQTTClient.Entry) -> None:
+        '''cancel the coroutine publishing the state of the device of the
+        entry'''
+        entry.publisher.future.cancel()
+        entry.publisher = None
+
+    def start_replay(self) -> None:
+        '''Publish the messages kept in the store from a coroutine, as
+        the client has connected, see MQTTClient.start_replay()
+
+        Parameters
+        ----------
+        None
+        '''
+        self.stop_replay()
+        if self.store is None or not len(self.store):
+            return
+        self.replay = AsyncMQTT_Replay(self)
+        self.replay.future = self.loop_thread.submit(self.replay.run())
+
+    def stop_replay(self) -> None:
+        '''Stop publishing the stored messages, if a replay is running
+
+        Parameters
+        ----------
+        None
+        '''
+        if self.replay is not None:
+            self.replay.stopped = True
+            self.replay.future.cancel()
+
+    def start_rediscovery(self) -> None:
+        '''Announce every device again from a coroutine, as Home Assistant
+        has come online, see MQTTClient.start_rediscovery()
+
+        Parameters
+        ----------
+        None
+        '''
+        self.stop_rediscovery()
+        self.rediscovery = AsyncMQTT_Rediscovery(self)
+        self.rediscovery.future = self.loop_thread.submit(self.rediscovery.run())
+
+    def stop_rediscovery(self) -> None:
+        '''Stop announcing the devices, if a rediscovery is running
+
+        Parameters
+        ----------
+        None
+        '''
+        if self.rediscovery is not None:
+            self.rediscovery.future.cancel()
+
+    def start_diagnostics(self) -> None:
+        '''Start publishing the diagnostics every diagnostics_interval
+        seconds from a coroutine, unless they are already being published
+        or the interval is 0
+
+        Parameters
+        ----------
+        None
+        '''
+        if not self.diagnostics_interval or self._diagnostics_future is not None:
+            return
+        self._diagnostics_future = self.loop_thread.submit(self._diagnostics())
+
+    def stop_diagnostics(self) -> None:
+        '''Stop publishing the diagnostics periodically
+
+        Parameters
+        ----------
+        None
+        '''
+        if self._diagnostics_future is not None:
+            self._diagnostics_future.cancel()
+            self._diagnostics_future = None
+
+    def start_flush(self) -> None:
+        '''Start flushing the states every flush_interval seconds from a
+        coroutine, see MQTTClient.start_flush()
+
+        Parameters
+        ----------
+        None
+        '''
+        if self.coalescer is None or self._flush_future is not None:
+            return
+        self._flush_future = self.loop_thread.submit(self._flush())
+
+    def stop_flush(self) -> None:
+        '''Stop flushing the states, those not yet flushed are dropped
+
+        Parameters
+        ----------
+        None
+        '''
+        if self._flush_future is not None:
+            self._flush_future.cancel()
+            self._flush_future = None
+            self.coalescer.take()
+
+    async def _flush(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            deadline, _ = next_deadline(deadline, self.flush_interval, loop.time())
+            await asyncio.sleep(deadline - loop.time())
+            try:
+                self.flush_states()
+            except Exception:
+                self.__logger.exception('flushing the states failed')
+
+    async def _diagnostics(self) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            deadline, _ = next_deadline(
+                deadline, self.diagnostics_interval, loop.time()
+            )
+            await asyncio.sleep(deadline - loop.time())
+            try:
+                self.publish_diagnostics()
+            except Exception:
+                self.__logger.exception('publishing diagnostics failed')
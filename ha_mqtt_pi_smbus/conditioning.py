@@ -0,0 +1,229 @@
+'''Reduce a burst of reads of a device to one conditioned value per field
+
+A device configured with a burst reads its registers several times per
+sample (see SMBusDevice.set_conditioning()). A Conditioner reduces the
+reads of each field to the single value which is published:
+
+median
+    the median of the burst, which ignores a minority of glitched reads
+ema
+    the mean of the burst smoothed with an exponential moving average
+    across samples, value = alpha * mean + (1 - alpha) * previous value
+hampel
+    the mean of the burst after each read further than threshold scaled
+    median absolute deviations from the median is replaced by the
+    median, which rejects single-read spikes while keeping the noise
+    reduction of the mean
+
+The burst is filtered in one pass, with numpy when it is installed.
+
+Example
+-------
+conditioner = Conditioner('hampel', threshold=3.0)
+conditioner(array.array('d', [21.50, 21.52, 85.0, 21.49]))    # 21.505
+'''
+
+import array
+import math
+import statistics
+import time
+from typing import Dict, Sequence
+
+from ha_mqtt_pi_smbus.metrics import REGISTRY, MetricsRegistry
+from ha_mqtt_pi_smbus.util import numpy
+
+FILTERS = ('median', 'ema', 'hampel')
+
+# scales the median absolute deviation to the standard deviation of
+# normally distributed values
+MAD_SCALE = 1.4826
+
+
+def _vector(values: Sequence[float]):
+    '''a numpy view of an array.array('d'), or a numpy copy of values'''
+    if isinstance(values, array.array) and values.typecode == 'd':
+        return numpy.frombuffer(values, dtype=numpy.float64)
+    return numpy.asarray(values, dtype=numpy.float64)
+
+
+def median(values: Sequence[float]) -> float:
+    '''return the median of a burst
+
+    Parameters
+    ----------
+    values : Sequence[float]
+        the reads of the burst, at least one
+    '''
+    if numpy is not None:
+        return float(numpy.median(_vector(values)))
+    return float(statistics.median(values))
+
+
+def hampel(values: Sequence[float], threshold: float = 3.0) -> tuple[float, int]:
+    '''return the mean of a burst after replacing its outliers
+
+    A read is an outlier when it differs from the median of the burst
+    by more than threshold * MAD_SCALE * the median absolute deviation.
+
+    Parameters
+    ----------
+    values : Sequence[float]
+        the reads of the burst, at least one
+    threshold : float
+        the number of scaled deviations beyond which a read is an
+        outlier. Default: 3.0
+
+    Return
+    ------
+    tuple[float, int] : the mean and the number of outliers replaced
+    '''
+    if numpy is not None:
+        window = _vector(values)
+        middle = numpy.median(window)
+        deviations = numpy.abs(window - middle)
+        limit = threshold * MAD_SCALE * numpy.median(deviations)
+        outliers = deviations > limit
+        return (
+            float(numpy.where(outliers, middle, window).mean()),
+            int(outliers.sum()),
+        )
+    middle = statistics.median(values)
+    deviations = [abs(value - middle) for value in values]
+    limit = threshold * MAD_SCALE * statistics.median(deviations)
+    cleaned = [
+        middle if deviation > limit else value
+        for value, deviation in zip(values, deviations)
+    ]
+    outliers = sum(1 for deviation in deviations if deviation > limit)
+    return math.fsum(cleaned) / len(cleaned), outliers
+
+
+class Conditioner:
+    '''Reduce the burst of reads of one field of a device to one value
+
+    Parameters
+    ----------
+    filter : str
+        'median', 'ema' or 'hampel', see the module. Default: 'median'
+    alpha : float
+        the weight of the latest burst for 'ema', from 0 (exclusive) to
+        1. Default: 0.3
+    threshold : float
+        the outlier threshold for 'hampel'. Default: 3.0
+
+    Attributes
+    ----------
+    outliers : int
+        the number of reads which 'hampel' rejected
+    value : float
+        the latest value, None before the first burst
+
+    Example
+    -------
+    conditioners = {'temperature': Conditioner('ema', alpha=0.2)}
+    '''
+
+    def __init__(
+        self, filter: str = 'median', alpha: float = 0.3, threshold: float = 3.0
+    ):
+        if filter not in FILTERS:
+            raise Exception(f'filter ({filter}) must be one of {", ".join(FILTERS)}')
+        if not 0 < alpha <= 1:
+            raise Exception(f'alpha ({alpha}) must be greater than 0 and at most 1')
+        if threshold <= 0:
+            raise Exception(f'threshold ({threshold}) must be greater than 0')
+        self.filter = filter
+        self.alpha = alpha
+        self.threshold = threshold
+        self.outliers = 0
+        self.value = None
+
+    def __call__(self, values: Sequence[float]) -> float:
+        '''return the conditioned value of a burst
+
+        Parameters
+        ----------
+        values : Sequence[float]
+            the reads of the burst, at least one
+        '''
+        if self.filter == 'median':
+            self.value = median(values)
+        elif self.filter == 'hampel':
+            self.value, outliers = hampel(values, self.threshold)
+            self.outliers += outliers
+        else:
+            if numpy is not None:
+                mean = float(_vector(values).mean())
+            else:
+                mean = math.fsum(values) / len(values)
+            if self.value is None:
+                self.value = mean
+            else:
+                self.value += self.alpha * (mean - self.value)
+        return self.value
+
+
+class ConditioningMetrics:
+    '''The metrics recorded by the conditioning of SMBusDevices
+
+    Each field is labelled with the bus and address of its device.
+
+    Parameters
+    ----------
+    metrics : MetricsRegistry
+        the registry in which the metrics are kept. Default: REGISTRY
+    '''
+
+    def __init__(self, metrics: MetricsRegistry = None):
+        metrics = metrics or REGISTRY
+        labelnames = ('bus', 'address', 'field')
+        self.duration = metrics.histogram(
+            'smbus_filter_seconds', 'the time taken to filter a burst', labelnames
+        )
+        self.outliers = metrics.counter(
+            'smbus_filter_outliers_total', 'reads rejected as outliers', labelnames
+        )
+        self.reads = metrics.counter(
+            'smbus_burst_reads_total', 'reads taken in bursts', ('bus', 'address')
+        )
+
+    def condition(
+        self,
+        smbus_device,
+        columns: Dict[str, Sequence[float]],
+        conditioners: Dict[str, Conditioner],
+    ) -> Dict[str, float]:
+        '''reduce each column of a burst, recording the time taken
+
+        A field without a conditioner takes its latest read.
+
+        Parameters
+        ----------
+        smbus_device : SMBusDevice
+            the device which was read
+        columns : Dict[str, Sequence[float]]
+            the reads of each field
+        conditioners : Dict[str, Conditioner]
+            the conditioner of each field
+
+        Return
+        ------
+        Dict[str, float] : the value of each field
+        '''
+        labels = {'bus': smbus_device.bus, 'address': hex(smbus_device.address)}
+        values = {}
+        for field, column in columns.items():
+            conditioner = conditioners.get(field)
+            if conditioner is None:
+                values[field] = column[-1]
+                continue
+            outliers = conditioner.outliers
+            start = time.perf_counter()
+            values[field] = conditioner(column)
+            self.duration.observe(time.perf_counter() - start, field=field, **labels)
+            if conditioner.outliers != outliers:
+                self.outliers.inc(
+                    conditioner.outliers - outliers, field=field, **labels
+                )
+        self.reads.inc(len(next(iter(columns.values()), ())), **labels)
+        return values
@@ -103,6 +103,21 @@ class MqttConfig(WebConfig):
     auto_discover: bool = True
     expire_after: int = 120
     status_topic: str = 'homeassistant'
+    asyncio: bool = False
+    diagnostics_interval: float = 300
+    publish_summary_interval: float = 300
+    rediscovery_rate: float = 10
+    rediscovery_burst: int = 5
+    rediscovery_jitter: float = 1.0
+    max_inflight: int = 20
+    max_queued: int = 100
+    queue_policy: str = 'coalesce'
+    store_path: str = None
+    store_max_bytes: int = 16777216
+    replay_rate: float = 20
+    replay_burst: int = 100
+    flush_interval: float = 0
+    serializer: str = 'auto'
 
     def clone(self):
         config = MqttConfig()
@@ -117,6 +132,21 @@ class MqttConfig(WebConfig):
         config.auto_discover = self.auto_discover
         config.expire_after = self.expire_after
         config.status_topic = self.status_topic
+        config.asyncio = self.asyncio
+        config.diagnostics_interval = self.diagnostics_interval
+        config.publish_summary_interval = self.publish_summary_interval
+        config.rediscovery_rate = self.rediscovery_rate
+        config.rediscovery_burst = self.rediscovery_burst
+        config.rediscovery_jitter = self.rediscovery_jitter
+        config.max_inflight = self.max_inflight
+        config.max_queued = self.max_queued
+        config.queue_policy = self.queue_policy
+        config.store_path = self.store_path
+        config.store_max_bytes = self.store_max_bytes
+        config.replay_rate = self.replay_rate
+        config.replay_burst = self.replay_burst
+        config.flush_interval = self.flush_interval
+        config.serializer = self.serializer
         return config    
 
     def sanitize(self):
@@ -1,17 +1,72 @@
+import array
 import datetime
-from importlib.metadata import version, PackageNotFoundError
+import heapq
+import itertools
 import json
 import logging
 import threading
 import time
-from typing import Any, Dict, Sequence
+from typing import Any, Callable, Dict, Sequence
 
-from smbus2 import SMBus
+from smbus2 import SMBus, i2c_msg
 
-from ha_mqtt_pi_smbus.environ import get_cpu_info, get_os_info, get_object_id
+from ha_mqtt_pi_smbus.environ import (
+    PACKAGE_VERSION,
+    get_cpu_info,
+    get_os_info,
+    get_object_id,
+)
+from ha_mqtt_pi_smbus.aggregation import STATISTICS
+from ha_mqtt_pi_smbus.conditioning import Conditioner, ConditioningMetrics
+from ha_mqtt_pi_smbus.history import History
+from ha_mqtt_pi_smbus.metrics import REGISTRY, MetricsRegistry
 
+I2C_SMBUS_BLOCK_MAX = 32
 
-class HASensor:
+
+class CachedPayloads:
+    '''Cache for encoded MQTT payloads which are invalidated whenever an
+    attribute of the object is assigned.
+
+    Note
+    ----
+    Assigning an attribute invalidates the cache automatically. Code
+    which modifies a payload dict in place (for instance
+    sensor.discovery_payload['name'] = 'x') after a payload has been
+    encoded must call invalidate().
+    '''
+
+    _generation: int = 0
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_generation', self._generation + 1)
+
+    def invalidate(self) -> None:
+        '''discard all the cached payloads
+
+        Parameters
+        ----------
+        None
+        '''
+        object.__setattr__(self, '_generation', self._generation + 1)
+
+    def _cache_key(self) -> Any:
+        return self._generation
+
+    def _cached(self, name: str, build: Callable[[], Any]) -> Any:
+        '''return the cached payload called name, building it with
+        build() if it is missing or stale'''
+        cache = self.__dict__.setdefault('_payload_cache', {})
+        key = self._cache_key()
+        entry = cache.get(name)
+        if entry is None or entry[0] != key:
+            entry = (key, build())
+            cache[name] = entry
+        return entry[1]
+
+
+class HASensor(CachedPayloads):
     '''Definition for a Home Assistant discoverable sensor
 
         Parameters
@@ -36,6 +91,23 @@ class HASensor:
         expire_after : int
             The expiry in seconds for a sensor before it is marked unavailable
             by MQTT. Default: 120
+        deadband : float
+            The state of the device is only republished for this sensor
+            when its value differs from the last published value by more
+            than deadband. Default: 0.0, any change is published
+        max_silence : float
+            The maximum number of seconds between publications of the
+            device state, even when no value has changed. Default: half
+            of expire_after, so that Home Assistant never expires the
+            sensor
+        history : int
+            The number of sampled values of the sensor kept in its
+            History, see HADevice.record_history(). Default: 0, none are
+            kept
+        statistics : Sequence[str]
+            The statistics of the sensor (see aggregation.STATISTICS)
+            published as HAStatisticSensors when the HADevice has a
+            statistics_window. Default: (), none
     :
         Note
         ----
@@ -92,7 +164,16 @@ class HASensor:
         basename: str = 'homeassistant',
         device_class: str = None,
         expire_after: int = 120,
+        deadband: float = 0.0,
+        max_silence: float = None,
+        history: int = 0,
+        statistics: Sequence[str] = (),
     ):
+        for statistic in statistics:
+            if statistic not in STATISTICS:
+                raise Exception(
+                    f'statistic ({statistic}) must be one of {", ".join(STATISTICS)}'
+                )
         self.diagnostic = False
         self.name = name
         if self.name is None:
@@ -102,6 +183,14 @@ class HASensor:
         if self.device_class is None:
             self.device_class = type(self).__name__.lower()
         self.unique_id = f'{name}_{device_class}'
+        self.state_field = self.device_class
+        self.expire_after = expire_after
+        self.deadband = deadband
+        if max_silence is None and expire_after:
+            max_silence = expire_after / 2
+        self.max_silence = max_silence
+        self.history = History(history) if history else None
+        self.statistics = tuple(statistics)
         self.availability = self.Availability()
         self.availability.topic = f'{basename}/{name}/availability'
         self.undiscovery_payload = {'platform': 'sensor'}
@@ -115,14 +204,101 @@ class HASensor:
             'availability': self.availability.__dict__,
         }
 
+    def changed(self, old: Any, new: Any) -> bool:
+        '''Return True if the value of the sensor changed enough to be
+        published
+
+        Numeric values must differ by more than the deadband, any other
+        values must simply differ.
+
+        Parameters
+        ----------
+        old : Any
+            the last published value
+        new : Any
+            the latest sampled value
+        '''
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+            return abs(new - old) > self.deadband
+        return old != new
+
     def json_payload(self) -> str:
         '''Return the discovery_payload as a json string
 
+        The string is built once and cached until the sensor changes.
+
         Parameters
         ----------
         None
         '''
-        return json.dumps(self.discovery_payload, default=vars)
+        return self._cached(
+            'json_payload', lambda: json.dumps(self.discovery_payload, default=vars)
+        )
+
+    def availability_json(self, available: bool = True) -> bytes:
+        '''Return the encoded availability message for the sensor
+
+        Parameters
+        ----------
+        available : bool
+            True for the available payload, False for the unavailable
+            payload. Default: True
+        '''
+        if available:
+            return self._cached(
+                'available',
+                lambda: json.dumps(
+                    {'availability': self.availability.payload_available}
+                ).encode('utf-8'),
+            )
+        return self._cached(
+            'not_available',
+            lambda: json.dumps(
+                {'availability': self.availability.payload_not_available}
+            ).encode('utf-8'),
+        )
+
+
+class HAStatisticSensor(HASensor):
+    '''Definition for a Home Assistant sensor of a statistic of another
+    sensor over the statistics_window of its HADevice, see
+    aggregation.WindowAggregator
+
+    Parameters
+    ----------
+    sensor : HASensor
+        the sensor whose values are summarized
+    statistic : str
+        the statistic, one of aggregation.STATISTICS
+
+    Example
+    -------
+    HAStatisticSensor(Temperature('kitchen'), 'max')
+    # published from value_json.temperature_max
+    '''
+
+    def __init__(self, sensor: HASensor, statistic: str):
+        super().__init__(
+            sensor.discovery_payload['unit_of_measurement'],
+            name=sensor.name,
+            basename=sensor.basename,
+            device_class=sensor.device_class,
+            expire_after=sensor.expire_after,
+            statistics=(statistic,),
+        )
+        self.statistic = statistic
+        self.statistics = ()
+        self.unique_id = f'{sensor.unique_id}_{statistic}'
+        self.state_field = f'{sensor.state_field}_{statistic}'
+        # the value is published once per window, which the heartbeat
+        # of the source sensor already covers
+        self.max_silence = None
+        self.discovery_payload['unique_id'] = self.unique_id
+        self.discovery_payload['name'] = f'{sensor.device_class} {statistic}'
+        self.discovery_payload['state_class'] = 'measurement'
+        self.discovery_payload['value_template'] = (
+            f'{{{{ value_json.{self.state_field} }}}}'
+        )
 
 
 class HADiagnosticSensor(HASensor):
@@ -274,7 +450,7 @@ class HADiagnosticLastRestart(HADiagnosticSensor):
         self.discovery_payload['value_template'] = '{{ value_json.last_restart }}'
 
 
-class HADevice:
+class HADevice(CachedPayloads):
     '''Definition for a Home Assistant device with discoverable sensors
 
     This device with its sensors defines that data that is used to see
@@ -308,6 +484,16 @@ class HADevice:
     qos : int
         The Quality of Service for the messages for the device. It must
         be 0, 1, or 2. See MQTT documentation for details. Default: 0
+    object_id : str
+        The id in the discovery topic of the device. Each device served
+        by one MQTTClient needs its own, e.g. f'{get_object_id()}_office'.
+        Default: None, the serial number of the host
+    statistics_window : float
+        The seconds over which the samples are aggregated. The state is
+        then published once per window, with an HAStatisticSensor for
+        each of the statistics of each sensor. It must be shorter than
+        the expire_after of the sensors. Default: None, every sample is
+        published as it is
 
     Note
     ----
@@ -315,6 +501,10 @@ class HADevice:
     subclass must override the getdata() method in order to retrieve data
     from the physical device.
 
+    The encoded discovery and undiscovery payloads are built once and
+    reused until an attribute of the device or one of its sensors is
+    assigned (see CachedPayloads).
+
     Example
     -------
     import logging
@@ -375,8 +565,8 @@ class HADevice:
         serial_number: str  # 'ea334450945afc'
         sw_version: str  # '1.0'
 
-    device = Device()
-    origin = Origin()
+    device: Device
+    origin: Origin
     state_topic: str
     qos: int
     components: Sequence[HASensor]
@@ -392,12 +582,24 @@ class HADevice:
         base_name: str = 'homeassistant',
         support_url: str = None,  #'http://www.example.com',
         qos: int = 0,
+        object_id: str = None,
+        statistics_window: float = None,
     ):
-        try:
-            __version__ = version('ha_mqtt_pi_smbus')
-        except PackageNotFoundError:
-            __version__ = '0.0.0'
         basename = base_name
+        if statistics_window:
+            for sensor in sensors:
+                if sensor.expire_after and statistics_window >= sensor.expire_after:
+                    raise Exception(
+                        f'statistics_window ({statistics_window}) must be less'
+                        f' than the expire_after ({sensor.expire_after}) of'
+                        f' {sensor.unique_id}'
+                    )
+            sensors = sensors + [
+                HAStatisticSensor(sensor, statistic)
+                for sensor in sensors
+                for statistic in sensor.statistics
+            ]
+        self.statistics_window = statistics_window or None
         self.diagnosticSensors = [
             HADiagnosticStatus(name),
             HADiagnosticTemperature(name),
@@ -406,8 +608,11 @@ class HADevice:
             HADiagnosticLastRestart(name),
         ]
         self.sensors = sensors + self.diagnosticSensors
+        # each device has its own, so that several can share a process
+        self.device = HADevice.Device()
+        self.origin = HADevice.Origin()
         self.origin.name = 'HA MQTT Pi'
-        self.origin.sw_version = __version__
+        self.origin.sw_version = PACKAGE_VERSION
         self.origin.support_url = 'http://www.example.com'
         cpuinfo = get_cpu_info()
         self.device.hw_version = cpuinfo['cpu']['Model']
@@ -443,16 +648,385 @@ class HADevice:
             'state_topic': self.state_topic,
             'qos': self.qos,
         }
-        self.discovery_topic = f'{basename}/device/{self.device.serial_number}/config'
+        self.object_id = object_id or self.device.serial_number
+        self.discovery_topic = f'{basename}/device/{self.object_id}/config'
         self.state_topic = state_topic
         self.config_topic = 'device/config'
 
+    @property
+    def diagnostics_topic(self) -> str | None:
+        '''the topic shared by the diagnostic sensors of the device, None
+        if the device has none'''
+        for sensor in self.sensors:
+            if sensor.diagnostic:
+                return sensor.discovery_payload['state_topic']
+        return None
+
+    def _cache_key(self) -> Any:
+        return (self._generation, tuple(s._generation for s in self.sensors))
+
+    def discovery_json(self) -> bytes:
+        '''Return the encoded discovery payload for the device
+
+        Parameters
+        ----------
+        None
+        '''
+        return self._cached(
+            'discovery',
+            lambda: json.dumps(self.discovery_payload).encode('utf-8'),
+        )
+
+    def undiscovery_json(self) -> bytes:
+        '''Return the encoded payload which removes the device's sensors
+        from Home Assistant
+
+        Parameters
+        ----------
+        None
+        '''
+        return self._cached(
+            'undiscovery',
+            lambda: json.dumps(self.undiscovery_payload1).encode('utf-8'),
+        )
+
+    def record_history(self, data: Dict[str, Any], timestamp_ns: int = None) -> None:
+        '''append the sampled value of each sensor with a History to it
+
+        Parameters
+        ----------
+        data : Dict[str, Any]
+            the sampled data, as returned by getdata()
+        timestamp_ns : int
+            the time of the sample in nanoseconds since the epoch.
+            Default: None, time.time_ns()
+        '''
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        for sensor in self.sensors:
+            if sensor.history is None:
+                continue
+            value = data.get(sensor.state_field)
+            if isinstance(value, (int, float)):
+                sensor.history.append(value, timestamp_ns)
+
     def getdata(self) -> Dict[str, Any]:
         raise Exception(
             f'Class {self.__class__.__module}.{self.__class__.__name__} needs getdata(self) definition'
         )
 
 
+class SMBusRegister:
+    '''Definition of a named register (or multi-byte register group) of an
+    SMBus device
+
+    Parameters
+    ----------
+    name : str
+        The name of the value held in the register
+    address : int
+        The address of the first byte of the register
+    length : int
+        The number of bytes in the register. Default: 1
+    signed : bool
+        True if the value is a two's complement signed integer.
+        Default: False
+    byteorder : str
+        'little' or 'big', the order of the bytes of a multi-byte
+        register. Default: 'little'
+    shift : int
+        The number of bits the value is shifted right after decoding,
+        for registers whose value is left aligned. Default: 0
+
+    Example
+    -------
+    # BME280 20-bit pressure ADC value in 0xF7 (msb), 0xF8, 0xF9 (xlsb)
+    SMBusRegister('pressure', 0xF7, 3, byteorder='big', shift=4)
+    '''
+
+    def __init__(
+        self,
+        name: str,
+        address: int,
+        length: int = 1,
+        signed: bool = False,
+        byteorder: str = 'little',
+        shift: int = 0,
+    ):
+        self.name = name
+        self.address = address
+        self.length = length
+        self.signed = signed
+        self.byteorder = byteorder
+        self.shift = shift
+
+    def decode(self, data: Sequence[int]) -> int:
+        '''decode the value of the register from its bytes
+
+        Parameters
+        ----------
+        data : Sequence[int]
+            the length bytes of the register
+        '''
+        return (
+            int.from_bytes(bytes(data), self.byteorder, signed=self.signed)
+            >> self.shift
+        )
+
+
+class SMBusRegisterMap:
+    '''Definition of a set of registers which are read together
+
+    The registers are coalesced into contiguous spans so that the whole
+    map can be read with as few bus transactions as possible (see
+    SMBusDevice.read_registers()).
+
+    Parameters
+    ----------
+    registers : Sequence[SMBusRegister]
+        The registers in the map
+    max_gap : int
+        Registers separated by up to max_gap unused bytes are read in one
+        span, the unused bytes are discarded. Default: 2
+
+    Example
+    -------
+    MEASUREMENT = SMBusRegisterMap([
+        SMBusRegister('pressure', 0xF7, 3, byteorder='big', shift=4),
+        SMBusRegister('temperature', 0xFA, 3, byteorder='big', shift=4),
+        SMBusRegister('humidity', 0xFD, 2, byteorder='big'),
+    ])
+    MEASUREMENT.spans    # [(0xF7, 8)]
+    '''
+
+    def __init__(self, registers: Sequence[SMBusRegister], max_gap: int = 2):
+        self.registers = sorted(registers, key=lambda r: r.address)
+        self.spans: list[tuple[int, int]] = []
+        for register in self.registers:
+            end = register.address + register.length
+            if self.spans:
+                start, length = self.spans[-1]
+                if register.address <= start + length + max_gap:
+                    self.spans[-1] = (start, max(length, end - start))
+                    continue
+            self.spans.append((register.address, register.length))
+
+    def decode(self, blocks: Sequence[Sequence[int]]) -> Dict[str, int]:
+        '''decode the registers from the bytes read for each span
+
+        Parameters
+        ----------
+        blocks : Sequence[Sequence[int]]
+            the bytes read for each of the spans, in order
+        '''
+        values = {}
+        spans = iter(zip(self.spans, blocks))
+        (start, length), block = next(spans)
+        for register in self.registers:
+            while register.address >= start + length:
+                (start, length), block = next(spans)
+            offset = register.address - start
+            values[register.name] = register.decode(
+                block[offset : offset + register.length]
+            )
+        return values
+
+
+class SharedSMBus:
+    '''A process-wide handle for one SMBus (I2C) bus.
+
+    Every SMBusDevice on the same bus number shares one SharedSMBus, and
+    therefore one open SMBus file handle. Each SMBus method called
+    through the handle (read_byte_data, write_byte_data,
+    read_i2c_block_data, ...) runs while holding the bus lock, so
+    transactions from different threads are serialized without holding
+    the lock for longer than a single transaction.
+
+    The bus is opened with smbus2.SMBus unless another backend is set
+    with set_backend(), e.g. the SMBusSimulator of
+    ha_mqtt_pi_smbus.simulator.
+
+    Parameters
+    ----------
+    bus : int
+        The number of the SMBus (I2C) bus (1 or 2).
+
+    Note
+    ----
+    Use SharedSMBus.get(bus) rather than constructing the class
+    directly, so that a single instance exists for each bus.
+
+    Example
+    -------
+    smbus = SharedSMBus.get(1)
+    with smbus.lock:
+        smbus.write_byte_data(0x76, 0xF4, 0x25)
+        block = smbus.read_i2c_block_data(0x76, 0xF7, 8)
+    '''
+
+    _buses: Dict[int, 'SharedSMBus'] = {}
+    _buses_lock = threading.Lock()
+    backend: Callable[[int], Any] = None
+
+    def __init__(self, bus: int):
+        self.bus = bus
+        self.lock = threading.RLock()
+        self._smbus = (SharedSMBus.backend or SMBus)(bus)
+
+    @classmethod
+    def set_backend(cls, backend: Callable[[int], Any] | None) -> None:
+        '''open buses with backend(bus) rather than smbus2.SMBus(bus)
+
+        Every open bus is closed, so the new backend is used by the
+        devices created afterwards.
+
+        Parameters
+        ----------
+        backend : Callable[[int], Any] | None
+            returns an object with the methods of smbus2.SMBus for a bus
+            number, None restores smbus2.SMBus
+        '''
+        cls.close_all()
+        cls.backend = backend
+
+    @classmethod
+    def get(cls, bus: int) -> 'SharedSMBus':
+        '''return the shared handle for the bus, opening it if necessary
+
+        Parameters
+        ----------
+        bus : int
+            The number of the SMBus (I2C) bus (1 or 2).
+        '''
+        with cls._buses_lock:
+            shared = cls._buses.get(bus)
+            if shared is None:
+                shared = cls(bus)
+                cls._buses[bus] = shared
+            return shared
+
+    @classmethod
+    def close_all(cls) -> None:
+        '''close every shared bus handle and forget them
+
+        Parameters
+        ----------
+        None
+        '''
+        with cls._buses_lock:
+            for shared in cls._buses.values():
+                shared._smbus.close()
+            cls._buses.clear()
+
+    def __getattr__(self, name: str) -> Any:
+        if name == '_smbus':
+            raise AttributeError(name)
+        attr = getattr(self._smbus, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+
+        setattr(self, name, locked)
+        return locked
+
+    def __str__(self) -> str:
+        return f'bus: {self.bus}'
+
+
+class Reading:
+    '''An immutable sample of an SMBusDevice
+
+    sample() builds a new Reading and swaps it into the device with a
+    single assignment, so a thread calling getdata() sees either the
+    whole of the previous sample or the whole of the new one, without
+    copying and without a lock. Subclasses add the values of the device
+    to __slots__.
+
+    Parameters
+    ----------
+    last_update : datetime.datetime
+        the time of the sample
+    values
+        a keyword argument for each of the names in the __slots__ of
+        the subclasses
+
+    Example
+    -------
+    class BME280Reading(Reading):
+        __slots__ = ('temperature', 'pressure', 'humidity')
+
+    reading = BME280Reading(
+        last_update=datetime.datetime.now(),
+        temperature=21.5, pressure=1013.2, humidity=40.1)
+    reading.temperature = 22.0    # raises AttributeError
+    reading = reading.replace(temperature=22.0)
+    '''
+
+    __slots__ = ('last_update',)
+    fields: tuple[str, ...] = ('last_update',)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = cls.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        cls.fields = cls.fields + tuple(slots)
+
+    def __init__(self, **values):
+        for name in self.fields:
+            if name not in values:
+                raise TypeError(
+                    f'{self.__class__.__name__} missing the value of {name}'
+                )
+            object.__setattr__(self, name, values.pop(name))
+        if values:
+            raise TypeError(f'{self.__class__.__name__} has no {", ".join(values)}')
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __hash__(self) -> int:
+        return hash(tuple(self.values().items()))
+
+    def __repr__(self) -> str:
+        values = ', '.join(f'{name}={value!r}' for name, value in self.values().items())
+        return f'{self.__class__.__name__}({values})'
+
+    def values(self) -> Dict[str, Any]:
+        '''return the values of the reading by name
+
+        Return
+        ------
+        Dict[str, Any] : the values, in the order of fields
+        '''
+        return {name: getattr(self, name) for name in self.fields}
+
+    def replace(self, **changes) -> 'Reading':
+        '''return a copy of the reading with some of its values changed
+
+        Parameters
+        ----------
+        changes
+            the new value of each of the names to be changed
+
+        Return
+        ------
+        Reading : the new reading, of the same class
+        '''
+        return self.__class__(**{**self.values(), **changes})
+
+
 # class SMBusDevice(SMBus):
 class SMBusDevice:
     '''Definition for a physical SMBus device.
@@ -472,44 +1046,64 @@ class SMBusDevice:
     order to sample the device data adn return the data to the
     application, respectively.
 
+    The _smbus handle is the SharedSMBus for the bus, so all the devices
+    on one bus share a single SMBus and their transactions are
+    serialized. Drivers should prefer read_block() and read_registers(),
+    which fetch a whole range of registers in one transaction.
+
+    The sampled values are held in an immutable Reading, which sample()
+    replaces as a whole, so getdata() needs neither a lock nor a copy.
+    Subclasses with values of their own define a Reading subclass and
+    set reading in __init__() and sample().
+
+    A device configured with set_conditioning() takes a burst of reads
+    per sample with read_burst() and reduces them to one value per
+    field with condition(), see ha_mqtt_pi_smbus.conditioning.
+
+    Consumers block in wait_for_sample() until the producer (normally
+    SMBusDevice_Sampler_Thread) calls notify_sample() after a sample()
+    completes. Each notification increments the device sequence number.
+
     Example
     -------
     import datetime
     import bme280
     from smbus2 import SMBus
 
-    class BME280(SMBusDevice):
-        last_update = datetime.datetime.now()
-        temperature:float = -32.0 * 5.0 / 9.0
-        pressure:float = 0.0
-        humidity:float = 0.0
+    class BME280Reading(Reading):
+        __slots__ = ('temperature', 'pressure', 'humidity')
 
+    class BME280(SMBusDevice):
         def __init(self, bus:int = 1, address:int = 0x76):
             super().__init__(bus)
             self.bus = bus
             self.address = address
             self._calibration_params =
                 bme280.load_calibration_params(self, self.address)
+            self.reading = BME280Reading(
+                last_update=datetime.datetime.now(),
+                temperature=-32.0 * 5.0 / 9.0, pressure=0.0, humidity=0.0)
 
         def sample(self) -> None:
-            super().sample()
             data = bme280.sample(
                 self, self.address, self._calibration_params)
-            last_update = datetime.datetime.now()
-            self.temperature = data.temperature
-            self.pressure = data.pressure
-            self.humidity = data.humidity
+            self.reading = BME280Reading(
+                last_update=datetime.datetime.now(),
+                temperature=data.temperature,
+                pressure=data.pressure,
+                humidity=data.humidity)
 
         def getdata(self) -> Dict[str, Any]:
+            reading = self.reading
             return {
-                'last_update': self.last_update.strftime('%m/%d/%Y %H:%M:%S'),
+                'last_update': reading.last_update.strftime('%m/%d/%Y %H:%M:%S'),
                 'bus': self.bus,
                 'address': self.address,
-                'temperature': round(self.temperature, 1),
+                'temperature': round(reading.temperature, 1),
                 'temperature_units': f'{chr(176)}C',
-                'pressure': round(self.pressure, 1),
+                'pressure': round(reading.pressure, 1),
                 'pressure_units': 'mbar',
-                'humidity': round(self.humidity, 1),
+                'humidity': round(reading.humidity, 1),
                 'humidity_units': '%',
                 }
 
@@ -518,23 +1112,237 @@ class SMBusDevice:
     def __init__(self, bus: int = 1, address: int = 0x76):
         self.bus = bus
         self.address = address
-        self._smbus = SMBus(bus)
+        self._smbus = SharedSMBus.get(bus)
+        self.reading = Reading(last_update=datetime.datetime.now())
+        self.sequence = 0
+        self.sample_condition = threading.Condition()
+        self.burst = 1
+        self.conditioners: Dict[str, Conditioner] = {}
+        self.conditioning_metrics = None
+
+    @property
+    def last_update(self) -> datetime.datetime:
+        '''the time of the current reading'''
+        return self.reading.last_update
+
+    @last_update.setter
+    def last_update(self, value: datetime.datetime) -> None:
+        self.reading = self.reading.replace(last_update=value)
+
+    def read_block(self, register: int, length: int) -> list[int]:
+        '''read a range of consecutive registers in one bus transaction
+
+        Up to 32 bytes are read with read_i2c_block_data, longer ranges
+        with a combined write/read i2c_rdwr transaction.
+
+        Parameters
+        ----------
+        register : int
+            the address of the first register
+        length : int
+            the number of bytes to read
+
+        Return
+        ------
+        list[int] : the bytes read
+        '''
+        if length <= I2C_SMBUS_BLOCK_MAX:
+            return self._smbus.read_i2c_block_data(self.address, register, length)
+        return self._read_spans([(register, length)])[0]
+
+    def read_registers(self, register_map: SMBusRegisterMap) -> Dict[str, int]:
+        '''read and decode every register in a register map
+
+        A map with a single span of up to 32 bytes is read with
+        read_i2c_block_data. Otherwise all the spans are read in a single
+        combined i2c_rdwr transaction (a register write followed by a
+        repeated-start read for each span), so the bus lock is taken
+        only once.
+
+        Parameters
+        ----------
+        register_map : SMBusRegisterMap
+            the registers to be read
+
+        Return
+        ------
+        Dict[str, int] : the decoded value of each register by name
+
+        Example
+        -------
+        values = bme.read_registers(MEASUREMENT)
+        values['temperature']
+        '''
+        spans = register_map.spans
+        if len(spans) == 1:
+            blocks = [self.read_block(*spans[0])]
+        else:
+            blocks = self._read_spans(spans)
+        return register_map.decode(blocks)
+
+    def _read_spans(self, spans: Sequence[tuple[int, int]]) -> list[list[int]]:
+        messages = []
+        reads = []
+        for register, length in spans:
+            read = i2c_msg.read(self.address, length)
+            messages.append(i2c_msg.write(self.address, [register]))
+            messages.append(read)
+            reads.append(read)
+        self._smbus.i2c_rdwr(*messages)
+        return [list(read) for read in reads]
+
+    def set_conditioning(
+        self,
+        burst: int = 1,
+        conditioners: Dict[str, Conditioner] = None,
+        metrics: MetricsRegistry = None,
+    ) -> None:
+        '''configure the reads taken per sample and their filtering
+
+        Parameters
+        ----------
+        burst : int
+            the number of reads per sample. Default: 1
+        conditioners : Dict[str, Conditioner]
+            the conditioner of each field, fields without one take their
+            latest read. Default: None
+        metrics : MetricsRegistry
+            the registry in which the time taken by the conditioners and
+            the outliers they reject are kept (see ConditioningMetrics).
+            Default: REGISTRY
+
+        Example
+        -------
+        bme280.set_conditioning(5, {'temperature': Conditioner('hampel')})
+        '''
+        if burst < 1:
+            raise Exception(f'burst ({burst}) must be at least 1')
+        self.burst = burst
+        self.conditioners = dict(conditioners or {})
+        self.conditioning_metrics = ConditioningMetrics(metrics)
+
+    def read_burst(
+        self, read: Callable[[], Dict[str, float]]
+    ) -> Dict[str, array.array]:
+        '''call read() burst times, collecting the values of each field
+
+        Parameters
+        ----------
+        read : Callable[[], Dict[str, float]]
+            takes one read of the device, returning the value of each
+            field
+
+        Return
+        ------
+        Dict[str, array.array] : the reads of each field, as doubles
+        '''
+        columns: Dict[str, array.array] = {}
+        for _ in range(self.burst):
+            for field, value in read().items():
+                columns.setdefault(field, array.array('d')).append(value)
+        return columns
+
+    def condition(self, columns: Dict[str, Sequence[float]]) -> Dict[str, float]:
+        '''reduce the reads of each field to one value
+
+        Parameters
+        ----------
+        columns : Dict[str, Sequence[float]]
+            the reads of each field, see read_burst()
+
+        Return
+        ------
+        Dict[str, float] : the conditioned value of each field, or the
+        latest read of a field without a conditioner
+        '''
+        if self.conditioning_metrics is None:
+            return {field: column[-1] for field, column in columns.items()}
+        return self.conditioning_metrics.condition(self, columns, self.conditioners)
 
     # Override this method
     def sample(self) -> None:
-        '''sample device, save the data in the object's 'data' variable
+        '''sample device, swap the data into the object's reading
+
+        Parameters
+        ----------
+        None
+
+        Example
+        -------
+
+        bme = BME280()
+        bme.sample()
+        '''
+        self.reading = self.reading.replace(last_update=datetime.datetime.now())
+
+    def notify_sample(self) -> int:
+        '''announce that a new sample is available to any waiting consumer
+
+        The sequence number of the device is incremented and all threads
+        blocked in wait_for_sample() are woken.
 
         Parameters
         ----------
         None
 
+        Return
+        ------
+        int : the new sequence number
+
         Example
         -------
 
         bme = BME280()
         bme.sample()
+        bme.notify_sample()
         '''
-        self.last_update = datetime.datetime.now()
+        with self.sample_condition:
+            self.sequence += 1
+            self.sample_condition.notify_all()
+            return self.sequence
+
+    def wait_for_sample(
+        self,
+        sequence: int,
+        timeout: float = None,
+        stop: Callable[[], bool] = None,
+    ) -> int:
+        '''block until a sample newer than sequence is available
+
+        Parameters
+        ----------
+        sequence : int
+            the sequence number of the last sample seen by the caller
+        timeout : float
+            the maximum number of seconds to wait, None waits forever.
+            Default: None
+        stop : Callable[[], bool]
+            an optional predicate which ends the wait early when it
+            returns True. It is re-evaluated whenever wake() is called.
+            Default: None
+
+        Return
+        ------
+        int : the current sequence number, which is unchanged if the wait
+        timed out or was stopped
+        '''
+        with self.sample_condition:
+            self.sample_condition.wait_for(
+                lambda: self.sequence != sequence or (stop is not None and stop()),
+                timeout,
+            )
+            return self.sequence
+
+    def wake(self) -> None:
+        '''wake all threads blocked in wait_for_sample() so they can
+        re-evaluate their stop predicate
+
+        Parameters
+        ----------
+        None
+        '''
+        with self.sample_condition:
+            self.sample_condition.notify_all()
 
     # Override this method return any desired data stored
     # in the 'data' variable as a dict
@@ -565,7 +1373,7 @@ class SMBusDevice:
         data = bme.getdata()
         '''
         return {
-            'last_update': self.last_update.strftime('%m/%d/%Y %H:%M:%S'),
+            'last_update': self.reading.last_update.strftime('%m/%d/%Y %H:%M:%S'),
             'bus': self.bus,
             'address': self.address,
         }
@@ -579,16 +1387,137 @@ class SMBusDevice:
         return f'bus: {self.bus}, address: {self.address}'
 
 
+def next_deadline(deadline: float, interval: float, now: float) -> tuple[float, int]:
+    '''compute the next sampling deadline on a fixed, drift-free grid
+
+    Deadlines advance by exactly one interval from the previous deadline
+    rather than from the time a sample finished, so the duration of
+    sample() never accumulates as drift. Deadlines which have already
+    passed are skipped rather than sampled in a burst.
+
+    Parameters
+    ----------
+    deadline : float
+        the previous deadline, in time.monotonic() seconds
+    interval : float
+        the polling interval in seconds
+    now : float
+        the current time.monotonic() value
+
+    Return
+    ------
+    tuple[float, int] : the next deadline and the number of deadlines
+    which were missed
+    '''
+    deadline += interval
+    if deadline >= now:
+        return deadline, 0
+    missed = int((now - deadline) // interval) + 1
+    return deadline + missed * interval, missed
+
+
+class SamplerMetrics:
+    '''The metrics recorded by the samplers of SMBusDevices
+
+    Each device is labelled with its bus and address.
+
+    Parameters
+    ----------
+    metrics : MetricsRegistry
+        the registry in which the metrics are kept. Default: REGISTRY
+
+    Example
+    -------
+    sampler_metrics = SamplerMetrics()
+    sampler_metrics.sample(smbus_device)
+    '''
+
+    def __init__(self, metrics: MetricsRegistry = None):
+        metrics = metrics or REGISTRY
+        labelnames = ('bus', 'address')
+        self.samples = metrics.counter(
+            'smbus_samples_total', 'samples taken from the device', labelnames
+        )
+        self.failures = metrics.counter(
+            'smbus_sample_failures_total',
+            'samples which raised an exception',
+            labelnames,
+        )
+        self.duration = metrics.histogram(
+            'smbus_sample_seconds', 'the time taken by sample()', labelnames
+        )
+        self.missed = metrics.counter(
+            'smbus_missed_deadlines_total',
+            'sampling deadlines skipped because a sample ran long',
+            labelnames,
+        )
+
+    def sample(self, smbus_device: SMBusDevice) -> None:
+        '''sample() the device, recording the time taken or the failure
+
+        Parameters
+        ----------
+        smbus_device : SMBusDevice
+            the device to be sampled
+        '''
+        start = time.monotonic()
+        try:
+            smbus_device.sample()
+        except Exception:
+            self.failures.inc(bus=smbus_device.bus, address=hex(smbus_device.address))
+            raise
+        self.duration.observe(
+            time.monotonic() - start,
+            bus=smbus_device.bus,
+            address=hex(smbus_device.address),
+        )
+        self.samples.inc(bus=smbus_device.bus, address=hex(smbus_device.address))
+
+    def missed_deadlines(self, smbus_device: SMBusDevice, missed: int) -> None:
+        '''count deadlines which the device missed
+
+        Parameters
+        ----------
+        smbus_device : SMBusDevice
+            the device which was sampled late
+        missed : int
+            the number of deadlines missed
+        '''
+        if missed:
+            self.missed.inc(
+                missed, bus=smbus_device.bus, address=hex(smbus_device.address)
+            )
+
+
 class SMBusDevice_Sampler_Thread(threading.Thread):
-    def __init__(self, smbus_device: SMBusDevice, polling_interval: int):
+    def __init__(
+        self,
+        smbus_device: SMBusDevice,
+        polling_interval: float,
+        startup_delay: float = 10.0,
+        metrics: MetricsRegistry = None,
+    ):
         '''Definition of a sampler thread for an SMBusDevice
 
         Parameters
         ----------
         smbus_device : SMBusDevice
             The SMBusDevice which is going to be sampled
-        polling_interval : in
-            The interval at which polling is to take place
+        polling_interval : float
+            The interval in seconds at which polling is to take place.
+            Fractional intervals (e.g. 0.05) are supported.
+        startup_delay : float
+            The number of seconds to wait before the first sample.
+            Default: 10.0
+        metrics : MetricsRegistry
+            The registry in which the sample counts and durations are
+            kept (see SamplerMetrics). Default: REGISTRY
+
+        Attributes
+        ----------
+        missed_deadlines : int
+            the number of sampling deadlines which were skipped because
+            sample() took longer than the polling interval
 
         Note
         ----
@@ -599,22 +1528,57 @@ class SMBusDevice_Sampler_Thread(threading.Thread):
         -------
         class BME280_Device(HASensor)
             def __init__(self, name:str, smbus_device: SMBusDevice,
-                    polling_interval:int)
+                    polling_interval:float)
                 super().__init((Temperature(name), Pressure(name), Humidity(name)))
                 self.smbus_device = smbus_device
                 self.sampler_thread = SMBusDevice_Sampler_Thread(
-                    logger, smbus_device, polling_interval)
+                    smbus_device, polling_interval, startup_delay=1.0)
                 self.sampler_thread.start()
         '''
         super().__init__(name='SMBusDevice', daemon=True)
+        if polling_interval <= 0:
+            raise Exception(
+                f'polling_interval ({polling_interval}) must be greater than 0'
+            )
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self._stop_event = threading.Event()
         self.smbus_device = smbus_device
         self.polling_interval = polling_interval
+        self.startup_delay = startup_delay
+        self.missed_deadlines = 0
+        self.metrics = SamplerMetrics(metrics)
         self.do_run = True
 
+    @property
+    def do_run(self) -> bool:
+        '''the execution flag, setting it to False wakes the thread and
+        causes the run() method to exit'''
+        return not self._stop_event.is_set()
+
+    @do_run.setter
+    def do_run(self, value: bool) -> None:
+        if value:
+            self._stop_event.clear()
+        else:
+            self._stop_event.set()
+
+    def clear_do_run(self) -> None:
+        '''the run() routine's do_run flag is cleared
+
+        Parameters
+        ----------
+        None
+        '''
+        self.do_run = False
+
     def run(self) -> None:
         '''the thread execution method
 
+        Samples are taken on a time.monotonic() grid anchored at the end
+        of the startup delay, so the schedule does not drift with the
+        duration of each sample. Deadlines missed because a sample ran
+        long are counted in missed_deadlines and skipped.
+
         Parameters
         ----------
         None
@@ -626,11 +1590,204 @@ class SMBusDevice_Sampler_Thread(threading.Thread):
         when the thread is started with the thread.start() method.
         (See class example, above.)
         '''
-        time.sleep(10)  # Wait for startup to get device data out sooner.
+        if self._stop_event.wait(self.startup_delay):
+            return
+        deadline = time.monotonic()
+        while self.do_run:
+            self.metrics.sample(self.smbus_device)
+            self.smbus_device.notify_sample()
+            deadline, missed = next_deadline(
+                deadline, self.polling_interval, time.monotonic()
+            )
+            if missed:
+                self.missed_deadlines += missed
+                self.metrics.missed_deadlines(self.smbus_device, missed)
+                self.__logger.debug(
+                    'missed %s deadline(s), %s in total',
+                    missed,
+                    self.missed_deadlines,
+                )
+            if self._stop_event.wait(deadline - time.monotonic()):
+                return
+
+
+class SMBus_Scheduler_Thread(threading.Thread):
+    '''A single thread which samples every SMBusDevice on one bus
+
+    Rather than one SMBusDevice_Sampler_Thread per device, any number of
+    devices on the same bus can be added to one scheduler, each with its
+    own polling interval. Deadlines for all the devices are kept in one
+    heap and the devices are sampled in deadline order, so their polling
+    periods interleave on the bus and a single thread serves them all.
+
+    Parameters
+    ----------
+    bus : int
+        The number of the SMBus (I2C) bus (1 or 2). Default: 1
+    startup_delay : float
+        The number of seconds to wait before the first samples.
+        Default: 10.0
+    metrics : MetricsRegistry
+        The registry in which the sample counts and durations are kept
+        (see SamplerMetrics). Default: REGISTRY
+
+    Example
+    -------
+    scheduler = SMBus_Scheduler_Thread(1)
+    for address, name in ((0x76, 'office'), (0x77, 'garage')):
+        bme280 = BME280(bus=1, address=address)
+        devices.append(BME280_Device(name, f'{name}/state', 'Bosch',
+            'BME280', bme280, 60, scheduler=scheduler))
+    scheduler.start()
+    '''
+
+    class Entry:
+        '''The schedule of one device
+
+        Parameters
+        ----------
+        smbus_device : SMBusDevice
+            the device which is sampled
+        polling_interval : float
+            the interval in seconds between samples
+        '''
+
+        def __init__(self, smbus_device: SMBusDevice, polling_interval: float):
+            self.smbus_device = smbus_device
+            self.polling_interval = polling_interval
+            self.missed_deadlines = 0
+            self.removed = False
+
+    def __init__(
+        self, bus: int = 1, startup_delay: float = 10.0, metrics: MetricsRegistry = None
+    ):
+        super().__init__(name=f'SMBus-{bus}', daemon=True)
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.bus = bus
+        self.startup_delay = startup_delay
+        self.metrics = SamplerMetrics(metrics)
+        self._condition = threading.Condition()
+        self._do_run = True
+        self._sampling = False
+        self._entries: Dict[int, SMBus_Scheduler_Thread.Entry] = {}
+        self._schedule: list = []
+        self._order = itertools.count()
+
+    @property
+    def do_run(self) -> bool:
+        '''the execution flag, setting it to False wakes the thread and
+        causes the run() method to exit'''
+        return self._do_run
+
+    @do_run.setter
+    def do_run(self, value: bool) -> None:
+        with self._condition:
+            self._do_run = value
+            self._condition.notify_all()
+
+    def clear_do_run(self) -> None:
+        '''the run() routine's do_run flag is cleared
+
+        Parameters
+        ----------
+        None
+        '''
+        self.do_run = False
+
+    @property
+    def missed_deadlines(self) -> int:
+        '''the total number of deadlines missed by all the devices'''
+        with self._condition:
+            return sum(e.missed_deadlines for e in self._entries.values())
+
+    def add_device(self, smbus_device: SMBusDevice, polling_interval: float) -> None:
+        '''add a device to the schedule
+
+        Parameters
+        ----------
+        smbus_device : SMBusDevice
+            the device to be sampled, it must be on the scheduler's bus
+        polling_interval : float
+            the interval in seconds between samples of the device
+        '''
+        if smbus_device.bus != self.bus:
+            raise Exception(
+                f'device on bus {smbus_device.bus} cannot be added to the '
+                + f'scheduler for bus {self.bus}'
+            )
+        if polling_interval <= 0:
+            raise Exception(
+                f'polling_interval ({polling_interval}) must be greater than 0'
+            )
+        entry = SMBus_Scheduler_Thread.Entry(smbus_device, polling_interval)
+        with self._condition:
+            self.remove_device(smbus_device)
+            self._entries[id(smbus_device)] = entry
+            if self._sampling:
+                self._push(time.monotonic(), entry)
+                self._condition.notify_all()
+
+    def remove_device(self, smbus_device: SMBusDevice) -> None:
+        '''remove a device from the schedule
+
+        Parameters
+        ----------
+        smbus_device : SMBusDevice
+            the device which is no longer to be sampled
+        '''
+        with self._condition:
+            entry = self._entries.pop(id(smbus_device), None)
+            if entry is not None:
+                entry.removed = True
+
+    def _push(self, deadline: float, entry: 'SMBus_Scheduler_Thread.Entry') -> None:
+        heapq.heappush(self._schedule, (deadline, next(self._order), entry))
+
+    def _next_due(self) -> tuple[float, 'SMBus_Scheduler_Thread.Entry'] | None:
+        '''wait for the earliest deadline, None if the thread is stopped'''
+        with self._condition:
+            while self._do_run:
+                while self._schedule and self._schedule[0][2].removed:
+                    heapq.heappop(self._schedule)
+                if not self._schedule:
+                    self._condition.wait()
+                    continue
+                timeout = self._schedule[0][0] - time.monotonic()
+                if timeout <= 0:
+                    deadline, _, entry = heapq.heappop(self._schedule)
+                    return deadline, entry
+                self._condition.wait(timeout)
+            return None
+
+    def run(self) -> None:
+        '''the thread execution method
+
+        Parameters
+        ----------
+        None
+        '''
+        with self._condition:
+            if self._condition.wait_for(lambda: not self._do_run, self.startup_delay):
+                return
+            start = time.monotonic()
+            for entry in self._entries.values():
+                self._push(start, entry)
+            self._sampling = True
         while True:
-            for i in range(self.polling_interval):
-                if not self.do_run:
-                    return
-                if i == 0:
-                    self.smbus_device.sample()
-                time.sleep(1)
+            due = self._next_due()
+            if due is None:
+                return
+            deadline, entry = due
+            try:
+                self.metrics.sample(entry.smbus_device)
+                entry.smbus_device.notify_sample()
+            except Exception:
+                self.__logger.exception('sampling %s failed', entry.smbus_device)
+            deadline, missed = next_deadline(
+                deadline, entry.polling_interval, time.monotonic()
+            )
+            self.metrics.missed_deadlines(entry.smbus_device, missed)
+            with self._condition:
+                entry.missed_deadlines += missed
+                if not entry.removed:
+                    self._push(deadline, entry)
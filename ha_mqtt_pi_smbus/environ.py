@@ -1,20 +1,76 @@
+import datetime
 import importlib
 import logging
+import os
 import pathlib
 import re
 import subprocess
+import threading
 import tomllib
-from typing import Any, Dict
+from typing import Any, Callable, Dict
 
 DEGREE = chr(176)
 
+# the sysfs directory containing an entry for each network interface
+SYS_CLASS_NET = '/sys/class/net'
+
+# the interfaces whose MAC address identifies the system, in order
+PRIMARY_INTERFACES = ('eth0', 'wlan0')
+
+MAC_ADDRESS_PATTERN = re.compile(r'^[0-9a-f]{2}(:[0-9a-f]{2}){5}$')
+
+# the system identity, resolved once per process, see refresh_identity()
+_identity: Dict[str, Any] = {}
+_identity_lock = threading.Lock()
+
 import ha_mqtt_pi_smbus
 from ha_mqtt_pi_smbus.util import readfile, get_command_data
 
 
+def _cached_identity(name: str, lookup: Callable[[], Any]) -> Any:
+    '''return an identity value, looking it up on first use
+
+    A value of None is not cached, so a lookup which failed is retried on
+    the next call.
+    '''
+    with _identity_lock:
+        if name not in _identity:
+            value = lookup()
+            if value is None:
+                return None
+            _identity[name] = value
+        return _identity[name]
+
+
+def refresh_identity() -> None:
+    '''discard the cached system identity
+
+    The CPU info and MAC address are read once per process, after a
+    refresh they are read again on their next use.
+
+    Parameters
+    ----------
+    None
+
+    Example
+    ------
+    >>> from environ import get_object_id, refresh_identity
+    >>> refresh_identity()
+    >>> print(f'The object id is {get_object_id()}')
+    The object id is b827ebc1f24d
+    >>>
+    '''
+    with _identity_lock:
+        _identity.clear()
+
+
 def get_cpu_info() -> Dict[str, Any]:
     '''get Raspberry Pi CPU info
 
+    /proc/cpuinfo is read once per process, the same dict is returned by
+    later calls until refresh_identity() is called, so it must not be
+    modified.
+
         Parameters
         ----------
         None
@@ -48,6 +104,20 @@ def get_cpu_info() -> Dict[str, Any]:
     'CPU variant': '0x0', 'CPU part': '0xd03', 'CPU revision': 4}}}
         >>>
     '''
+    return _cached_identity('cpu_info', read_cpu_info)
+
+
+def read_cpu_info() -> Dict[str, Any]:
+    '''read and parse /proc/cpuinfo, see get_cpu_info()
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        a dict value representing the information read from /proc/cpuinfo
+    '''
     info = {}
     content = readfile('/proc/cpuinfo')
     groups = content.split('\n\n')
@@ -132,9 +202,58 @@ def get_os_info() -> Dict[str, Any]:
     return info
 
 
+def get_sysfs_mac_address(interface) -> str:
+    '''get the Mac address of the specified interface from sysfs
+
+    Parameters
+    ----------
+    interface : str
+        a str containing the name of the interface
+
+    Returns
+    -------
+    a str containing the Mac address read from
+    /sys/class/net/<interface>/address, or None if the interface does not
+    exist or has no usable address (such as the all-zero address of the
+    loopback interface)
+    '''
+    try:
+        mac = str(readfile(os.path.join(SYS_CLASS_NET, interface, 'address')))
+    except OSError:
+        return None
+    mac = mac.strip().lower()
+    if not MAC_ADDRESS_PATTERN.match(mac) or mac == '00:00:00:00:00:00':
+        return None
+    return mac
+
+
+def get_ifconfig_mac_address(interface) -> str:
+    '''get the Mac address of the specified interface from ifconfig
+
+    Parameters
+    ----------
+    interface : str
+        a str containing the name of the interface
+
+    Returns
+    -------
+    a str containing the Mac address reported by ifconfig, or None
+    '''
+    output = get_command_data(['ifconfig', interface])
+    if output is None:
+        return None
+    for line in output.splitlines():
+        if 'ether' in line:
+            mac_address = line.split()[1]
+            return mac_address
+
+
 def get_mac_address_by_interface(interface) -> str:
     '''get the Mac address of the specified interface
 
+    The address is read from sysfs, ifconfig is only run when sysfs
+    does not have it.
+
     Parameters
     ----------
     interface : str
@@ -153,20 +272,48 @@ def get_mac_address_by_interface(interface) -> str:
     The Mac address for wlan0 is b8:27:eb:94:a7:18
     >>>
     '''
-    output = get_command_data(['ifconfig', interface])
-    if output is None:
-        return None
-    for line in output.splitlines():
-        if 'ether' in line:
-            mac_address = line.split()[1]
-            return mac_address
+    mac = get_sysfs_mac_address(interface)
+    if mac is not None:
+        return mac
+    return get_ifconfig_mac_address(interface)
+
+
+def find_mac_address() -> str:
+    '''find the 'primary' Mac address of the system, see get_mac_address()
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    a str containing the Mac address, or None
+    '''
+    interfaces = list(PRIMARY_INTERFACES)
+    if os.path.isdir(SYS_CLASS_NET):
+        interfaces += sorted(
+            i for i in os.listdir(SYS_CLASS_NET) if i not in PRIMARY_INTERFACES
+        )
+    for interface in interfaces:
+        mac = get_sysfs_mac_address(interface)
+        if mac is not None:
+            return mac
+    # no sysfs, fall back to forking ifconfig
+    for interface in PRIMARY_INTERFACES:
+        mac = get_ifconfig_mac_address(interface)
+        if mac is not None:
+            return mac
+    return None
 
 
 def get_mac_address() -> str:
     '''get the 'primary' iac address of the Raspberry pi
 
     The Mac address for eth0 is returned, if no eth0, then for wlan0,
-    if no wlan0, then None is returned
+    if no wlan0, then for the first other interface with an address. If
+    none can be found None is returned. The addresses are read from
+    /sys/class/net, ifconfig is only run when sysfs is not available.
+    The address is looked up once per process, see refresh_identity().
 
     Parameters
     ----------
@@ -186,10 +333,7 @@ def get_mac_address() -> str:
     The mac address for the primary interface is b8:27:eb:c1:f2:4d
     >>>
     '''
-    mac = get_mac_address_by_interface('eth0')
-    if mac is not None:
-        return mac
-    return get_mac_address_by_interface('wlan0')
+    return _cached_identity('mac_address', find_mac_address)
 
 
 def get_object_id() -> str:
@@ -219,9 +363,42 @@ def get_object_id() -> str:
     return get_mac_address().replace(':', '')
 
 
+# the units of `uptime -p`, largest first
+UPTIME_UNITS = (
+    ('year', 365 * 24 * 60 * 60),
+    ('week', 7 * 24 * 60 * 60),
+    ('day', 24 * 60 * 60),
+    ('hour', 60 * 60),
+    ('minute', 60),
+)
+
+
+def format_uptime(seconds: float) -> str:
+    '''format a number of seconds the way `uptime -p` does
+
+    Parameters
+    ----------
+    seconds : float
+        the time since the system was rebooted
+
+    Returns
+    -------
+    a str such as 'up 1 day, 20 hours, 57 minutes'
+    '''
+    remainder = int(seconds)
+    parts = []
+    for unit, length in UPTIME_UNITS:
+        count, remainder = divmod(remainder, length)
+        if count or (unit == 'minute' and not parts):
+            parts.append(f'{count} {unit}' + ('s' if count != 1 else ''))
+    return 'up ' + ', '.join(parts)
+
+
 def get_uptime() -> str:
     '''get the time since the system was rebooted
 
+    The time is read from /proc/uptime and formatted like `uptime -p`.
+
     Parameters - none
 
     Returns
@@ -235,11 +412,16 @@ def get_uptime() -> str:
     The uptime is up 20 hours, 57 minutes
     >>>
     '''
-    return get_command_data(['uptime', '-p'])
+    return format_uptime(float(readfile('/proc/uptime').split()[0]))
 
 
 def get_last_restart() -> str:
-    '''get the Mac address of the specified interface
+    '''get the date and time of the last reboot
+
+    The boot time is read from the btime line of /proc/stat and formatted
+    in local time like `uptime -s`. It is not cached, the kernel adjusts
+    btime when the clock is set, e.g. by NTP after booting a Pi without
+    a real time clock.
 
     Parameters
     ----------
@@ -247,7 +429,8 @@ def get_last_restart() -> str:
 
     Returns
     -------
-    a str the date and time of the last reboot
+    a str the date and time of the last reboot, or None if /proc/stat
+    has no btime
 
     Example
     ------
@@ -256,7 +439,13 @@ def get_last_restart() -> str:
     The last restart time is 2025-08-26 17:42:54
     >>>
     '''
-    return get_command_data(['uptime', '-s'])
+    for line in readfile('/proc/stat').splitlines():
+        if line.startswith('btime '):
+            btime = int(line.split()[1])
+            return datetime.datetime.fromtimestamp(btime).strftime(
+                '%Y-%m-%d %H:%M:%S'
+            )
+    return None
 
 
 def get_pyproject_version():
@@ -360,3 +549,7 @@ def get_my_version():
     if version is not None:
         return version
     return '0.0.0-dev'
+
+
+# the installed version of the package, looked up once at import
+PACKAGE_VERSION = get_metadata_version() or '0.0.0'
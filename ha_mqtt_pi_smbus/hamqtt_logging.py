@@ -2,10 +2,191 @@ import json
 from json.decoder import JSONDecodeError
 import logging
 import logging.config
+import threading
+import time
+from typing import Any, Dict
 
 from ha_mqtt_pi_smbus.util import readfile
 
 
+class PublishTrace:
+    '''A level-gated trace of the messages published by a client
+
+    Every publication is counted per topic, which costs a dict update.
+    Nothing is formatted unless the logger is enabled for it:
+
+    DEBUG
+        one line per published message, for the first message of each
+        topic and then every sample_every'th one, with the payload
+        truncated to payload_limit characters
+    INFO
+        a summary line every summary_interval seconds with the number of
+        messages, bytes and the message rate of each topic
+
+    Parameters
+    ----------
+    logger : logging.Logger
+        the logger to which the trace is written
+    summary_interval : float
+        the seconds between summary lines, 0 disables them.
+        Default: 300.0
+    sample_every : int
+        only every sample_every'th message of a topic is traced.
+        Default: 1, every message
+    payload_limit : int
+        the number of characters of a payload which are traced.
+        Default: 80
+
+    Example
+    -------
+    trace = PublishTrace(logging.getLogger(__name__ + '.publish'))
+    trace.record('office/state', payload, qos=0, retain=False, rc=0)
+    '''
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        summary_interval: float = 300.0,
+        sample_every: int = 1,
+        payload_limit: int = 80,
+    ):
+        self.logger = logger
+        self.summary_interval = summary_interval
+        self.sample_every = max(1, sample_every)
+        self.payload_limit = payload_limit
+        self._lock = threading.Lock()
+        self._topics: Dict[str, list] = {}
+        self._since = time.monotonic()
+
+    def record(
+        self, topic: str, payload: str | bytes, qos: int, retain: bool, rc: int
+    ) -> None:
+        '''count a published message and trace it if enabled
+
+        Parameters
+        ----------
+        topic : str
+            the topic of the message
+        payload : str | bytes
+            the message
+        qos : int
+            the quality of service of the message
+        retain : bool
+            the retain flag of the message
+        rc : int
+            the result code returned by paho, non-zero is a failure
+        '''
+        size = len(payload) if payload is not None else 0
+        with self._lock:
+            counts = self._topics.get(topic)
+            if counts is None:
+                counts = self._topics[topic] = [0, 0, 0]
+            counts[0] += 1
+            counts[1] += size
+            if rc:
+                counts[2] += 1
+            count = counts[0]
+        if (count - 1) % self.sample_every == 0 and self.logger.isEnabledFor(
+            logging.DEBUG
+        ):
+            self.logger.debug(
+                'publish #%s topic=%s bytes=%s qos=%s retain=%s rc=%s payload=%s',
+                count,
+                topic,
+                size,
+                qos,
+                retain,
+                rc,
+                self.truncate(payload),
+            )
+        if self.summary_interval:
+            now = time.monotonic()
+            if now - self._since >= self.summary_interval:
+                self.log_summary(now)
+
+    def truncate(self, payload: str | bytes) -> str:
+        '''return the start of a payload for the trace
+
+        Parameters
+        ----------
+        payload : str | bytes
+            the message
+        '''
+        if payload is None:
+            return ''
+        if isinstance(payload, (bytes, bytearray)):
+            payload = bytes(payload[: self.payload_limit]).decode(
+                'utf-8', errors='replace'
+            )
+        if len(payload) > self.payload_limit:
+            return payload[: self.payload_limit] + '...'
+        return payload
+
+    def summary(self, now: float = None) -> Dict[str, Dict[str, Any]]:
+        '''return the counts of each topic since the last summary
+
+        Parameters
+        ----------
+        now : float
+            the current time.monotonic() time. Default: None, the time
+            is read
+
+        Return
+        ------
+        Dict[str, Dict[str, Any]] : for each topic the messages, bytes,
+        failures and rate (messages per second)
+        '''
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            return self._summarize(self._topics, now - self._since)
+
+    def log_summary(self, now: float = None) -> None:
+        '''log the summary line at INFO and restart the counts
+
+        Parameters
+        ----------
+        now : float
+            the current time.monotonic() time. Default: None, the time
+            is read
+        '''
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            topics, elapsed = self._topics, now - self._since
+            self._topics = {}
+            self._since = now
+        if not topics or not self.logger.isEnabledFor(logging.INFO):
+            return
+        summary = self._summarize(topics, elapsed)
+        self.logger.info(
+            'published %s messages, %s bytes in %.0fs: %s',
+            sum(t['messages'] for t in summary.values()),
+            sum(t['bytes'] for t in summary.values()),
+            elapsed,
+            ', '.join(
+                f'{topic} {t["messages"]} ({t["rate"]:.2f}/s'
+                + (f', {t["failures"]} failed)' if t['failures'] else ')')
+                for topic, t in sorted(summary.items())
+            ),
+        )
+
+    @staticmethod
+    def _summarize(
+        topics: Dict[str, list], elapsed: float
+    ) -> Dict[str, Dict[str, Any]]:
+        elapsed = max(elapsed, 1e-9)
+        return {
+            topic: {
+                'messages': messages,
+                'bytes': size,
+                'failures': failures,
+                'rate': messages / elapsed,
+            }
+            for topic, (messages, size, failures) in topics.items()
+        }
+
+
 def loggerConfig() -> str:
     '''logging configuration
 
@@ -46,13 +227,13 @@ def loggerConfig() -> str:
             'handlers': ['wsgi'],
         },
         'loggers': {
-            'mqtt_client': {
+            'ha_mqtt_pi_smbus': {
                 'level': 'WARNING',
                 'handlers': ['wsgi'],
                 'propagate': False,
             },
-            'web_server': {
-                'level': 'DEBUG',
+            'ha_mqtt_pi_smbus.mqtt_client.publish': {
+                'level': 'INFO',
                 'handlers': ['wsgi'],
                 'propagate': False,
             },
@@ -0,0 +1,192 @@
+'''A fixed-capacity history of the values of a sensor
+
+The timestamps (int64 nanoseconds) and values (float32) are kept in two
+preallocated array.array buffers used as a ring, 12 bytes per point, so
+a day of 1 Hz samples of a sensor takes about 1 MiB and no Python
+object is kept per point. When numpy is installed (pip install
+ha_mqtt_pi_smbus[numpy]) the window queries search and slice numpy
+views of the same buffers and return numpy arrays; otherwise they
+return array.array copies of the window.
+
+Example
+-------
+history = History(86400)
+history.append(21.5)
+timestamps, values = history.since(3600)
+'''
+
+import array
+import bisect
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+from ha_mqtt_pi_smbus.util import numpy
+
+
+class History:
+    '''A ring buffer of (timestamp, value) points in time order
+
+    Parameters
+    ----------
+    capacity : int
+        the number of points kept, the oldest point is overwritten by
+        each append() once the history is full
+
+    Attributes
+    ----------
+    appended : int
+        the number of points appended, including those overwritten
+
+    Example
+    -------
+    history = History(3)
+    for value in (1.0, 2.0, 3.0, 4.0):
+        history.append(value)
+    history.window()    # (array('q', [...]), array('f', [2.0, 3.0, 4.0]))
+    '''
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise Exception(f'capacity ({capacity}) must be at least 1')
+        self.capacity = capacity
+        self.appended = 0
+        self._timestamps = array.array('q', [0]) * capacity
+        self._values = array.array('f', [0.0]) * capacity
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        if numpy is not None:
+            # views of the same memory, nothing is copied
+            self._np_timestamps = numpy.frombuffer(self._timestamps, dtype=numpy.int64)
+            self._np_values = numpy.frombuffer(self._values, dtype=numpy.float32)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        '''the memory used by the buffers, in bytes'''
+        return self.capacity * (self._timestamps.itemsize + self._values.itemsize)
+
+    def append(self, value: float, timestamp_ns: int = None) -> None:
+        '''add a point, overwriting the oldest when the history is full
+
+        Parameters
+        ----------
+        value : float
+            the value, stored as a float32
+        timestamp_ns : int
+            the time of the value in nanoseconds since the epoch. A time
+            earlier than the latest point (e.g. after the clock was
+            stepped back) is raised to it, so the points stay in order.
+            Default: None, time.time_ns()
+        '''
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        with self._lock:
+            if self._count:
+                timestamp_ns = max(timestamp_ns, self._timestamps[self._head - 1])
+            self._timestamps[self._head] = timestamp_ns
+            self._values[self._head] = value
+            self._head = (self._head + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self.appended += 1
+
+    def latest(self) -> Optional[Tuple[int, float]]:
+        '''return the latest point
+
+        Return
+        ------
+        Tuple[int, float] : the timestamp and value of the latest point,
+        or None when the history is empty
+        '''
+        with self._lock:
+            if not self._count:
+                return None
+            return self._timestamps[self._head - 1], self._values[self._head - 1]
+
+    def _spans(self) -> Tuple[Tuple[int, int], ...]:
+        '''the (start, end) indexes of the points, oldest first'''
+        if self._count < self.capacity:
+            return ((0, self._count),)
+        return ((self._head, self.capacity), (0, self._head))
+
+    def window(self, start_ns: int = None, end_ns: int = None) -> Tuple[Any, Any]:
+        '''return the points with start_ns <= timestamp < end_ns
+
+        The window is found with a binary search of each span of the
+        ring and copied in at most two slices.
+
+        Parameters
+        ----------
+        start_ns : int
+            the earliest timestamp, in nanoseconds. Default: None, the
+            oldest point
+        end_ns : int
+            the timestamp after the window, in nanoseconds. Default:
+            None, after the latest point
+
+        Return
+        ------
+        Tuple : the timestamps (int64) and values (float32), as numpy
+        arrays when numpy is installed and array.array otherwise
+        '''
+        with self._lock:
+            slices = []
+            for lo, hi in self._spans():
+                first = lo if start_ns is None else self._search(start_ns, lo, hi)
+                last = hi if end_ns is None else self._search(end_ns, lo, hi)
+                if first < last:
+                    slices.append((first, last))
+            if numpy is not None:
+                return (
+                    numpy.concatenate(
+                        [self._np_timestamps[a:b] for a, b in slices]
+                        or [numpy.empty(0, numpy.int64)]
+                    ),
+                    numpy.concatenate(
+                        [self._np_values[a:b] for a, b in slices]
+                        or [numpy.empty(0, numpy.float32)]
+                    ),
+                )
+            timestamps = array.array('q')
+            values = array.array('f')
+            for a, b in slices:
+                timestamps += self._timestamps[a:b]
+                values += self._values[a:b]
+            return timestamps, values
+
+    def _search(self, timestamp_ns: int, lo: int, hi: int) -> int:
+        '''the index of the first point in lo:hi at or after timestamp_ns'''
+        if numpy is not None:
+            return lo + int(
+                numpy.searchsorted(self._np_timestamps[lo:hi], timestamp_ns)
+            )
+        return bisect.bisect_left(self._timestamps, timestamp_ns, lo, hi)
+
+    def since(self, seconds: float, now_ns: int = None) -> Tuple[Any, Any]:
+        '''return the points of the last seconds, see window()
+
+        Parameters
+        ----------
+        seconds : float
+            the length of the window
+        now_ns : int
+            the time the window is measured back from, in nanoseconds.
+            Default: None, time.time_ns()
+        '''
+        if now_ns is None:
+            now_ns = time.time_ns()
+        return self.window(now_ns - int(seconds * 1e9), None)
+
+    def clear(self) -> None:
+        '''forget every point
+
+        Parameters
+        ----------
+        None
+        '''
+        with self._lock:
+            self._head = 0
+            self._count = 0
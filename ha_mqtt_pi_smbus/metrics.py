@@ -0,0 +1,416 @@
+import math
+import threading
+from typing import Callable, Dict, Sequence
+
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+def format_value(value: float) -> str:
+    '''format a sample value for the Prometheus text format
+
+    Parameters
+    ----------
+    value : float
+        the value of the sample
+    '''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value))
+
+
+def escape_label(value: str) -> str:
+    '''escape a label value for the Prometheus text format
+
+    Parameters
+    ----------
+    value : str
+        the label value
+    '''
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+    '''The base of the metrics kept in a MetricsRegistry
+
+    A metric has one value for each combination of its label values.
+    The label values are passed as keyword arguments, e.g.
+    counter.inc(topic='office/state').
+
+    Parameters
+    ----------
+    name : str
+        the name of the metric
+    help : str
+        the description of the metric
+    labelnames : Sequence[str]
+        the names of the labels of the metric. Default: no labels
+    '''
+
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise Exception(
+                f'{self.name} has labels {self.labelnames}, not {tuple(labels)}'
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple, extra: str = None) -> str:
+        pairs = [
+            f'{name}="{escape_label(value)}"'
+            for name, value in zip(self.labelnames, key)
+        ]
+        if extra is not None:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def get(self, **labels: str) -> float:
+        '''return the value for the labels, 0 if there is none
+
+        A value set with set_function() is read from its function.
+
+        Parameters
+        ----------
+        labels : str
+            the label values
+        '''
+        with self._lock:
+            value = self._values.get(self._key(labels), 0)
+        return value() if callable(value) else value
+
+    def remove(self, **labels: str) -> None:
+        '''forget the value for the labels
+
+        Parameters
+        ----------
+        labels : str
+            the label values
+        '''
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        '''return the (name, labels, value) samples of the metric'''
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            (self.name, self._labels(key), value() if callable(value) else value)
+            for key, value in values
+        ]
+
+    def render(self) -> list[str]:
+        '''return the lines of the metric in the Prometheus text format'''
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{labels} {format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    '''A value which only increases, e.g. the number of messages sent
+
+    Example
+    -------
+    published = registry.counter('mqtt_published_total',
+        'messages published', ('topic',))
+    published.inc(topic='office/state')
+    '''
+
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        '''increase the counter
+
+        Parameters
+        ----------
+        amount : float
+            the amount to add, it must not be negative. Default: 1
+        labels : str
+            the label values
+        '''
+        if amount < 0:
+            raise Exception(f'{self.name} cannot be decreased ({amount})')
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        '''read the value of the counter from a function when rendered
+
+        For a count kept elsewhere, e.g. by the Outbox. The function
+        must never return less than it returned before.
+
+        Parameters
+        ----------
+        function : Callable[[], float]
+            returns the current count
+        labels : str
+            the label values
+        '''
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = function
+
+
+class Gauge(Metric):
+    '''A value which goes up and down, e.g. the length of a queue
+
+    The value is either set, or read from a function each time the
+    metric is rendered.
+
+    Example
+    -------
+    queued = registry.gauge('mqtt_queued_messages', 'messages queued',
+        ('client',))
+    queued.set_function(lambda: len(queue), client='bme280')
+    '''
+
+    type = 'gauge'
+
+    def set(self, value: float, **labels: str) -> None:
+        '''set the value of the gauge
+
+        Parameters
+        ----------
+        value : float
+            the new value
+        labels : str
+            the label values
+        '''
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        '''increase (or with a negative amount, decrease) the gauge
+
+        Parameters
+        ----------
+        amount : float
+            the amount to add. Default: 1
+        labels : str
+            the label values
+        '''
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        '''read the value of the gauge from a function when rendered
+
+        Parameters
+        ----------
+        function : Callable[[], float]
+            returns the current value
+        labels : str
+            the label values
+        '''
+        self.set(function, **labels)
+
+
+class Histogram(Metric):
+    '''The distribution of observed values, e.g. the duration of a call
+
+    Parameters
+    ----------
+    name : str
+        the name of the metric
+    help : str
+        the description of the metric
+    labelnames : Sequence[str]
+        the names of the labels of the metric. Default: no labels
+    buckets : Sequence[float]
+        the upper bounds of the buckets, +Inf is added.
+        Default: DEFAULT_BUCKETS, 0.5ms to 2.5s
+
+    Example
+    -------
+    duration = registry.histogram('smbus_sample_seconds',
+        'time taken by sample()')
+    start = time.monotonic()
+    smbus_device.sample()
+    duration.observe(time.monotonic() - start)
+    '''
+
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels: str) -> None:
+        '''add an observation
+
+        Parameters
+        ----------
+        value : float
+            the observed value
+        labels : str
+            the label values
+        '''
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one count per bucket, then the sum of the values
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+    def get(self, **labels: str) -> int:
+        '''return the number of observations for the labels
+
+        Parameters
+        ----------
+        labels : str
+            the label values
+        '''
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return sum(counts[:-1]) if counts is not None else 0
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        samples = []
+        for key, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                le = f'le="{format_value(bound)}"'
+                samples.append((f'{self.name}_bucket', self._labels(key, le), total))
+            samples.append((f'{self.name}_sum', self._labels(key), counts[-1]))
+            samples.append((f'{self.name}_count', self._labels(key), total))
+        return samples
+
+
+class MetricsRegistry:
+    '''The metrics of a process, rendered in the Prometheus text format
+
+    The counter(), gauge() and histogram() methods return the metric of
+    that name, creating it the first time, so every client and sampler
+    can ask for the metrics it records without coordinating.
+
+    Example
+    -------
+    registry = MetricsRegistry()
+    registry.counter('mqtt_published_total', 'messages published').inc()
+    print(registry.render())
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def _get(self, cls: type, name: str, *args, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif type(metric) is not cls:
+                raise Exception(f'{name} is already registered as a {metric.type}')
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        '''return the counter, creating it if need be
+
+        Parameters
+        ----------
+        name : str
+            the name of the metric
+        help : str
+            the description of the metric
+        labelnames : Sequence[str]
+            the names of the labels of the metric. Default: no labels
+        '''
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        '''return the gauge, creating it if need be
+
+        Parameters
+        ----------
+        name : str
+            the name of the metric
+        help : str
+            the description of the metric
+        labelnames : Sequence[str]
+            the names of the labels of the metric. Default: no labels
+        '''
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        '''return the histogram, creating it if need be
+
+        Parameters
+        ----------
+        name : str
+            the name of the metric
+        help : str
+            the description of the metric
+        labelnames : Sequence[str]
+            the names of the labels of the metric. Default: no labels
+        buckets : Sequence[float]
+            the upper bounds of the buckets. Default: DEFAULT_BUCKETS
+        '''
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def __getitem__(self, name: str) -> Metric:
+        with self._lock:
+            return self._metrics[name]
+
+    def render(self) -> str:
+        '''return every metric in the Prometheus text format'''
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# the registry used when none is given
+REGISTRY = MetricsRegistry()
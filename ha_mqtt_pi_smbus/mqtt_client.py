@@ -1,9 +1,7 @@
 from __future__ import annotations
 
-import copy
-from importlib.metadata import version, PackageNotFoundError
-import json
 import logging
+import os
 import random
 import threading
 import time
@@ -14,16 +12,24 @@ import paho.mqtt.enums as mqtt_enums
 import paho.mqtt.properties as mqtt_properties
 from paho.mqtt.client import connack_string
 
+from ha_mqtt_pi_smbus.aggregation import WindowAggregator
 from ha_mqtt_pi_smbus.config import to_dict
-from ha_mqtt_pi_smbus.device import HADevice, HASensor, SMBusDevice
+from ha_mqtt_pi_smbus.device import HADevice, HASensor, SMBusDevice, next_deadline
 from ha_mqtt_pi_smbus.environ import (
+    PACKAGE_VERSION,
     get_object_id,
     get_temperature,
     get_uptime,
     get_last_restart,
 )
+from ha_mqtt_pi_smbus.hamqtt_logging import PublishTrace
+from ha_mqtt_pi_smbus.metrics import REGISTRY, MetricsRegistry
+from ha_mqtt_pi_smbus.outbox import Coalescer, Message, Outbox
+from ha_mqtt_pi_smbus.serializer import get_serializer
 from ha_mqtt_pi_smbus.parsing import MqttConfig
 from ha_mqtt_pi_smbus.state import State
+from ha_mqtt_pi_smbus.store import ReadingStore
+from ha_mqtt_pi_smbus.util import TokenBucket
 
 
 def get_temp():
@@ -42,7 +48,144 @@ def get_temp():
     return get_temperature()
 
 
-class MQTT_Publisher_Thread(threading.Thread):
+def get_diagnostics() -> Dict[str, Any]:
+    '''Take a snapshot of the diagnostics of the system
+
+    The snapshot is shared by all the diagnostic sensors of a device,
+    which display its fields from the one diagnostics topic.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    Dict[str, Any] : the status, cpu_temperature, version, uptime and
+    last_restart of the system
+    '''
+    return {
+        'status': 'OK',
+        'cpu_temperature': get_temperature(),
+        'version': PACKAGE_VERSION,
+        'uptime': get_uptime(),
+        'last_restart': get_last_restart(),
+    }
+
+
+class StateFilter:
+    '''Decide which samples of a device need to be published
+
+    A mixin for the publishers of device state. The class using it
+    supplies the device whose sensors define the deadbands and
+    heartbeats, and the client whose metrics count the suppressed
+    samples.
+
+    Attributes
+    ----------
+    client : MQTTClient
+        the client used to publish
+    device : HADevice
+        a HADevice describing the data to be published
+    published : Dict[str, Any]
+        the data most recently published, None before the first
+        publication
+    published_at : float
+        the time.monotonic() time of the most recent publication
+    suppressed : int
+        the number of samples which were not published because no sensor
+        changed by more than its deadband
+    aggregator : WindowAggregator
+        the windows of a device with a statistics_window, None before
+        the first sample or without one
+    '''
+
+    client: 'MQTTClient'
+    device: HADevice
+    published: Dict[str, Any] = None
+    published_at: float = None
+    suppressed: int = 0
+    aggregator: WindowAggregator = None
+
+    def aggregate(self, data: Dict[str, Any], now: float) -> bool:
+        '''Add the sample to the statistics window of the device
+
+        Parameters
+        ----------
+        data : Dict[str, Any]
+            the latest sampled data, the statistics of the window are
+            added to it when the window ends
+        now : float
+            the current time.monotonic() time
+
+        Return
+        ------
+        bool : False if the sample is held until the window ends, True
+        if it is to be published. Always True when the device has no
+        statistics_window
+        '''
+        window = self.device.statistics_window
+        if window is None:
+            return True
+        if self.aggregator is None:
+            self.aggregator = WindowAggregator(self.device.sensors, window)
+        return self.aggregator.add(data, now)
+
+    def should_publish(self, data: Dict[str, Any], now: float) -> bool:
+        '''Return True if the sampled data needs to be published
+
+        The data is published when any sensor of the device changed by
+        more than its deadband since the last publication, or when the
+        shortest max_silence of the sensors has elapsed since then.
+
+        Parameters
+        ----------
+        data : Dict[str, Any]
+            the latest sampled data
+        now : float
+            the current time.monotonic() time
+        '''
+        if self.published is None:
+            return True
+        silence = now - self.published_at
+        for sensor in self.device.sensors:
+            if sensor.diagnostic:
+                continue
+            field = sensor.state_field
+            if sensor.changed(self.published.get(field), data.get(field)):
+                return True
+            if sensor.max_silence is not None and silence >= sensor.max_silence:
+                return True
+        return False
+
+    def record_published(self, data: Dict[str, Any], now: float) -> None:
+        '''Remember the data which was published and when
+
+        Parameters
+        ----------
+        data : Dict[str, Any]
+            the data which was published
+        now : float
+            the time.monotonic() time of the publication
+        '''
+        self.published = data
+        self.published_at = now
+
+    def record_suppressed(self) -> None:
+        '''Count a sample which was not published
+
+        Parameters
+        ----------
+        None
+        '''
+        self.suppressed += 1
+        self.client.metrics.counter(
+            'mqtt_state_suppressed_total',
+            'samples not published because no sensor changed',
+            ('topic',),
+        ).inc(topic=self.device.state_topic)
+
+
+class MQTT_Publisher_Thread(StateFilter, threading.Thread):
     '''
     A class used to represent a thread which, at intervals, publishes
     data to Home Assistant through MQTT
@@ -64,14 +207,20 @@ class MQTT_Publisher_Thread(threading.Thread):
         next iteration
     data : Any
         the data which will be encoded and sent to Home Assistant
+    sequence : int
+        the sequence number of the last sample taken from the
+        smbus_device
+
+    The published, published_at and suppressed attributes come from
+    StateFilter.
 
     Methods
     -------
     run()
         The main thread execution method
     clear_do_run()
-        clears the run() methods execution flag causing the run() method
-        to exit at the beginning of the next iteration.
+        clears the run() methods execution flag and wakes the thread,
+        causing the run() method to exit.
 
 
     '''
@@ -97,38 +246,412 @@ class MQTT_Publisher_Thread(threading.Thread):
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
         self.do_run = True
         self.data = self.smbus_device.getdata()
+        self.sequence = 0
+        self.published = None
+        self.published_at = None
+        self.suppressed = 0
 
     def run(self) -> None:
         '''the main execution method for the thread
 
+        The thread blocks until the smbus_device announces a new sample
+        with notify_sample(), so nothing runs between samples. A sample
+        which is already available when the thread starts is published
+        immediately. Every sample is recorded in the history of the
+        device's sensors. A device with a statistics_window publishes
+        once per window (see aggregate()). Samples which do not pass
+        should_publish() are counted in suppressed and dropped.
+
         Parameters
         ----------
         None
         '''
         while True:
+            sequence = self.smbus_device.wait_for_sample(
+                self.sequence, stop=lambda: not self.do_run
+            )
             if not self.do_run:
                 return
-            if self.client.is_discovered:
-                data = copy.deepcopy(self.smbus_device.getdata())
-                if data['last_update'] != self.data['last_update']:
-                    self.data = copy.deepcopy(data)
-                    self.data['state'] = 'OK'
-                    self.client.publish(
-                        self.device.state_topic,
-                        json.dumps(self.data),
-                        qos=self.client.qos,
-                        retain=self.client.retain,
-                    )
-            time.sleep(1)
+            self.sequence = sequence
+            data = self.smbus_device.getdata()
+            self.device.record_history(data)
+            if self.client.is_discovered():
+                self.data = data
+                self.data['state'] = 'OK'
+                now = time.monotonic()
+                if not self.aggregate(self.data, now):
+                    continue
+                if not self.should_publish(self.data, now):
+                    self.record_suppressed()
+                    continue
+                self.client.publish_state(self.device, self.data)
+                self.record_published(self.data, now)
 
     def clear_do_run(self) -> None:
-        '''the run() routine's do_run flag is cleared
+        '''the run() routine's do_run flag is cleared and the thread is
+        woken so that it exits
 
         Parameters
         ----------
         None
         '''
         self.do_run = False
+        self.smbus_device.wake()
+
+
+class MQTT_Diagnostics_Thread(threading.Thread):
+    '''
+    A thread which periodically publishes one diagnostics snapshot for
+    the devices of a client
+
+    Parameters
+    ----------
+    client : MQTTClient
+        the client used to publish the diagnostics
+    interval : float
+        the interval in seconds between publications, the first is made
+        one interval after the thread starts
+
+    Attributes
+    ----------
+    publications : int
+        the number of snapshots published
+    '''
+
+    def __init__(self, client: 'MQTTClient', interval: float):
+        super().__init__(name='MQTT_Diagnostics', daemon=True)
+        if interval <= 0:
+            raise Exception(f'interval ({interval}) must be greater than 0')
+        self.client = client
+        self.interval = interval
+        self.publications = 0
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        '''the main execution method for the thread
+
+        Parameters
+        ----------
+        None
+        '''
+        deadline = time.monotonic()
+        while True:
+            deadline, _ = next_deadline(deadline, self.interval, time.monotonic())
+            if self._stop_event.wait(deadline - time.monotonic()):
+                return
+            try:
+                self.client.publish_diagnostics()
+                self.publications += 1
+            except Exception:
+                self.__logger.exception('publishing diagnostics failed')
+
+    def clear_do_run(self) -> None:
+        '''stop the thread
+
+        Parameters
+        ----------
+        None
+        '''
+        self._stop_event.set()
+
+
+class MQTT_Flush_Thread(threading.Thread):
+    '''
+    A thread which periodically publishes the latest pending state of
+    each topic of a client, see MQTTClient.publish_state()
+
+    Parameters
+    ----------
+    client : MQTTClient
+        the client whose pending states are published
+    interval : float
+        the interval in seconds between flushes
+
+    Attributes
+    ----------
+    flushes : int
+        the number of flushes made
+    '''
+
+    def __init__(self, client: 'MQTTClient', interval: float):
+        super().__init__(name='MQTT_Flush', daemon=True)
+        if interval <= 0:
+            raise Exception(f'interval ({interval}) must be greater than 0')
+        self.client = client
+        self.interval = interval
+        self.flushes = 0
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        '''the main execution method for the thread
+
+        Parameters
+        ----------
+        None
+        '''
+        deadline = time.monotonic()
+        while True:
+            deadline, _ = next_deadline(deadline, self.interval, time.monotonic())
+            if self._stop_event.wait(deadline - time.monotonic()):
+                return
+            try:
+                self.client.flush_states()
+                self.flushes += 1
+            except Exception:
+                self.__logger.exception('flushing the states failed')
+
+    def clear_do_run(self) -> None:
+        '''stop the thread
+
+        Parameters
+        ----------
+        None
+        '''
+        self._stop_event.set()
+
+
+class Rediscovery:
+    '''Announce every device of a client again, paced so that a Home
+    Assistant restart does not flood the broker
+
+    A mixin for the rediscovery thread and coroutine, which wait for
+    next_delay() before each call to announce(). The delays come from a
+    token bucket, so the first rediscovery_burst devices go at once and
+    the rest at rediscovery_rate per second, each with up to
+    rediscovery_jitter random seconds added so that many hosts restarted
+    together do not announce in step. All the devices share one
+    diagnostics snapshot.
+
+    Parameters
+    ----------
+    client : MQTTClient
+        the client whose devices are announced
+
+    Attributes
+    ----------
+    entries : List[MQTTClient.Entry]
+        the devices to be announced, in order
+    status : Dict[str, str]
+        'pending', 'done' or 'failed' for each device, keyed by
+        discovery topic
+    started_at : float
+        the time.monotonic() time at which the rediscovery was planned
+    '''
+
+    def plan(self, client: MQTTClient) -> None:
+        '''Plan the announcement of every device of the client
+
+        Parameters
+        ----------
+        client : MQTTClient
+            the client whose devices are announced
+        '''
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.client = client
+        self.entries = client._entries()
+        self.status = {
+            entry.device.discovery_topic: 'pending' for entry in self.entries
+        }
+        self.started_at = time.monotonic()
+        self.bucket = TokenBucket(
+            client.rediscovery_rate, burst=client.rediscovery_burst
+        )
+        self.jitter = client.rediscovery_jitter
+        self.diagnostics = None
+
+    @property
+    def pending(self) -> int:
+        '''the number of devices not yet announced'''
+        return sum(1 for status in self.status.values() if status == 'pending')
+
+    def next_delay(self) -> float:
+        '''Return the seconds to wait before the next announcement
+
+        Parameters
+        ----------
+        None
+        '''
+        return self.bucket.take() + random.uniform(0, self.jitter)
+
+    def announce(self, entry: MQTTClient.Entry) -> None:
+        '''Publish the discovery and the availability of one device
+
+        Parameters
+        ----------
+        entry : MQTTClient.Entry
+            the device to be announced
+        '''
+        topic = entry.device.discovery_topic
+        try:
+            if self.diagnostics is None:
+                self.diagnostics = get_diagnostics()
+            self.client.publish_discovery(entry.device)
+            self.client.publish_available(entry.device, self.diagnostics)
+            self.status[topic] = 'done'
+        except Exception:
+            self.status[topic] = 'failed'
+            self.__logger.exception('rediscovering %s failed', topic)
+        if not self.pending:
+            self.__logger.info(
+                'rediscovered %s devices in %.1fs, %s failed',
+                len(self.status),
+                time.monotonic() - self.started_at,
+                sum(1 for status in self.status.values() if status == 'failed'),
+            )
+
+
+class MQTT_Rediscovery_Thread(Rediscovery, threading.Thread):
+    '''A thread which announces every device of a client again when Home
+    Assistant comes online, see Rediscovery
+
+    Parameters
+    ----------
+    client : MQTTClient
+        the client whose devices are announced
+    '''
+
+    def __init__(self, client: MQTTClient):
+        super().__init__(name='MQTT_Rediscovery', daemon=True)
+        self.plan(client)
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        '''the main execution method for the thread
+
+        Parameters
+        ----------
+        None
+        '''
+        for entry in self.entries:
+            if self._stop_event.wait(self.next_delay()):
+                return
+            self.announce(entry)
+
+    def clear_do_run(self) -> None:
+        '''stop the thread, the devices not yet announced stay pending
+
+        Parameters
+        ----------
+        None
+        '''
+        self._stop_event.set()
+
+
+class Replay:
+    '''Publish the messages kept in the store of a client while the
+    broker could not be reached, paced so that a long outage does not
+    flood the broker when the connection comes back
+
+    A mixin for the replay thread and coroutine, which wait for
+    bucket.take() before each call to replay_next(). The first
+    replay_burst messages go at once and the rest at replay_rate per
+    second, oldest first, so Home Assistant sees the state of each topic
+    in the order in which it was sampled. The messages are not retained.
+    The replay pauses while messages wait in the client's outbox, which
+    would otherwise coalesce them.
+
+    Parameters
+    ----------
+    client : MQTTClient
+        the client whose store is replayed
+
+    Attributes
+    ----------
+    replayed : int
+        the messages published so far
+    started_at : float
+        the time.monotonic() time at which the replay was planned
+    '''
+
+    def plan(self, client: MQTTClient) -> None:
+        '''Plan the replay of the store of the client
+
+        Parameters
+        ----------
+        client : MQTTClient
+            the client whose store is replayed
+        '''
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.client = client
+        self.replayed = 0
+        self.started_at = time.monotonic()
+        self.bucket = TokenBucket(client.replay_rate, burst=client.replay_burst)
+        self.stopped = False
+
+    def replay_next(self) -> bool:
+        '''Publish the oldest message of the store
+
+        Parameters
+        ----------
+        None
+
+        Return
+        ------
+        bool : False when the replay is over, because the store is
+        empty, the client has been disconnected or the replay stopped
+        '''
+        client = self.client
+        # publish_state() decides with this lock held whether a message
+        # goes to the store, so none is left behind when the replay ends
+        with client._replay_lock:
+            if self.stopped or not mqtt.Client.is_connected(client):
+                return False
+            if client.outbox.queued:
+                return True
+            record = client.store.peek()
+            if record is None:
+                self.__logger.info(
+                    'replayed %s messages in %.1fs',
+                    self.replayed,
+                    time.monotonic() - self.started_at,
+                )
+                return False
+            topic, payload = record
+            client.publish(topic, payload, qos=client.qos, retain=False)
+            client.store.pop()
+            self.replayed += 1
+            client._replayed.inc(client=client.client_prefix)
+            return True
+
+
+class MQTT_Replay_Thread(Replay, threading.Thread):
+    '''A thread which publishes the messages kept in the store of a
+    client once it has reconnected, see Replay
+
+    Parameters
+    ----------
+    client : MQTTClient
+        the client whose store is replayed
+    '''
+
+    def __init__(self, client: MQTTClient):
+        super().__init__(name='MQTT_Replay', daemon=True)
+        self.plan(client)
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        '''the main execution method for the thread
+
+        Parameters
+        ----------
+        None
+        '''
+        while not self._stop_event.wait(self.bucket.take()):
+            if not self.replay_next():
+                return
+
+    def clear_do_run(self) -> None:
+        '''stop the thread, the messages not yet published stay in the
+        store
+
+        Parameters
+        ----------
+        None
+        '''
+        self.stopped = True
+        self._stop_event.set()
 
 
 class MQTTClient(mqtt.Client):
@@ -152,20 +675,95 @@ class MQTTClient(mqtt.Client):
         the password used to authenticate with the MQTT broker
     device : HADevice
         the description of the data being sent to Home Assitant through
-        the MQTT broker
+        the MQTT broker, the first of the devices
     smbus_device : SMBusDevice
-        the interface to the sensor device
+        the interface to the sensor device of device
+    devices : Dict[str, MQTTClient.Entry]
+        every device served by the client, keyed by discovery topic, see
+        add_device()
     connected : bool
     connected_flag : bool
     on_connect : Callback
         the method which will be called when a connection is complete
     publisher_thread : MQTT_Publisher_Thread
         the thread which will retrieve data from the smbus_device and
-        publish it via the MQTT client
+        publish it via the MQTT client, None while device is not
+        discovered
+    diagnostics_interval : float
+        the interval in seconds at which the diagnostics are published
+        while the device is discovered, 0 publishes them only when the
+        device becomes available
+    diagnostics_thread : MQTT_Diagnostics_Thread
+        the thread publishing the diagnostics, None when not running
+    serializer : JsonSerializer
+        encodes the state, diagnostics and config payloads
+    flush_interval : float
+        the interval in seconds at which the latest state of each topic
+        is published, 0 publishes every state as it comes
+    coalescer : Coalescer
+        the states waiting for the next flush, None when flush_interval
+        is 0
+    flush_thread : MQTT_Flush_Thread
+        the thread flushing the states, None when not running
+    rediscovery : MQTT_Rediscovery_Thread
+        the latest rediscovery, None before Home Assistant first comes
+        online, see start_rediscovery()
+    store : ReadingStore
+        keeps the state published while the broker cannot be reached,
+        None unless store_path is configured, see publish_state()
+    replay : MQTT_Replay_Thread
+        the latest replay of the store, None before the first
+    outbox : Outbox
+        the window of QoS 1 and 2 messages awaiting acknowledgement by
+        the broker and the bounded queue of those waiting for it
+    publish_trace : PublishTrace
+        counts and traces the published messages
+    metrics : MetricsRegistry
+        the registry in which the publication counts, failures and
+        durations and the depth of paho's queues are kept
     __logger : logging.Logger
         the logger instance used to log messages
+
+    Note
+    ----
+    One client, and so one connection and one network loop, serves any
+    number of devices. The device given to the constructor is the first,
+    others are added with add_device(). The discovery, availability and
+    clearing methods apply to every device when called without one, and
+    Home Assistant coming online rediscovers them all.
+
+    Example
+    -------
+    client = MQTTClient('bme280', office, office_bme280, config)
+    client.add_device(garage, garage_bme280)
+    client.connect_mqtt()
+    client.loop_start()
+    client.publish_discovery()
+    client.publish_available()
     '''
 
+    class Entry:
+        '''A device served by the client
+
+        Parameters
+        ----------
+        device : HADevice
+            the description of the data published for the device
+        smbus_device : SMBusDevice
+            the physical device from which the data is obtained
+
+        Attributes
+        ----------
+        publisher : MQTT_Publisher_Thread
+            publishes the state of the device, None while the device is
+            not discovered
+        '''
+
+        def __init__(self, device: HADevice, smbus_device: SMBusDevice):
+            self.device = device
+            self.smbus_device = smbus_device
+            self.publisher = None
+
     def on_connect(client, userdata, flags, rc, properties=None) -> None:
         '''Callback function called when the client connects to the broker.'''
         client.state.rc = rc
@@ -177,6 +775,7 @@ class MQTTClient(mqtt.Client):
             client.__logger.debug(
                 'Subscribed to HA status topic: %s', client.status_topic
             )
+            client.start_replay()
 
         else:
             client.state.error = [connack_string(rc)]
@@ -188,17 +787,24 @@ class MQTTClient(mqtt.Client):
         else:
             client.state.error = [connack_string(rc)]
 
+    def on_publish(client, userdata, mid, reason_code, properties=None) -> None:
+        '''Callback function called when the broker has acknowledged a
+        QoS 1 or 2 message, or a QoS 0 message has been written. The
+        messages waiting in the outbox for the window are sent.'''
+        for message in client.outbox.ack(mid):
+            client._send_outbox(message)
+
     def on_message(client, userdata, xxx, msg) -> None:
         '''Callback function to handle received messages'''
         payload = msg.payload.decode('utf-8').strip().lower()
         if msg.topic == client.status_topic:
             if payload == 'online':
                 client.__logger.info('Home Assistant is ONLINE')
-                client.publish_discovery(client.device)
-                client.publish_available(client.device)
+                client.start_rediscovery()
             elif payload == 'offline':
                 client.__logger.warning('Home Assistant is OFFLINE')
-                client.is_discovered = False
+                client.stop_rediscovery()
+                client.state.discovered = False
             else:
                 client.__logger.debug('HA status unknown payload: %s', payload)
         elif msg.topic == f'{client.config_topic}/get':
@@ -213,6 +819,7 @@ class MQTTClient(mqtt.Client):
         device: HADevice,
         smbus_device: SMBusDevice,
         config: BasicConfig = None,
+        metrics: MetricsRegistry = None,
     ):
         '''
         Paameters
@@ -239,6 +846,32 @@ class MQTTClient(mqtt.Client):
                 the quality of service to be used with the MQTT broker
             retain: bool
                 the retain policy to be used with the MQTT broker
+            max_inflight : int
+                the QoS 1 and 2 messages awaiting acknowledgement before
+                others are queued in the outbox
+            max_queued : int
+                the most messages waiting in the outbox
+            queue_policy : str
+                'drop_oldest' or 'coalesce', see Outbox
+            store_path : str
+                the directory in which the store of each client is kept,
+                None for no store
+            store_max_bytes : int
+                the most bytes kept by the store of the client
+            replay_rate : float
+                the stored messages published per second once the
+                client has reconnected
+            replay_burst : int
+                the stored messages published at once
+            flush_interval : float
+                the seconds between publications of the latest state of
+                each topic, 0 publishes every state as it comes
+            serializer : str
+                the JSON library encoding the state, diagnostics and
+                config payloads, see serializer.get_serializer()
+        metrics : MetricsRegistry
+            the registry in which the client's metrics are kept, labelled
+            with the client_prefix. Default: REGISTRY
         '''
         super().__init__(
             mqtt_enums.CallbackAPIVersion.VERSION2,
@@ -258,15 +891,176 @@ class MQTTClient(mqtt.Client):
         self.qos = mqtt_config.qos
         self.retain = mqtt_config.retain
         self.status_topic = mqtt_config.status_topic
+        self.diagnostics_interval = mqtt_config.diagnostics_interval
+        self.rediscovery_rate = mqtt_config.rediscovery_rate
+        self.rediscovery_burst = mqtt_config.rediscovery_burst
+        self.rediscovery_jitter = mqtt_config.rediscovery_jitter
+        if self.rediscovery_rate <= 0:
+            raise Exception(
+                f'rediscovery_rate ({self.rediscovery_rate}) must be greater than 0'
+            )
+        if self.rediscovery_burst < 1:
+            raise Exception(
+                f'rediscovery_burst ({self.rediscovery_burst}) must be at least 1'
+            )
+        if self.rediscovery_jitter < 0:
+            raise Exception(
+                f'rediscovery_jitter ({self.rediscovery_jitter}) cannot be negative'
+            )
+        self.rediscovery = None
+        self.serializer = get_serializer(mqtt_config.serializer)
+        self.flush_interval = mqtt_config.flush_interval
+        self.coalescer = Coalescer() if self.flush_interval > 0 else None
+        self.flush_thread = None
+        self.replay_rate = mqtt_config.replay_rate
+        self.replay_burst = mqtt_config.replay_burst
+        if self.replay_rate <= 0:
+            raise Exception(f'replay_rate ({self.replay_rate}) must be greater than 0')
+        if self.replay_burst < 1:
+            raise Exception(f'replay_burst ({self.replay_burst}) must be at least 1')
+        self.replay = None
+        self._replay_lock = threading.Lock()
+        self.store = None
+        if mqtt_config.store_path:
+            self.store = ReadingStore(
+                os.path.join(mqtt_config.store_path, client_prefix),
+                max_bytes=mqtt_config.store_max_bytes,
+            )
+        self.outbox = Outbox(
+            mqtt_config.max_inflight, mqtt_config.max_queued, mqtt_config.queue_policy
+        )
+        # the outbox keeps the window, so paho never queues behind its own
+        self.max_inflight_messages = mqtt_config.max_inflight
+        self.publish_trace = PublishTrace(
+            logging.getLogger(__name__ + '.publish'),
+            summary_interval=mqtt_config.publish_summary_interval,
+        )
+        self.metrics = metrics or REGISTRY
+        self._published = self.metrics.counter(
+            'mqtt_published_total', 'messages passed to paho', ('topic',)
+        )
+        self._published_bytes = self.metrics.counter(
+            'mqtt_published_bytes_total', 'payload bytes passed to paho', ('topic',)
+        )
+        self._publish_failures = self.metrics.counter(
+            'mqtt_publish_failures_total', 'messages paho did not accept', ('topic',)
+        )
+        self._publish_seconds = self.metrics.histogram(
+            'mqtt_publish_seconds', 'the time taken by publish()', ('client',)
+        )
+        self._replayed = self.metrics.counter(
+            'mqtt_replayed_total',
+            'stored messages published after reconnecting',
+            ('client',),
+        )
+        # the metrics read from the client while it is connected, see
+        # _add_metric_functions()
+        self._metric_functions = [
+            (
+                self.metrics.gauge(
+                    'mqtt_queued_packets',
+                    'packets waiting to be written by paho',
+                    ('client',),
+                ),
+                lambda: len(self._out_packet),
+            ),
+            (
+                self.metrics.gauge(
+                    'mqtt_inflight_messages',
+                    'QoS 1 and 2 messages not yet acknowledged',
+                    ('client',),
+                ),
+                lambda: len(self._out_messages),
+            ),
+            (
+                self.metrics.gauge(
+                    'mqtt_connected', '1 when connected to the broker', ('client',)
+                ),
+                lambda: int(bool(self.state.connected)),
+            ),
+            (
+                self.metrics.gauge(
+                    'mqtt_rediscovery_pending',
+                    'devices waiting to be announced after Home Assistant came online',
+                    ('client',),
+                ),
+                lambda: 0 if self.rediscovery is None else self.rediscovery.pending,
+            ),
+        ]
+        if self.store is not None:
+            for name, help, function in (
+                ('messages', 'messages waiting in the store', len),
+                ('bytes', 'the size of the store', lambda store: store.bytes),
+                (
+                    'dropped',
+                    'stored messages dropped to keep the store within its size',
+                    lambda store: store.dropped,
+                ),
+            ):
+                self._metric_functions.append(
+                    (
+                        self.metrics.gauge(f'mqtt_store_{name}', help, ('client',)),
+                        lambda function=function: function(self.store),
+                    )
+                )
+        if self.coalescer is not None:
+            self._metric_functions += [
+                (
+                    self.metrics.gauge(
+                        'mqtt_state_pending',
+                        'states waiting for the next flush',
+                        ('client',),
+                    ),
+                    lambda: len(self.coalescer),
+                ),
+                (
+                    self.metrics.gauge(
+                        'mqtt_state_coalesced',
+                        'states replaced by a newer one before they were flushed',
+                        ('client',),
+                    ),
+                    lambda: self.coalescer.coalesced,
+                ),
+            ]
+        self._metric_functions.append(
+            (
+                self.metrics.gauge(
+                    'mqtt_outbox_queued',
+                    'QoS 1 and 2 messages waiting for the in-flight window',
+                    ('client',),
+                ),
+                lambda: self.outbox.queued,
+            )
+        )
+        for name, help in (
+            ('acked', 'QoS 1 and 2 messages acknowledged by the broker'),
+            ('coalesced', 'queued messages replaced by a newer one for their topic'),
+            ('dropped', 'messages dropped because the outbox was full'),
+        ):
+            self._metric_functions.append(
+                (
+                    self.metrics.counter(
+                        f'mqtt_outbox_{name}_total', help, ('client',)
+                    ),
+                    lambda name=name: getattr(self.outbox, name),
+                )
+            )
+        self.client_prefix = client_prefix
+        self._add_metric_functions()
         self.device = device
         self.smbus_device = smbus_device
+        self.devices: Dict[str, MQTTClient.Entry] = {
+            device.discovery_topic: MQTTClient.Entry(device, smbus_device)
+        }
+        self._devices_lock = threading.Lock()
         self.state = State()
         self.connected = False
         self.connected_flag = False
         self.on_connect = MQTTClient.on_connect
         self.on_disconnect = MQTTClient.on_disconnect
+        self.on_publish = MQTTClient.on_publish
         self.on_messagee = MQTTClient.on_message
-        self.publisher_thread = None
+        self.diagnostics_thread = None
         super().user_data_set(self)
         self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
 
@@ -275,6 +1069,7 @@ class MQTTClient(mqtt.Client):
         route = 'connect_mqtt'
         super().username_pw_set(self.username, self.password)
         self.state = State()
+        self._add_metric_functions()
         self.__logger.info(
             '%s connecting to broker at %s:%s', route, self.broker_address, self.port
         )
@@ -290,10 +1085,29 @@ class MQTTClient(mqtt.Client):
             return connected
         return None
 
+    def _add_metric_functions(self) -> None:
+        '''read the metrics of the client from it when they are rendered'''
+        for metric, function in self._metric_functions:
+            metric.set_function(function, client=self.client_prefix)
+
+    def _remove_metric_functions(self) -> None:
+        '''remove the metrics of the client, so that the registry no longer
+        holds a reference to it'''
+        for metric, _ in self._metric_functions:
+            metric.remove(client=self.client_prefix)
+
+    def disconnect(self, *args, **kwargs) -> mqtt_enums.MQTTErrorCode:
+        '''disconnect from the MQTT broker, see paho Client.disconnect()
+
+        The metrics of the client are removed until it connects again.
+        '''
+        self._remove_metric_functions()
+        return super().disconnect(*args, **kwargs)
+
     def disconnect_mqtt(self) -> int:
         '''disconnect from the MQTT broker'''
         route = 'disconnect_mqtt'
-        mqttErrorCode = super().disconnect()
+        mqttErrorCode = self.disconnect()
         if mqttErrorCode != 0:
             self.__logger.critical(
                 '%s error %s in disconnect_mqtt', route, mqttErrorCode
@@ -317,22 +1131,32 @@ class MQTTClient(mqtt.Client):
     def publish(
         self,
         topic: str,
-        message: str,
+        message: str | bytes,
         qos: int = None,
         retain: bool = True,
         properties: mqtt_properties.Properties | None = None,
     ):
         '''publish a messge to Home Assistant via the MQTT broker
 
+        Each message is counted by publish_trace, which logs it to the
+        'ha_mqtt_pi_smbus.mqtt_client.publish' logger at DEBUG and a
+        per-topic summary at INFO (see PublishTrace), and in metrics.
+
+        QoS 1 and 2 messages go through the outbox: while max_inflight
+        of them await acknowledgement by the broker the others wait
+        there, so a slow or stalled broker holds back a bounded number
+        of messages rather than all of them.
+
         Parameters
         ----------
         topic : str
             the topic which is used to send the message, it might be
             either a state topic, or a discovery topic
-        message : str
+        message : str | bytes
             the message which is to be sent. This will normally a
             json-encoded dict containing state data, discovery data,
-            or a zero-length un-discovery message
+            or a zero-length un-discovery message. Pre-encoded bytes are
+            passed to paho unchanged
         qos : int
             0 - only once - 'fire and forget'
             1 - at least once
@@ -341,22 +1165,75 @@ class MQTTClient(mqtt.Client):
             retain the message in the MQTT broker
         properties : paho.mqtt.properties.Properties
             A set of properties for the message, if desired
+
+        Return
+        ------
+        MQTTMessageInfo : paho's result, None when the message was queued
+        or dropped by the outbox
         '''
+        if not qos:
+            return self._send(topic, message, qos, retain, properties)
+        # acknowledgements are handled with this lock held, so none can
+        # arrive before the outbox knows the mid
+        with self._out_message_mutex:
+            outgoing = Message(topic, message, qos, retain, properties)
+            if not self.outbox.put(outgoing):
+                return None
+            return self._send_outbox(outgoing)
+
+    def _send_outbox(self, message: Message) -> mqtt.MQTTMessageInfo:
+        '''send a message for which the outbox has a slot
+
+        Parameters
+        ----------
+        message : Message
+            the message let through by Outbox.put() or Outbox.ack()
+
+        Return
+        ------
+        MQTTMessageInfo : paho's result
+        '''
+        with self._out_message_mutex:
+            try:
+                result = self._send(
+                    message.topic,
+                    message.payload,
+                    message.qos,
+                    message.retain,
+                    message.properties,
+                )
+            except Exception:
+                self.outbox.release()
+                raise
+            # paho keeps the messages it could not send until it reconnects
+            if result.rc in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                self.outbox.sent(result.mid)
+            else:
+                self.outbox.release()
+            return result
+
+    def _send(
+        self,
+        topic: str,
+        message: str | bytes,
+        qos: int,
+        retain: bool,
+        properties: mqtt_properties.Properties | None,
+    ) -> mqtt.MQTTMessageInfo:
+        '''pass a message to paho, counting and tracing it'''
         route = 'publish'
-        self.__logger.info(
-            '%s publishing to Topic = %s, Payload = %s, '
-            + 'QOS = %s, Retain = %s, Properties = %s',
-            route,
-            topic,
-            message,
-            qos,
-            retain,
-            properties,
-        )
+        start = time.monotonic()
         result = super().publish(topic, message, qos, retain, properties)
+        self._publish_seconds.observe(
+            time.monotonic() - start, client=self.client_prefix
+        )
         status = result[0]
         mid = result[1]
+        self.publish_trace.record(topic, message, qos, retain, status)
+        self._published.inc(topic=topic)
+        self._published_bytes.inc(len(message) if message else 0, topic=topic)
         if status != 0:
+            self._publish_failures.inc(topic=topic)
             self.__logger.error(
                 '%s Failed to send message to topic %s, rc %s, mid %s',
                 route,
@@ -366,28 +1243,315 @@ class MQTTClient(mqtt.Client):
             )
         return result
 
-    def publish_discovery(self, device: HADevice) -> None:
-        '''Publish a discovery message for each sensor in the device
+    @property
+    def publisher_thread(self) -> MQTT_Publisher_Thread | None:
+        '''the publisher of device, None while it is not discovered'''
+        entry = self.devices.get(self.device.discovery_topic)
+        return None if entry is None else entry.publisher
+
+    def add_device(self, device: HADevice, smbus_device: SMBusDevice) -> None:
+        '''Serve another device from the client
+
+        While the client is discovered the device is discovered and made
+        available at once.
 
         Parameters
         ----------
-        sensors : Dict[str, Any]
-            a set of sensor_name, sensor pairs
+        device : HADevice
+            the description of the data to be published, its
+            discovery_topic must differ from those of the other devices
+            (see the object_id of HADevice)
+        smbus_device : SMBusDevice
+            the physical device from which the data is obtained
+        '''
+        with self._devices_lock:
+            if device.discovery_topic in self.devices:
+                raise Exception(
+                    f'a device with the discovery topic {device.discovery_topic} '
+                    + 'has already been added, give each device an object_id'
+                )
+            self.devices[device.discovery_topic] = MQTTClient.Entry(
+                device, smbus_device
+            )
+        if self.state.discovered:
+            self.publish_discovery(device)
+            self.publish_available(device)
 
+    def remove_device(self, device: HADevice) -> None:
+        '''Stop serving a device, its discovery is cleared first
+
+        The device given to the constructor cannot be removed, the
+        client's config topic is that of this device.
+
+        Parameters
+        ----------
+        device : HADevice
+            a device added to the client
         '''
-        self.device = device
-        self.publish(
-            self.device.discovery_topic,
-            json.dumps(device.discovery_payload),
-            qos=self.qos,
-            retain=self.retain,
-        )
-        self.publisher_thread = MQTT_Publisher_Thread(
-            self, self.device, self.smbus_device
-        )
-        self.publisher_thread.start()
+        if device.discovery_topic == self.device.discovery_topic:
+            raise Exception(
+                f'device {device.discovery_topic} is the client\'s own device '
+                + 'and cannot be removed'
+            )
+        entry = self._entries(device)[0]
+        if entry.publisher is not None:
+            self.clear_discovery(device)
+        with self._devices_lock:
+            del self.devices[device.discovery_topic]
+
+    def _entries(self, device: HADevice = None) -> list[MQTTClient.Entry]:
+        '''return the entry of the device, or of every device if None'''
+        with self._devices_lock:
+            if device is None:
+                return list(self.devices.values())
+            entry = self.devices.get(device.discovery_topic)
+        if entry is None:
+            raise Exception(
+                f'device {device.discovery_topic} has not been added to the client'
+            )
+        return [entry]
+
+    def _start_publisher(self, entry: MQTTClient.Entry) -> None:
+        '''start publishing the state of the device of the entry'''
+        entry.publisher = MQTT_Publisher_Thread(self, entry.device, entry.smbus_device)
+        entry.publisher.start()
+
+    def _stop_publisher(self, entry: MQTTClient.Entry) -> None:
+        '''stop publishing the state of the device of the entry'''
+        entry.publisher.clear_do_run()
+        entry.publisher.join()
+        entry.publisher = None
+
+    def publish_discovery(self, device: HADevice = None) -> None:
+        '''Publish the discovery message of a device and start publishing
+        its state
+
+        A device which is already discovered is announced again, its
+        state publisher carries on.
+
+        Parameters
+        ----------
+        device : HADevice
+            a device added to the client. Default: None, every device
+        '''
+        for entry in self._entries(device):
+            self.publish(
+                entry.device.discovery_topic,
+                entry.device.discovery_json(),
+                qos=self.qos,
+                retain=self.retain,
+            )
+            if entry.publisher is None:
+                self._start_publisher(entry)
+        self.start_diagnostics()
+        self.start_flush()
         self.state.discovered = True
 
+    def publish_state(self, device: HADevice, data: Dict[str, Any]):
+        '''publish the state of a device, or keep it in the store while
+        the broker cannot be reached
+
+        With a flush_interval the state waits in the coalescer, replacing
+        any earlier state of the device not yet flushed, and only the
+        latest is published at the next flush, see flush_states().
+
+        Once the store holds messages the new states join them, so that
+        they are published in order by the replay which starts when the
+        client reconnects, see start_replay().
+
+        Parameters
+        ----------
+        device : HADevice
+            the device whose state_topic is used
+        data : Dict[str, Any]
+            the state, encoded as JSON by the serializer
+
+        Return
+        ------
+        MQTTMessageInfo : paho's result, None when the state was kept for
+        the next flush, stored or held back by the outbox
+        '''
+        payload = self.serializer.dumps(data)
+        if self.coalescer is not None:
+            self.coalescer.put(device.state_topic, payload)
+            return None
+        return self._send_state(device.state_topic, payload)
+
+    def _send_state(self, topic: str, payload: bytes):
+        '''publish a state, or add it to the store, see publish_state()'''
+        if self.store is not None:
+            with self._replay_lock:
+                if len(self.store) or not mqtt.Client.is_connected(self):
+                    self.store.append(topic, payload)
+                    return None
+        return self.publish(topic, payload, qos=self.qos, retain=self.retain)
+
+    def flush_states(self) -> int:
+        '''publish the latest state of each topic kept since the last
+        flush
+
+        Parameters
+        ----------
+        None
+
+        Return
+        ------
+        int : the number of states published
+        '''
+        if self.coalescer is None:
+            return 0
+        pending = self.coalescer.take()
+        for topic, payload in pending.items():
+            self._send_state(topic, payload)
+        return len(pending)
+
+    def start_flush(self) -> None:
+        '''Start flushing the states every flush_interval seconds, unless
+        they are already being flushed or the interval is 0
+
+        Parameters
+        ----------
+        None
+        '''
+        if self.coalescer is None or self.flush_thread is not None:
+            return
+        self.flush_thread = MQTT_Flush_Thread(self, self.flush_interval)
+        self.flush_thread.start()
+
+    def stop_flush(self) -> None:
+        '''Stop flushing the states, those not yet flushed are dropped
+
+        Parameters
+        ----------
+        None
+        '''
+        if self.flush_thread is None:
+            return
+        self.flush_thread.clear_do_run()
+        self.flush_thread.join()
+        self.flush_thread = None
+        self.coalescer.take()
+
+    def start_replay(self) -> None:
+        '''Publish the messages kept in the store, as the client has
+        connected
+
+        The messages are published by a MQTT_Replay_Thread rather than
+        by the caller, normally paho's network thread. A replay already
+        running is stopped and the new one carries on from where it got
+        to. Nothing is done without a store, or with an empty one.
+
+        Parameters
+        ----------
+        None
+        '''
+        self.stop_replay()
+        if self.store is None or not len(self.store):
+            return
+        self.replay = MQTT_Replay_Thread(self)
+        self.replay.start()
+
+    def stop_replay(self) -> None:
+        '''Stop publishing the stored messages, if a replay is running
+
+        Parameters
+        ----------
+        None
+        '''
+        if self.replay is not None:
+            self.replay.clear_do_run()
+
+    def start_rediscovery(self) -> None:
+        '''Announce every device again, as Home Assistant has come online
+
+        The announcements are made by a MQTT_Rediscovery_Thread rather
+        than by the caller, normally paho's network thread, which must
+        keep serving the connection. A rediscovery already running is
+        stopped, its devices are announced again by the new one.
+
+        Parameters
+        ----------
+        None
+        '''
+        self.stop_rediscovery()
+        self.rediscovery = MQTT_Rediscovery_Thread(self)
+        self.rediscovery.start()
+
+    def stop_rediscovery(self) -> None:
+        '''Stop announcing the devices, if a rediscovery is running
+
+        Parameters
+        ----------
+        None
+        '''
+        if self.rediscovery is not None:
+            self.rediscovery.clear_do_run()
+
+    def start_diagnostics(self) -> None:
+        '''Start publishing the diagnostics every diagnostics_interval
+        seconds, unless they are already being published or the interval
+        is 0
+
+        Parameters
+        ----------
+        None
+        '''
+        if not self.diagnostics_interval or self.diagnostics_thread is not None:
+            return
+        self.diagnostics_thread = MQTT_Diagnostics_Thread(
+            self, self.diagnostics_interval
+        )
+        self.diagnostics_thread.start()
+
+    def stop_diagnostics(self) -> None:
+        '''Stop publishing the diagnostics periodically
+
+        Parameters
+        ----------
+        None
+        '''
+        if self.diagnostics_thread is None:
+            return
+        self.diagnostics_thread.clear_do_run()
+        self.diagnostics_thread.join()
+        self.diagnostics_thread = None
+
+    def publish_diagnostics(
+        self, device: HADevice | HASensor = None, diagnostics: Dict[str, Any] = None
+    ) -> None:
+        '''Publish a diagnostics snapshot once for the device
+
+        All the diagnostic sensors of a device share one topic, so one
+        message updates them all.
+
+        Parameters
+        ----------
+        device : HADevice | HASensor
+            a device, or a diagnostic sensor. Default: None, every
+            device, all given the same snapshot
+        diagnostics : Dict[str, Any]
+            the snapshot to publish. Default: None, a new snapshot is
+            taken with get_diagnostics()
+        '''
+        if device is None:
+            topics = []
+            for entry in self._entries():
+                topic = entry.device.diagnostics_topic
+                if topic not in topics:
+                    topics.append(topic)
+        elif isinstance(device, HADevice):
+            topics = [device.diagnostics_topic]
+        else:
+            topics = [device.discovery_payload['json_attributes_topic']]
+        topics = [topic for topic in topics if topic is not None]
+        if not topics:
+            return
+        if diagnostics is None:
+            diagnostics = get_diagnostics()
+        payload = self.serializer.dumps(diagnostics)
+        for topic in topics:
+            self.publish(topic, payload, qos=self.qos, retain=self.retain)
+
     def publish_config(self, device: HADevice):
         '''Publish an available message for the given sensor or each sensor
         in the device
@@ -400,24 +1564,44 @@ class MQTTClient(mqtt.Client):
         '''
         return self.publish(
             f'{self.config_topic}/state',
-            json.dumps(to_dict(self.config.sanitize())),
+            self.serializer.dumps(to_dict(self.config.sanitize())),
             qos=self.qos,
             retain=self.retain,
         )
 
-    def publish_available(self, device: HADevice | HASensor) -> None:
+    def publish_available(
+        self, device: HADevice | HASensor = None, diagnostics: Dict[str, Any] = None
+    ) -> None:
         '''Publish an available message for the given sensor or each sensor
         in the device
 
+        The diagnostic sensors of a device are made available by one
+        publication of a diagnostics snapshot.
+
         Parameters
         ----------
         device : HADevice | HASensor
-            a device or sensor
+            a device or sensor. Default: None, every device, which share
+            one diagnostics snapshot
+        diagnostics : Dict[str, Any]
+            the diagnostics snapshot to publish. Default: None, a new
+            snapshot is taken with get_diagnostics()
 
         '''
+        if device is None:
+            for entry in self._entries():
+                for sensor in entry.device.sensors:
+                    if not sensor.diagnostic:
+                        self.publish_available(sensor)
+                if entry.device.diagnostics_topic is not None:
+                    diagnostics = diagnostics or get_diagnostics()
+                    self.publish_diagnostics(entry.device, diagnostics)
+            return
         if isinstance(device, HADevice):
             for sensor in device.sensors:
-                self.publish_available(sensor)
+                if not sensor.diagnostic:
+                    self.publish_available(sensor)
+            self.publish_diagnostics(device, diagnostics)
             return
         if not isinstance(device, HASensor):
             raise Exception(
@@ -425,42 +1609,29 @@ class MQTTClient(mqtt.Client):
             )  # pragma: no cover
         sensor = device
         if sensor.diagnostic:
-            try:
-                __version__ = version('ha_mqtt_pi_smbus')
-            except PackageNotFoundError:
-                __version__ = '0.0.0'
-            temperature = get_temperature()
-            sensor.diagnosticData = {
-                'status': 'OK',
-                'cpu_temperature': temperature,
-                'version': __version__,
-                'uptime': get_uptime(),
-                'last_restart': get_last_restart(),
-            }
-            self.publish(
-                sensor.discovery_payload['json_attributes_topic'],
-                json.dumps(sensor.diagnosticData),
-                qos=self.qos,
-                retain=self.retain,
-            )
+            self.publish_diagnostics(sensor, diagnostics)
         else:
             self.publish(
                 sensor.availability.topic,
-                json.dumps({'availability': sensor.availability.payload_available}),
+                sensor.availability_json(True),
                 qos=self.qos,
                 retain=self.retain,
             )
 
-    def publish_not_available(self, device: HADevice | HASensor) -> None:
+    def publish_not_available(self, device: HADevice | HASensor = None) -> None:
         '''Publish an unvailable message for the sensor or each sensor
         in the device
 
         Parameters
         ----------
         device : HADevice | HASensor
-            a device or a sensor
+            a device or a sensor. Default: None, every device
 
         '''
+        if device is None:
+            for entry in self._entries():
+                self.publish_not_available(entry.device)
+            return
         if isinstance(device, HADevice):
             for sensor in device.sensors:
                 self.publish_not_available(sensor)
@@ -472,28 +1643,35 @@ class MQTTClient(mqtt.Client):
         sensor = device
         self.publish(
             sensor.availability.topic,
-            json.dumps({'availability': sensor.availability.payload_not_available}),
+            sensor.availability_json(False),
             qos=self.qos,
             retain=self.retain,
         )
 
-    def clear_discovery(self, device: HADevice) -> None:
+    def clear_discovery(self, device: HADevice = None) -> None:
         '''Publish a clear discovery message for each sensor in the device
+        and stop publishing its state
+
+        The diagnostics stop, and the client is no longer discovered, once
+        no device is discovered.
 
         Parameters
         ----------
-        sensors : Dict[str, Any]
-            a set of sensor_name, sensor pairs
+        device : HADevice
+            a device added to the client. Default: None, every device
 
         '''
-        self.publish_not_available(device)
-        self.publish(
-            device.discovery_topic,
-            json.dumps(device.undiscovery_payload1),
-            qos=self.qos,
-            retain=self.retain,
-        )
-        self.state.discovered = False
-        self.publisher_thread.clear_do_run()
-        self.publisher_thread.join()
-        self.publisher_thread = None
+        for entry in self._entries(device):
+            self.publish_not_available(entry.device)
+            self.publish(
+                entry.device.discovery_topic,
+                entry.device.undiscovery_json(),
+                qos=self.qos,
+                retain=self.retain,
+            )
+            if entry.publisher is not None:
+                self._stop_publisher(entry)
+        if all(entry.publisher is None for entry in self._entries()):
+            self.state.discovered = False
+            self.stop_diagnostics()
+            self.stop_flush()
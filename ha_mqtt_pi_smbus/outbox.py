@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import collections
+import itertools
+import threading
+from typing import Any, Dict, List
+
+POLICIES = ('drop_oldest', 'coalesce')
+
+
+class Message:
+    '''A message waiting in an Outbox
+
+    Parameters
+    ----------
+    topic : str
+        the topic to which the message is published
+    payload : str | bytes
+        the payload of the message
+    qos : int
+        the quality of service of the message
+    retain : bool
+        retain the message in the MQTT broker
+    properties : paho.mqtt.properties.Properties
+        the properties of the message, or None
+    '''
+
+    __slots__ = ('topic', 'payload', 'qos', 'retain', 'properties')
+
+    def __init__(
+        self,
+        topic: str,
+        payload: str | bytes,
+        qos: int,
+        retain: bool,
+        properties: Any = None,
+    ):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.properties = properties
+
+
+class Outbox:
+    '''The window of unacknowledged QoS 1 and 2 messages of a client and
+    the bounded queue of those waiting for it
+
+    At most max_inflight messages are passed to paho without being
+    acknowledged by the broker, paho's own queue for the others is
+    unbounded. The rest wait here, up to max_queued of them, in the
+    order in which they were published. When the queue is full the
+    oldest message is dropped. With the 'coalesce' policy a message
+    replaces the one already waiting for its topic, keeping its place in
+    the queue, so a stalled broker gets only the latest state of each
+    topic when it recovers.
+
+    The outbox does not publish anything itself: put() says whether the
+    caller may send a message now, sent() records the mid paho gave it,
+    and ack() returns the messages which the acknowledgement lets
+    through.
+
+    Parameters
+    ----------
+    max_inflight : int
+        the most messages awaiting acknowledgement. Default: 20
+    max_queued : int
+        the most messages waiting for the window, 0 drops the messages
+        for which there is no room. Default: 100
+    policy : str
+        'drop_oldest' or 'coalesce'. Default: 'coalesce'
+
+    Attributes
+    ----------
+    published : int
+        the messages passed to paho
+    acked : int
+        the messages acknowledged by the broker
+    coalesced : int
+        the waiting messages replaced by a newer one for their topic
+    dropped : int
+        the messages dropped because the queue was full
+
+    Example
+    -------
+    outbox = Outbox(max_inflight=10, max_queued=50)
+    if outbox.put(Message(topic, payload, 1, False)):
+        outbox.sent(client.publish(topic, payload, 1).mid)
+    '''
+
+    def __init__(
+        self, max_inflight: int = 20, max_queued: int = 100, policy: str = 'coalesce'
+    ):
+        if max_inflight < 1:
+            raise Exception(f'max_inflight ({max_inflight}) must be at least 1')
+        if max_queued < 0:
+            raise Exception(f'max_queued ({max_queued}) cannot be negative')
+        if policy not in POLICIES:
+            raise Exception(f'policy ({policy}) must be one of {", ".join(POLICIES)}')
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.policy = policy
+        self.published = 0
+        self.acked = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._inflight = set()
+        # slots taken by put() for messages which paho has not numbered yet
+        self._reserved = 0
+        self._queue: collections.OrderedDict = collections.OrderedDict()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def inflight(self) -> int:
+        '''the messages sent and not yet acknowledged'''
+        return len(self._inflight) + self._reserved
+
+    @property
+    def queued(self) -> int:
+        '''the messages waiting for the window'''
+        return len(self._queue)
+
+    def _room(self) -> bool:
+        return len(self._inflight) + self._reserved < self.max_inflight
+
+    def put(self, message: Message) -> bool:
+        '''offer a message to the outbox
+
+        Parameters
+        ----------
+        message : Message
+            the message to be published
+
+        Return
+        ------
+        bool : True when the caller must send the message now and then
+        call sent() or release(), False when it has been queued or
+        dropped
+        '''
+        with self._lock:
+            if not self._queue and self._room():
+                self._reserved += 1
+                return True
+            if self.policy == 'coalesce':
+                key = message.topic
+                if key in self._queue:
+                    self._queue[key] = message
+                    self.coalesced += 1
+                    return False
+            else:
+                key = next(self._sequence)
+            if len(self._queue) >= self.max_queued:
+                if not self._queue:
+                    self.dropped += 1
+                    return False
+                self._queue.popitem(last=False)
+                self.dropped += 1
+            self._queue[key] = message
+            return False
+
+    def sent(self, mid: int) -> None:
+        '''record the mid of a message which put() or ack() let through
+
+        Parameters
+        ----------
+        mid : int
+            the message id given to the message by paho
+        '''
+        with self._lock:
+            self._reserved -= 1
+            self._inflight.add(mid)
+            self.published += 1
+
+    def release(self) -> None:
+        '''give back the slot of a message which paho did not accept
+
+        Parameters
+        ----------
+        None
+        '''
+        with self._lock:
+            self._reserved -= 1
+
+    def ack(self, mid: int) -> List[Message]:
+        '''record the acknowledgement of a message
+
+        Parameters
+        ----------
+        mid : int
+            the message id acknowledged by the broker, those of messages
+            which did not pass through the outbox are ignored
+
+        Return
+        ------
+        List[Message] : the waiting messages which may now be sent, each
+        to be followed by a call of sent() or release()
+        '''
+        with self._lock:
+            if mid not in self._inflight:
+                return []
+            self._inflight.remove(mid)
+            self.acked += 1
+            messages = []
+            while self._queue and self._room():
+                messages.append(self._queue.popitem(last=False)[1])
+                self._reserved += 1
+            return messages
+
+    def stats(self) -> Dict[str, int]:
+        '''the state and counts of the outbox
+
+        Parameters
+        ----------
+        None
+
+        Return
+        ------
+        Dict[str, int] : inflight, queued, published, acked, coalesced and
+        dropped
+        '''
+        with self._lock:
+            return {
+                'inflight': len(self._inflight) + self._reserved,
+                'queued': len(self._queue),
+                'published': self.published,
+                'acked': self.acked,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+            }
+
+
+class Coalescer:
+    '''The latest pending payload of each topic
+
+    Payloads put() between two flushes replace each other, so however
+    fast the samples come each topic gets at most one message per flush,
+    carrying its latest state.
+
+    Attributes
+    ----------
+    coalesced : int
+        the payloads replaced before they were flushed
+    flushed : int
+        the payloads taken to be published
+
+    Example
+    -------
+    coalescer = Coalescer()
+    coalescer.put('office/state', payload)
+    for topic, payload in coalescer.take().items():
+        client.publish(topic, payload)
+    '''
+
+    def __init__(self):
+        self.coalesced = 0
+        self.flushed = 0
+        self._pending: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def put(self, topic: str, payload: str | bytes) -> None:
+        '''keep the payload until the next flush, replacing the one
+        pending for the topic
+
+        Parameters
+        ----------
+        topic : str
+            the topic to which the payload is to be published
+        payload : str | bytes
+            the message
+        '''
+        with self._lock:
+            if topic in self._pending:
+                self.coalesced += 1
+            self._pending[topic] = payload
+
+    def take(self) -> Dict[str, Any]:
+        '''take the pending payloads
+
+        Parameters
+        ----------
+        None
+
+        Return
+        ------
+        Dict[str, str | bytes] : the latest payload of each topic, in the
+        order in which the topics were first put since the last flush
+        '''
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self.flushed += len(pending)
+            return pending
@@ -159,6 +159,93 @@ class MQTTParser(WebParser):
             help='MQTT status topic for Last Will and testament, normally homeassistant/status, but configurable from Home Assistan MQTT1',
             type=str,
         )
+        self.add_argument(
+            '--mqtt_asyncio',
+            help='run the MQTT network traffic, sampling and publishing on an asyncio '
+            + 'event loop',
+            action='store_true',
+        )
+        self.add_argument(
+            '--mqtt_diagnostics_interval',
+            help='seconds between publications of the diagnostics, 0 only publishes '
+            + 'them when Home Assistant comes online, default(300)',
+            type=float,
+        )
+        self.add_argument(
+            '--mqtt_publish_summary_interval',
+            help='seconds between the per-topic publish summaries logged at INFO, 0 '
+            + 'disables them, default(300)',
+            type=float,
+        )
+        self.add_argument(
+            '--mqtt_rediscovery_rate',
+            help='devices announced per second when Home Assistant comes online, '
+            + 'default(10)',
+            type=float,
+        )
+        self.add_argument(
+            '--mqtt_rediscovery_burst',
+            help='devices announced at once when Home Assistant comes online, '
+            + 'default(5)',
+            type=int,
+        )
+        self.add_argument(
+            '--mqtt_rediscovery_jitter',
+            help='maximum random seconds added before each announcement when Home '
+            + 'Assistant comes online, default(1)',
+            type=float,
+        )
+        self.add_argument(
+            '--mqtt_max_inflight',
+            help='QoS 1 and 2 messages awaiting acknowledgement by the broker before '
+            + 'more are queued, default(20)',
+            type=int,
+        )
+        self.add_argument(
+            '--mqtt_max_queued',
+            help='QoS 1 and 2 messages queued while the broker is slow before the '
+            + 'oldest is dropped, default(100)',
+            type=int,
+        )
+        self.add_argument(
+            '--mqtt_queue_policy',
+            help='drop_oldest, or coalesce to keep only the latest queued message of '
+            + 'each topic, default(coalesce)',
+            choices=('drop_oldest', 'coalesce'),
+        )
+        self.add_argument(
+            '--mqtt_store_path',
+            help='directory in which the state is kept while the broker cannot be '
+            + 'reached, default(none)',
+            type=str,
+        )
+        self.add_argument(
+            '--mqtt_store_max_bytes',
+            help='the most bytes kept in the store of each client, default(16777216)',
+            type=int,
+        )
+        self.add_argument(
+            '--mqtt_replay_rate',
+            help='stored messages published per second after reconnecting, default(20)',
+            type=float,
+        )
+        self.add_argument(
+            '--mqtt_replay_burst',
+            help='stored messages published at once after reconnecting, default(100)',
+            type=int,
+        )
+        self.add_argument(
+            '--mqtt_flush_interval',
+            help='seconds between publications of the latest state of each device, 0 '
+            + 'publishes every state as it comes, default(0)',
+            type=float,
+        )
+        self.add_argument(
+            '--mqtt_serializer',
+            help='the JSON library for the state payloads, auto uses orjson or msgspec '
+            + 'when installed, default(auto)',
+            choices=('auto', 'orjson', 'msgspec', 'json'),
+        )
 
     def parse_args(self) -> None:
         super().parse_args()
@@ -185,6 +272,36 @@ class MQTTParser(WebParser):
             mqtt['expire_after'] = self.args.mqtt_expire_after
         if self.args.mqtt_status_topic:
             mqtt['status_topic'] = self.args.mqtt_status_topic
+        if self.args.mqtt_asyncio:
+            mqtt['asyncio'] = self.args.mqtt_asyncio
+        if self.args.mqtt_diagnostics_interval is not None:
+            mqtt['diagnostics_interval'] = self.args.mqtt_diagnostics_interval
+        if self.args.mqtt_publish_summary_interval is not None:
+            mqtt['publish_summary_interval'] = self.args.mqtt_publish_summary_interval
+        if self.args.mqtt_rediscovery_rate is not None:
+            mqtt['rediscovery_rate'] = self.args.mqtt_rediscovery_rate
+        if self.args.mqtt_rediscovery_burst is not None:
+            mqtt['rediscovery_burst'] = self.args.mqtt_rediscovery_burst
+        if self.args.mqtt_rediscovery_jitter is not None:
+            mqtt['rediscovery_jitter'] = self.args.mqtt_rediscovery_jitter
+        if self.args.mqtt_max_inflight is not None:
+            mqtt['max_inflight'] = self.args.mqtt_max_inflight
+        if self.args.mqtt_max_queued is not None:
+            mqtt['max_queued'] = self.args.mqtt_max_queued
+        if self.args.mqtt_queue_policy:
+            mqtt['queue_policy'] = self.args.mqtt_queue_policy
+        if self.args.mqtt_store_path:
+            mqtt['store_path'] = self.args.mqtt_store_path
+        if self.args.mqtt_store_max_bytes is not None:
+            mqtt['store_max_bytes'] = self.args.mqtt_store_max_bytes
+        if self.args.mqtt_replay_rate is not None:
+            mqtt['replay_rate'] = self.args.mqtt_replay_rate
+        if self.args.mqtt_replay_burst is not None:
+            mqtt['replay_burst'] = self.args.mqtt_replay_burst
+        if self.args.mqtt_flush_interval is not None:
+            mqtt['flush_interval'] = self.args.mqtt_flush_interval
+        if self.args.mqtt_serializer:
+            mqtt['serializer'] = self.args.mqtt_serializer
         self._config_dict['mqtt'] = mqtt
 
 
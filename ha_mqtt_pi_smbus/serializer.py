@@ -0,0 +1,134 @@
+'''Encode payloads as JSON with the fastest library available
+
+orjson and msgspec encode the state of a device several times faster
+than the standard library json module, which matters on a Pi Zero
+publishing many devices. Neither is required: get_serializer('auto')
+uses the first of them which is installed and falls back to json.
+Install them with pip install ha_mqtt_pi_smbus[fast].
+
+The fast libraries write compact JSON, without the spaces after ':' and
+',' which json.dumps() puts in, which is the same to Home Assistant.
+
+Example
+-------
+serializer = get_serializer()
+client.publish(topic, serializer.dumps(data))
+'''
+
+import json
+from typing import Any, Callable, List
+
+# the order in which 'auto' tries the libraries
+PREFERENCE = ('orjson', 'msgspec', 'json')
+
+
+class JsonSerializer:
+    '''Encode with the standard library json module'''
+
+    name = 'json'
+
+    def dumps(self, obj: Any, default: Callable[[Any], Any] = None) -> bytes:
+        '''encode obj as JSON
+
+        Parameters
+        ----------
+        obj : Any
+            the dicts, lists, strings, numbers, booleans and Nones to be
+            encoded
+        default : Callable[[Any], Any]
+            called with each object which cannot be encoded, to return
+            one which can. Default: None, such objects raise TypeError
+
+        Return
+        ------
+        bytes : the UTF-8 encoded JSON
+        '''
+        return json.dumps(obj, default=default).encode('utf-8')
+
+
+class OrjsonSerializer(JsonSerializer):
+    '''Encode with orjson, raises ImportError when it is not installed'''
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+
+        self._dumps = orjson.dumps
+
+    def dumps(self, obj: Any, default: Callable[[Any], Any] = None) -> bytes:
+        return self._dumps(obj, default=default)
+
+
+class MsgspecSerializer(JsonSerializer):
+    '''Encode with msgspec, raises ImportError when it is not installed'''
+
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec.json
+
+        self._encode = msgspec.json.Encoder().encode
+        self._encode_with = msgspec.json.encode
+
+    def dumps(self, obj: Any, default: Callable[[Any], Any] = None) -> bytes:
+        if default is None:
+            return self._encode(obj)
+        return self._encode_with(obj, enc_hook=default)
+
+
+SERIALIZERS = {
+    'orjson': OrjsonSerializer,
+    'msgspec': MsgspecSerializer,
+    'json': JsonSerializer,
+}
+
+
+def available_serializers() -> List[str]:
+    '''Return the names of the serializers which can be used
+
+    Parameters
+    ----------
+    None
+
+    Return
+    ------
+    List[str] : the names, in the order of PREFERENCE
+    '''
+    names = []
+    for name in PREFERENCE:
+        try:
+            SERIALIZERS[name]()
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+def get_serializer(name: str = 'auto') -> JsonSerializer:
+    '''Return a serializer
+
+    Parameters
+    ----------
+    name : str
+        'orjson', 'msgspec' or 'json', or 'auto' for the first of them
+        which is installed. Default: 'auto'
+
+    Return
+    ------
+    JsonSerializer : the serializer
+
+    Raises
+    ------
+    Exception : when the name is unknown, or its library not installed
+    '''
+    if name == 'auto':
+        return SERIALIZERS[available_serializers()[0]]()
+    if name not in SERIALIZERS:
+        raise Exception(
+            f'serializer ({name}) must be auto, {", ".join(PREFERENCE)}'
+        )
+    try:
+        return SERIALIZERS[name]()
+    except ImportError as e:
+        raise Exception(f'serializer {name} is not installed') from e
@@ -0,0 +1,314 @@
+import errno
+import random
+import threading
+import time
+from typing import Dict, Sequence
+
+from ha_mqtt_pi_smbus.device import SharedSMBus
+
+
+class SimulatedDevice:
+    '''An I2C device simulated by a register file
+
+    Reads and writes go to the register file. Subclasses model the
+    behaviour of a real device by overriding read() and write(), e.g. to
+    start a measurement when a control register is written.
+
+    Parameters
+    ----------
+    registers : bytes | bytearray
+        the initial content of the register file. Default: None, 256
+        zero bytes
+
+    Attributes
+    ----------
+    registers : bytearray
+        the register file
+    nack : bool
+        when True the device does not acknowledge its address, as if it
+        were disconnected. Default: False
+
+    Example
+    -------
+    device = SimulatedDevice()
+    device.registers[0xD0] = 0x60  # chip id
+    simulator.add_device(1, 0x76, device)
+    '''
+
+    def __init__(self, registers: bytes | bytearray = None):
+        self.registers = bytearray(registers if registers is not None else 256)
+        self.pointer = 0
+        self.nack = False
+
+    def read(self, register: int, length: int) -> bytes:
+        '''return the content of length registers from register
+
+        Parameters
+        ----------
+        register : int
+            the address of the first register
+        length : int
+            the number of bytes to read
+        '''
+        return bytes(self.registers[register : register + length])
+
+    def write(self, register: int, data: bytes) -> None:
+        '''write data to the registers from register
+
+        Parameters
+        ----------
+        register : int
+            the address of the first register
+        data : bytes
+            the bytes to write
+        '''
+        self.registers[register : register + len(data)] = data
+
+
+class SimulatedSMBus:
+    '''An in-memory stand-in for smbus2.SMBus, one per bus number
+
+    The methods used by SMBusDevice are implemented against the
+    SimulatedDevices of the simulator. A transaction with an address at
+    which no device is present fails with the OSError smbus2 raises for a
+    NACK (errno EREMOTEIO, 121).
+
+    Parameters
+    ----------
+    bus : int
+        the number of the bus
+    simulator : SMBusSimulator
+        the simulator holding the devices, latency and error injection
+    '''
+
+    def __init__(self, bus: int, simulator: 'SMBusSimulator'):
+        self.bus = bus
+        self.simulator = simulator
+
+    def _device(self, address: int, length: int) -> SimulatedDevice:
+        return self.simulator.transfer(self.bus, address, length)
+
+    def read_byte(self, address: int) -> int:
+        device = self._device(address, 1)
+        value = device.read(device.pointer, 1)[0]
+        device.pointer += 1
+        return value
+
+    def write_byte(self, address: int, value: int) -> None:
+        self._device(address, 1).pointer = value
+
+    def read_byte_data(self, address: int, register: int) -> int:
+        return self._device(address, 2).read(register, 1)[0]
+
+    def write_byte_data(self, address: int, register: int, value: int) -> None:
+        self._device(address, 2).write(register, bytes([value]))
+
+    def read_word_data(self, address: int, register: int) -> int:
+        return int.from_bytes(self._device(address, 3).read(register, 2), 'little')
+
+    def write_word_data(self, address: int, register: int, value: int) -> None:
+        self._device(address, 3).write(register, value.to_bytes(2, 'little'))
+
+    def read_i2c_block_data(
+        self, address: int, register: int, length: int
+    ) -> list[int]:
+        return list(self._device(address, 1 + length).read(register, length))
+
+    def write_i2c_block_data(
+        self, address: int, register: int, data: Sequence[int]
+    ) -> None:
+        self._device(address, 1 + len(data)).write(register, bytes(data))
+
+    def i2c_rdwr(self, *messages) -> None:
+        '''run combined write and read messages (smbus2.i2c_msg)
+
+        A write message sets the register pointer of the device, and
+        writes any bytes after the first. A read message reads from the
+        register pointer, which advances.
+        '''
+        for message in messages:
+            device = self._device(message.addr, message.len)
+            if message.flags:
+                data = device.read(device.pointer, message.len)
+                for i, value in enumerate(data):
+                    message.buf[i] = bytes([value])
+                device.pointer += message.len
+            else:
+                data = bytes(message)
+                device.pointer = data[0]
+                if len(data) > 1:
+                    device.write(data[0], data[1:])
+
+    def close(self) -> None:
+        pass
+
+
+class SMBusSimulator:
+    '''A set of simulated I2C buses and the devices on them
+
+    Once installed, every SharedSMBus (and so every SMBusDevice) opened
+    afterwards uses the simulator instead of /dev/i2c-N, so devices can
+    be run without hardware, and any number of them in one process.
+    Each transaction can be delayed and can fail at random.
+
+    Parameters
+    ----------
+    latency : float
+        the seconds added to every transaction. Default: 0.0
+    byte_time : float
+        the seconds added for each byte of a transaction, e.g. 9 / 100e3
+        for a 100 kHz bus. Default: 0.0
+    error_rate : float
+        the probability that a transaction fails with an I/O error
+        (errno EIO). Default: 0.0
+    nack_rate : float
+        the probability that a device does not acknowledge a
+        transaction (errno EREMOTEIO). Default: 0.0
+    seed : int
+        the seed of the random errors. Default: None
+
+    Attributes
+    ----------
+    transactions : int
+        the number of transactions attempted
+    errors : int
+        the number of transactions which failed
+
+    Example
+    -------
+    simulator = SMBusSimulator(latency=0.0005, error_rate=0.01)
+    simulator.add_device(1, 0x76, SimulatedBME280())
+    with simulator:
+        bme280 = BME280(bus=1, address=0x76)
+        bme280.sample()
+    '''
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        byte_time: float = 0.0,
+        error_rate: float = 0.0,
+        nack_rate: float = 0.0,
+        seed: int = None,
+    ):
+        self.latency = latency
+        self.byte_time = byte_time
+        self.error_rate = error_rate
+        self.nack_rate = nack_rate
+        self.transactions = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._devices: Dict[tuple[int, int], SimulatedDevice] = {}
+
+    def add_device(
+        self, bus: int, address: int, device: SimulatedDevice = None
+    ) -> SimulatedDevice:
+        '''put a device on a bus
+
+        Parameters
+        ----------
+        bus : int
+            the number of the bus
+        address : int
+            the address of the device
+        device : SimulatedDevice
+            the device. Default: None, an empty register file
+
+        Return
+        ------
+        SimulatedDevice : the device
+        '''
+        if device is None:
+            device = SimulatedDevice()
+        with self._lock:
+            self._devices[(bus, address)] = device
+        return device
+
+    def remove_device(self, bus: int, address: int) -> None:
+        '''take a device off a bus, it no longer acknowledges its address
+
+        Parameters
+        ----------
+        bus : int
+            the number of the bus
+        address : int
+            the address of the device
+        '''
+        with self._lock:
+            self._devices.pop((bus, address), None)
+
+    def device(self, bus: int, address: int) -> SimulatedDevice | None:
+        '''return the device at an address, None if there is none
+
+        Parameters
+        ----------
+        bus : int
+            the number of the bus
+        address : int
+            the address of the device
+        '''
+        with self._lock:
+            return self._devices.get((bus, address))
+
+    def open(self, bus: int) -> SimulatedSMBus:
+        '''return a bus, this is the backend given to SharedSMBus
+
+        Parameters
+        ----------
+        bus : int
+            the number of the bus
+        '''
+        return SimulatedSMBus(bus, self)
+
+    def transfer(self, bus: int, address: int, length: int) -> SimulatedDevice:
+        '''account for one transaction and return the addressed device
+
+        The transaction takes latency plus byte_time for each byte and
+        may fail with an injected error.
+
+        Parameters
+        ----------
+        bus : int
+            the number of the bus
+        address : int
+            the address of the device
+        length : int
+            the number of bytes transferred, excluding the address
+        '''
+        delay = self.latency + self.byte_time * (1 + length)
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            self.transactions += 1
+            device = self._devices.get((bus, address))
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                raise OSError(errno.EIO, 'Input/output error')
+            if (
+                device is None
+                or device.nack
+                or (self.nack_rate and self._random.random() < self.nack_rate)
+            ):
+                self.errors += 1
+                raise OSError(errno.EREMOTEIO, 'Remote I/O error')
+        return device
+
+    def install(self) -> None:
+        '''open every SharedSMBus on the simulator from now on
+
+        The buses already open are closed, so devices must be created
+        after the simulator is installed.
+        '''
+        SharedSMBus.set_backend(self.open)
+
+    def uninstall(self) -> None:
+        '''open every SharedSMBus with smbus2.SMBus again'''
+        SharedSMBus.set_backend(None)
+
+    def __enter__(self) -> 'SMBusSimulator':
+        self.install()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.uninstall()
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import threading
+import zlib
+from typing import BinaryIO, List, Tuple
+
+# the length and CRC-32 of the body of a record
+HEADER = struct.Struct('>II')
+SUFFIX = '.seg'
+
+
+class ReadingStore:
+    '''A disk-backed ring buffer of the messages which could not be
+    published
+
+    The records are appended to segment files in a directory, each
+    framed by its length and CRC-32, and are read back oldest first with
+    peek() and pop(). A segment is deleted once all of its records have
+    been popped, and the oldest segment is deleted when the store grows
+    beyond max_bytes, so the store keeps the most recent records.
+
+    Nothing is rewritten in place, so a crash can only tear the record
+    being appended. It is found by its CRC and cut off when the store is
+    opened again. The position of pop() is not saved, so the records
+    popped from the oldest segment before a crash are read again.
+
+    Parameters
+    ----------
+    path : str
+        the directory of the segments, created when missing
+    max_bytes : int
+        the most bytes kept, at least two segments. Default: 16 MiB
+    segment_bytes : int
+        the size at which a new segment is started. Default: None, a
+        sixteenth of max_bytes
+    fsync : bool
+        flush each record to the disk, rather than to the operating
+        system, at the cost of the wear of an SD card. Default: False
+
+    Attributes
+    ----------
+    dropped : int
+        the records deleted unread to keep the store within max_bytes
+    truncated : int
+        the bytes of torn records cut off when the store was opened
+
+    Example
+    -------
+    store = ReadingStore('/var/lib/ha_mqtt_pi_smbus/bme280')
+    store.append('office/state', payload)
+    while (record := store.peek()) is not None:
+        client.publish(*record)
+        store.pop()
+    '''
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 16 * 2**20,
+        segment_bytes: int = None,
+        fsync: bool = False,
+    ):
+        if segment_bytes is None:
+            segment_bytes = max(1, max_bytes // 16)
+        if segment_bytes < 1:
+            raise Exception(f'segment_bytes ({segment_bytes}) must be at least 1')
+        if max_bytes < 2 * segment_bytes:
+            raise Exception(
+                f'max_bytes ({max_bytes}) must be at least two segments '
+                f'({2 * segment_bytes})'
+            )
+        self.__logger = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.dropped = 0
+        self.truncated = 0
+        self._lock = threading.Lock()
+        # [number, records, bytes] of each segment, oldest first
+        self._segments: List[list] = []
+        self._writer: BinaryIO = None
+        self._reader: BinaryIO = None
+        os.makedirs(path, exist_ok=True)
+        numbers = sorted(
+            int(name[: -len(SUFFIX)])
+            for name in os.listdir(path)
+            if name.endswith(SUFFIX) and name[: -len(SUFFIX)].isdigit()
+        )
+        for number in numbers:
+            records, size = self._recover(self._name(number))
+            self._segments.append([number, records, size])
+        if self.truncated:
+            self.__logger.warning(
+                'cut %s bytes of torn records from %s', self.truncated, path
+            )
+
+    def _name(self, number: int) -> str:
+        return os.path.join(self.path, f'{number:08d}{SUFFIX}')
+
+    def _recover(self, name: str) -> Tuple[int, int]:
+        '''count the records of a segment, cutting off a torn tail'''
+        records = 0
+        good = 0
+        with open(name, 'r+b') as f:
+            while True:
+                if self._read(f) is None:
+                    break
+                records += 1
+                good = f.tell()
+            size = f.seek(0, os.SEEK_END)
+            if size > good:
+                f.truncate(good)
+                self.truncated += size - good
+        return records, good
+
+    @staticmethod
+    def _read(f: BinaryIO) -> bytes | None:
+        '''read the body of the next record, None at the end of the
+        segment or at a torn record'''
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+        length, crc = HEADER.unpack(header)
+        body = f.read(length)
+        if len(body) < length or zlib.crc32(body) != crc:
+            return None
+        return body
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(segment[1] for segment in self._segments)
+
+    @property
+    def bytes(self) -> int:
+        '''the size of the segments'''
+        with self._lock:
+            return sum(segment[2] for segment in self._segments)
+
+    def append(self, topic: str, payload: str | bytes) -> None:
+        '''add a record
+
+        Parameters
+        ----------
+        topic : str
+            the topic to which the payload is to be published
+        payload : str | bytes
+            the message
+        '''
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        # MQTT topics cannot contain NUL
+        body = topic.encode('utf-8') + b'\0' + payload
+        record = HEADER.pack(len(body), zlib.crc32(body)) + body
+        with self._lock:
+            if self._writer is None or (
+                self._segments[-1][2] + len(record) > self.segment_bytes
+                and self._segments[-1][2] > 0
+            ):
+                self._start_segment()
+            self._writer.write(record)
+            self._writer.flush()
+            if self.fsync:
+                os.fsync(self._writer.fileno())
+            self._segments[-1][1] += 1
+            self._segments[-1][2] += len(record)
+            while (
+                len(self._segments) > 1
+                and sum(segment[2] for segment in self._segments) > self.max_bytes
+            ):
+                self._delete_oldest(dropped=True)
+
+    def _start_segment(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        number = self._segments[-1][0] + 1 if self._segments else 1
+        self._writer = open(self._name(number), 'ab')
+        self._segments.append([number, 0, 0])
+
+    def _delete_oldest(self, dropped: bool = False) -> None:
+        number, records, _ = self._segments.pop(0)
+        if dropped:
+            self.dropped += records
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if not self._segments and self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        os.remove(self._name(number))
+
+    def peek(self) -> Tuple[str, bytes] | None:
+        '''the oldest record
+
+        Parameters
+        ----------
+        None
+
+        Return
+        ------
+        Tuple[str, bytes] : the topic and payload of the oldest record,
+        None when the store is empty
+        '''
+        with self._lock:
+            while self._segments:
+                if self._segments[0][1] == 0:
+                    if len(self._segments) == 1:
+                        return None
+                    self._delete_oldest()
+                    continue
+                if self._reader is None:
+                    self._reader = open(self._name(self._segments[0][0]), 'rb')
+                position = self._reader.tell()
+                body = self._read(self._reader)
+                if body is not None:
+                    self._reader.seek(position)
+                    topic, _, payload = body.partition(b'\0')
+                    return topic.decode('utf-8'), payload
+                self.__logger.error(
+                    'segment %s is damaged, %s records lost',
+                    self._name(self._segments[0][0]),
+                    self._segments[0][1],
+                )
+                self._delete_oldest(dropped=True)
+            return None
+
+    def pop(self) -> None:
+        '''remove the oldest record, deleting its segment when it was
+        the last
+
+        Parameters
+        ----------
+        None
+        '''
+        with self._lock:
+            if not self._segments or self._segments[0][1] == 0:
+                return
+            if self._reader is None:
+                self._reader = open(self._name(self._segments[0][0]), 'rb')
+            self._read(self._reader)
+            self._segments[0][1] -= 1
+            if self._segments[0][1] == 0:
+                self._delete_oldest()
+
+    def close(self) -> None:
+        '''close the files of the store
+
+        Parameters
+        ----------
+        None
+        '''
+        with self._lock:
+            for f in (self._writer, self._reader):
+                if f is not None:
+                    f.close()
+            self._writer = self._reader = None
@@ -7,10 +7,19 @@ import re
 import socket
 import subprocess
 import sys
+import threading
+import time
 import tomllib
-from typing import Any, Dict
+from typing import Any, Callable, Dict
 import yaml
 
+# numpy is optional (pip install ha_mqtt_pi_smbus[numpy]), the modules
+# using it import it from here and fall back to pure Python when None
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is optional
+    numpy = None
+
 
 def deep_merge_dicts(dict1: Dict[str, Any], dict2: Dict[str, Any]) -> Dict[str, Any]:
     '''Recursively merges two dictionaries.
@@ -116,3 +125,69 @@ def get_command_data(args: list[str]) -> str:
         return subprocess.check_output(args).decode('utf-8')
     except subprocess.CalledProcessError:
         return None
+
+
+class TokenBucket:
+    '''A token bucket rate limiter
+
+    Tokens are added at rate per second up to burst. Each call to take()
+    takes one token and returns how long the caller must wait for it, so
+    the caller sleeps in whatever way suits it (a thread, an Event, or
+    asyncio.sleep()). The waits of successive callers queue up behind
+    each other, so the tokens are never over-spent.
+
+    Parameters
+    ----------
+    rate : float
+        the tokens added per second, it must be greater than 0
+    burst : int
+        the most tokens held, and so taken without waiting. Default: 1
+    clock : Callable[[], float]
+        the source of the time. Default: time.monotonic
+
+    Example
+    -------
+    bucket = TokenBucket(10, burst=5)
+    for message in messages:
+        time.sleep(bucket.take())
+        send(message)
+    '''
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if rate <= 0:
+            raise Exception(f'rate ({rate}) must be greater than 0')
+        if burst < 1:
+            raise Exception(f'burst ({burst}) must be at least 1')
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def take(self) -> float:
+        '''take a token
+
+        Parameters
+        ----------
+        None
+
+        Return
+        ------
+        float : the seconds to wait before the token may be used, 0 when
+        one is available now
+        '''
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # the balance goes negative while callers wait for tokens
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
@@ -3,7 +3,7 @@ import os
 import secrets
 import time
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 
 from ha_mqtt_pi_smbus.device import HADevice
 from ha_mqtt_pi_smbus.mqtt_client import MQTTClient
@@ -22,7 +22,8 @@ class HAFlask(Flask):
     client : ha_mqtt_pi_smbus.mqtt_client.MQTTClient
         the MQTT client to us to commuicate with the MQTT broker
     device : ha_mqtt_pi_smbus.device.HADevice
-        the SMBus device which is to be presented to Home Assistant
+        the SMBus device which is to be presented to Home Assistant.
+        Default: None, every device of the client
     _debug_step_count : int
         the maximum number of .5 second intervals over which the web
         server will wait before giving put.  Default 20,
@@ -63,7 +64,7 @@ class HAFlask(Flask):
         import_name,
         config,
         client: MQTTClient,
-        device: HADevice,
+        device: HADevice = None,
         _debug_step_count: int = 20,
     ):
         templates_path = os.path.abspath(
@@ -105,6 +106,52 @@ class HAFlask(Flask):
         def status():
             return jsonify(self.client.state.to_dict())
 
+        @self.route('/metrics', methods=['GET'])
+        def metrics():
+            return Response(
+                self.client.metrics.render(),
+                content_type='text/plain; version=0.0.4; charset=utf-8',
+            )
+
+        @self.route('/history/<field>', methods=['GET'])
+        def history(field):
+            '''the recorded values of a sensor, ?seconds= limits them to
+            the latest seconds. Without a device of its own the server
+            searches every device of the client, ?device= selects one by
+            name.'''
+            if self.device is not None:
+                devices = [self.device]
+            else:
+                name = request.args.get('device')
+                devices = [
+                    entry.device
+                    for entry in list(self.client.devices.values())
+                    if name is None or entry.device.device.name == name
+                ]
+            sensor = next(
+                (
+                    s
+                    for device in devices
+                    for s in device.sensors
+                    if s.state_field == field and s.history is not None
+                ),
+                None,
+            )
+            if sensor is None:
+                return jsonify({'error': f'no history for {field}'}), 404
+            seconds = request.args.get('seconds', type=float)
+            if seconds is None:
+                timestamps, values = sensor.history.window()
+            else:
+                timestamps, values = sensor.history.since(seconds)
+            return jsonify(
+                {
+                    'field': field,
+                    'timestamps': timestamps.tolist(),
+                    'values': values.tolist(),
+                }
+            )
+
         @self.route('/mqtt-toggle', methods=['POST'])
         def mqtt_toggle():
             state = self.client.state.validate(
@@ -1,6 +1,9 @@
 import logging
 from pathlib import Path
-from unittest.mock import MagicMock, mock_open
+from unittest import skipUnless
+from unittest.mock import MagicMock, mock_open, patch
+
+from ha_mqtt_pi_smbus.util import numpy
 
 MOCK_OSRELEASE_DATA = '''PRETTY_NAME="Debian GNU/Linux 12 (bookworm)"
 NAME="Debian GNU/Linux"
@@ -256,3 +259,109 @@ Revision	: a22082
 Serial		: 000000009ec1f24d
 Model		: Raspberry Pi 3 Model B Rev 1.2
 """
+
+# BME280 register file: calibration values from the Bosch reference
+# driver test vectors and one raw measurement.
+MOCK_BME280_CALIBRATION = {
+    "dig_T1": 27504,
+    "dig_T2": 26435,
+    "dig_T3": -1000,
+    "dig_P1": 36477,
+    "dig_P2": -10685,
+    "dig_P3": 3024,
+    "dig_P4": 2855,
+    "dig_P5": 140,
+    "dig_P6": -7,
+    "dig_P7": 15500,
+    "dig_P8": -14600,
+    "dig_P9": 6000,
+    "dig_H1": 75,
+    "dig_H2": 362,
+    "dig_H3": 0,
+    "dig_H4": 324,
+    "dig_H5": 0,
+    "dig_H6": 30,
+}
+
+MOCK_BME280_RAW = {"pressure": 415148, "temperature": 519888, "humidity": 30000}
+
+
+def mock_bme280_registers(raw=MOCK_BME280_RAW):
+    """Build the 256 byte register file of a BME280"""
+    registers = bytearray(256)
+    cal = MOCK_BME280_CALIBRATION
+    for i, name in enumerate(["dig_T1", "dig_T2", "dig_T3"] +
+                             [f"dig_P{n}" for n in range(1, 10)]):
+        registers[0x88 + 2 * i:0x8A + 2 * i] = cal[name].to_bytes(
+            2, "little", signed=cal[name] < 0)
+    registers[0xA1] = cal["dig_H1"]
+    registers[0xE1:0xE3] = cal["dig_H2"].to_bytes(2, "little", signed=True)
+    registers[0xE3] = cal["dig_H3"]
+    registers[0xE4] = cal["dig_H4"] >> 4
+    registers[0xE5] = (cal["dig_H4"] & 0x0F) | ((cal["dig_H5"] & 0x0F) << 4)
+    registers[0xE6] = cal["dig_H5"] >> 4
+    registers[0xE7] = cal["dig_H6"]
+    registers[0xF7:0xFA] = (raw["pressure"] << 4).to_bytes(3, "big")
+    registers[0xFA:0xFD] = (raw["temperature"] << 4).to_bytes(3, "big")
+    registers[0xFD:0xFF] = raw["humidity"].to_bytes(2, "big")
+    return registers
+
+
+class MockBME280Bus:
+    """A minimal smbus2.SMBus stand-in backed by a BME280 register file"""
+
+    def __init__(self, registers=None):
+        self.registers = registers if registers is not None else mock_bme280_registers()
+        self.transactions = []
+
+    def read_byte_data(self, address, register):
+        self.transactions.append(("read_byte_data", register))
+        return self.registers[register]
+
+    def read_word_data(self, address, register):
+        self.transactions.append(("read_word_data", register))
+        return int.from_bytes(self.registers[register:register + 2], "little")
+
+    def read_i2c_block_data(self, address, register, length):
+        self.transactions.append(("read_i2c_block_data", register, length))
+        return list(self.registers[register:register + length])
+
+    def write_byte_data(self, address, register, value):
+        self.transactions.append(("write_byte_data", register, value))
+
+    def i2c_rdwr(self, *messages):
+        self.transactions.append(("i2c_rdwr", len(messages)))
+        register = 0
+        for message in messages:
+            if message.flags:
+                data = self.registers[register:register + message.len]
+                for i, value in enumerate(data):
+                    message.buf[i] = bytes([value])
+                register += message.len
+            else:
+                register = list(message)[0]
+
+    def close(self):
+        pass
+
+
+# for the tests comparing the numpy code paths with the pure-Python ones
+requires_numpy = skipUnless(numpy, "numpy is not installed")
+
+
+def without_numpy(module):
+    """patch the module to take its pure-Python code paths"""
+    return patch.object(module, "numpy", None)
+
+
+def numpy_and_fallback(module, compute):
+    """return compute() with numpy and with the pure-Python fallback of
+    the module
+
+    The results which sum values may differ in the last places, numpy
+    sums pairwise and the fallbacks exactly with math.fsum.
+    """
+    vectorized = compute()
+    with without_numpy(module):
+        fallback = compute()
+    return vectorized, fallback
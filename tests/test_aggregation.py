@@ -0,0 +1,81 @@
+import array
+import random
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from ha_mqtt_pi_smbus import aggregation
+from ha_mqtt_pi_smbus.aggregation import STATISTICS, WindowAggregator, summarize
+
+from .mock_data import numpy_and_fallback, requires_numpy, without_numpy
+
+
+def sensor(state_field, statistics=STATISTICS, diagnostic=False):
+    return MagicMock(
+        state_field=state_field, statistics=statistics, diagnostic=diagnostic
+    )
+
+
+class TestAggregation(TestCase):
+    def test_summarize(self):
+        values = array.array('d', [2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0])
+        expected = {'min': 2.0, 'max': 9.0, 'mean': 5.0, 'stddev': 2.0, 'last': 9.0}
+        self.assertEqual(summarize(values), expected)
+        self.assertEqual(
+            summarize(list(values), ('mean', 'last')), {'mean': 5.0, 'last': 9.0}
+        )
+        with without_numpy(aggregation):
+            self.assertEqual(summarize(values), expected)
+        self.assertEqual(summarize(array.array('d'), ('min',)), {'min': None})
+
+    @requires_numpy
+    def test_numpy_matches_fallback(self):
+        rng = random.Random(3)
+        for size in (1, 2, 17, 600):
+            values = array.array('d', (rng.gauss(21.5, 0.2) for _ in range(size)))
+            for window in (values, list(values)):
+                vectorized, fallback = numpy_and_fallback(
+                    aggregation, lambda: summarize(window)
+                )
+                self.assertEqual(vectorized.keys(), fallback.keys())
+                for name, value in fallback.items():
+                    self.assertAlmostEqual(vectorized[name], value, places=9)
+
+    def test_window(self):
+        aggregator = WindowAggregator(
+            [
+                sensor('temperature', ('min', 'max', 'mean')),
+                sensor('humidity', ()),
+                sensor('status', diagnostic=True),
+            ],
+            10.0,
+        )
+        self.assertEqual(len(aggregator.sensors), 1)
+        for now, value in ((100.0, 20.0), (103.0, 26.0), (106.0, 'bad')):
+            self.assertFalse(aggregator.add({'temperature': value}, now))
+        data = {'temperature': 21.0, 'humidity': 50.0}
+        self.assertTrue(aggregator.add(data, 110.0))
+        self.assertEqual(
+            data,
+            {
+                'temperature': 21.0,
+                'humidity': 50.0,
+                'temperature_min': 20.0,
+                'temperature_max': 26.0,
+                'temperature_mean': 22.333,
+            },
+        )
+        self.assertEqual((aggregator.held, aggregator.windows), (3, 1))
+        # the next window starts empty and ends on the grid
+        data = {'temperature': 30.0}
+        self.assertFalse(aggregator.add(dict(data), 119.9))
+        self.assertTrue(aggregator.add(data, 120.0))
+        self.assertEqual(data['temperature_min'], 30.0)
+        # after a gap in the samples the grid restarts
+        data = {'temperature': None}
+        self.assertTrue(aggregator.add(data, 200.0))
+        self.assertIsNone(data['temperature_mean'])
+        self.assertFalse(aggregator.add({}, 209.0))
+
+    def test_bad_window(self):
+        with self.assertRaises(Exception):
+            WindowAggregator([], 0)
@@ -0,0 +1,274 @@
+# tests/test_async_mqtt_client.py
+import socket
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from ha_mqtt_pi_smbus.async_mqtt_client import (
+    AsyncioLoop_Thread,
+    AsyncMQTTClient,
+    AsyncSMBus_Scheduler,
+)
+from ha_mqtt_pi_smbus.config import Config
+from ha_mqtt_pi_smbus.device import HADevice, HASensor, SharedSMBus, SMBusDevice
+from ha_mqtt_pi_smbus.environ import DEGREE
+
+from .mock_data import MOCK_CPUINFO_DATA
+
+
+class MockBroker(threading.Thread):
+    '''accept a client, acknowledge its CONNECT and record everything
+    else it sends, and accept it again after drop()'''
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.received = b''
+        self.connections = 0
+        self.conn = None
+        self.dropped = False
+        self.closed = threading.Event()
+
+    def run(self):
+        while True:
+            self.conn, _ = self.server.accept()
+            self.connections += 1
+            with self.conn:
+                connected = False
+                while True:
+                    try:
+                        data = self.conn.recv(4096)
+                    except ConnectionResetError:
+                        break
+                    if not data:
+                        break
+                    self.received += data
+                    if not connected:
+                        connected = True
+                        self.conn.sendall(b'\x20\x02\x00\x00')  # CONNACK, accepted
+            if not self.dropped:
+                break
+            self.dropped = False
+        self.server.close()
+        self.closed.set()
+
+    def drop(self):
+        '''close the connection as a failing broker or network would'''
+        self.dropped = True
+        self.conn.shutdown(socket.SHUT_RDWR)
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestAsyncMQTTClient(TestCase):
+    def setUp(self):
+        SharedSMBus.close_all()
+        self.config = Config({'mqtt': {}})
+
+    def tearDown(self):
+        AsyncioLoop_Thread.stop_all()
+        SharedSMBus.close_all()
+
+    def test_loop_thread_shared(self):
+        loop_thread = AsyncioLoop_Thread.get()
+        self.assertIs(AsyncioLoop_Thread.get(), loop_thread)
+
+        async def answer():
+            return loop_thread.in_loop()
+
+        self.assertTrue(loop_thread.submit(answer()).result(1))
+        self.assertFalse(loop_thread.in_loop())
+        AsyncioLoop_Thread.stop_all()
+        self.assertFalse(loop_thread.is_alive())
+        self.assertIsNot(AsyncioLoop_Thread.get(), loop_thread)
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_scheduler(self, mock_smbus):
+        scheduler = AsyncSMBus_Scheduler(startup_delay=0)
+        device1 = SMBusDevice(bus=1, address=0x76)
+        device2 = SMBusDevice(bus=2, address=0x77)
+        scheduler.add_device(device1, 0.02)
+        scheduler.add_device(device2, 0.05)
+        sequence = scheduler.loop_thread.submit(
+            scheduler.wait_for_sample(device1, 0)
+        ).result(1)
+        self.assertGreaterEqual(sequence, 1)
+        self.assertTrue(wait_until(lambda: device1.sequence >= 5))
+        self.assertTrue(wait_until(lambda: device2.sequence >= 2))
+        self.assertGreater(device1.sequence, device2.sequence)
+        scheduler.remove_device(device1)
+        time.sleep(0.05)
+        sequence = device1.sequence
+        time.sleep(0.1)
+        self.assertEqual(device1.sequence, sequence)
+        self.assertEqual(scheduler.missed_deadlines, 0)
+        with self.assertRaises(Exception):
+            scheduler.add_device(device1, 0)
+        scheduler.stop()
+        sequence = device2.sequence
+        time.sleep(0.1)
+        self.assertEqual(device2.sequence, sequence)
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_scheduler_failing_device(self, mock_smbus):
+        scheduler = AsyncSMBus_Scheduler(startup_delay=0)
+        failing = SMBusDevice(bus=1, address=0x76)
+        failing.sample = MagicMock(side_effect=OSError('NACK'))
+        device = SMBusDevice(bus=1, address=0x77)
+        scheduler.add_device(failing, 0.02)
+        scheduler.add_device(device, 0.02)
+        self.assertTrue(wait_until(lambda: failing.sample.call_count >= 3))
+        self.assertTrue(wait_until(lambda: device.sequence >= 3))
+        self.assertEqual(failing.sequence, 0)
+        scheduler.stop()
+
+    @patch('ha_mqtt_pi_smbus.mqtt_client.get_uptime', return_value='up 5 minutes')
+    @patch('ha_mqtt_pi_smbus.mqtt_client.get_temperature', return_value=42.0)
+    @patch(
+        'ha_mqtt_pi_smbus.mqtt_client.get_object_id', return_value='0123456789abcdef'
+    )
+    @patch('ha_mqtt_pi_smbus.device.get_object_id', return_value='0123456789abcdef')
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=MOCK_CPUINFO_DATA)
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_async_client(
+        self,
+        mock_smbus,
+        mock_read,
+        mock_object_id,
+        mock_client_id,
+        mock_temperature,
+        mock_uptime,
+    ):
+        broker = MockBroker()
+        broker.start()
+        self.config.mqtt.broker = '127.0.0.1'
+        self.config.mqtt.port = broker.port
+        self.config.mqtt.diagnostics_interval = 0.05
+        store_path = tempfile.TemporaryDirectory()
+        self.config.mqtt.store_path = store_path.name
+        self.config.mqtt.flush_interval = 0.02
+        device = HADevice(
+            [HASensor(DEGREE, name='me', device_class='temperature')],
+            'me',
+            'me/state',
+            'God',
+            'WASP',
+        )
+        smbus_device = SMBusDevice()
+        scheduler = AsyncSMBus_Scheduler(startup_delay=0)
+        with self.assertRaises(Exception):
+            AsyncMQTTClient('me', device, smbus_device, self.config)
+        client = AsyncMQTTClient(
+            'me', device, smbus_device, self.config, scheduler=scheduler
+        )
+        self.assertEqual(client.connect_mqtt(), 0)
+        self.assertEqual(client.loop_start(), 0)
+        self.assertEqual(client.loop_start(), 0)
+        self.assertTrue(wait_until(lambda: client.state.connected))
+        self.assertTrue(wait_until(lambda: b'homeassistant' in broker.received))
+
+        client.publish_discovery(device)
+        self.assertTrue(client.state.discovered)
+        self.assertIsNotNone(client.publisher)
+        self.assertIsNotNone(client._flush_future)
+        scheduler.add_device(smbus_device, 0.02)
+        self.assertTrue(wait_until(lambda: b'me/state' in broker.received))
+        self.assertTrue(wait_until(lambda: client.publisher.published is not None))
+        self.assertEqual(client.publisher.published['state'], 'OK')
+        self.assertIn(device.discovery_topic.encode(), broker.received)
+        self.assertTrue(
+            wait_until(lambda: device.diagnostics_topic.encode() in broker.received)
+        )
+
+        # Home Assistant coming online is handled by a coroutine
+        publisher = client.publisher
+        client.rediscovery_jitter = 0
+        client.start_rediscovery()
+        self.assertTrue(wait_until(lambda: client.rediscovery.future.done()))
+        self.assertEqual(client.rediscovery.status, {device.discovery_topic: 'done'})
+        self.assertIs(client.publisher, publisher)
+
+        # so is the replay of the messages stored while disconnected
+        client.store.append('me/stored', 'stored')
+        client.start_replay()
+        self.assertTrue(wait_until(lambda: client.replay.future.done()))
+        self.assertEqual(client.replay.replayed, 1)
+        self.assertEqual(len(client.store), 0)
+        self.assertTrue(wait_until(lambda: b'me/stored' in broker.received))
+
+        client.clear_discovery(device)
+        self.assertFalse(client.state.discovered)
+        self.assertIsNone(client.publisher)
+        self.assertIsNone(client._diagnostics_future)
+        self.assertIsNone(client._flush_future)
+        self.assertEqual(client.disconnect_mqtt(), 0)
+        self.assertTrue(broker.closed.wait(2))
+        client.loop_stop()
+        self.assertIsNone(client.helper)
+        scheduler.stop()
+        client.store.close()
+        store_path.cleanup()
+
+    @patch(
+        'ha_mqtt_pi_smbus.mqtt_client.get_object_id', return_value='0123456789abcdef'
+    )
+    @patch('ha_mqtt_pi_smbus.device.get_object_id', return_value='0123456789abcdef')
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=MOCK_CPUINFO_DATA)
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_async_client_reconnect(
+        self, mock_smbus, mock_read, mock_object_id, mock_client_id
+    ):
+        broker = MockBroker()
+        broker.start()
+        self.config.mqtt.broker = '127.0.0.1'
+        self.config.mqtt.port = broker.port
+        store_path = tempfile.TemporaryDirectory()
+        self.config.mqtt.store_path = store_path.name
+        device = HADevice(
+            [HASensor(DEGREE, name='me', device_class='temperature')],
+            'me',
+            'me/state',
+            'God',
+            'WASP',
+        )
+        scheduler = AsyncSMBus_Scheduler(startup_delay=0)
+        client = AsyncMQTTClient(
+            'me', device, SMBusDevice(), self.config, scheduler=scheduler
+        )
+        client.reconnect_min_delay = 0.05
+        self.assertEqual(client.connect_mqtt(), 0)
+        self.assertEqual(client.loop_start(), 0)
+        self.assertTrue(wait_until(lambda: client.state.connected))
+        self.assertTrue(wait_until(lambda: b'homeassistant' in broker.received))
+
+        # the store is replayed once the lost connection is re-established
+        client.store.append('me/stored', 'stored')
+        broker.drop()
+        self.assertTrue(wait_until(lambda: broker.connections == 2))
+        self.assertTrue(wait_until(lambda: b'me/stored' in broker.received))
+        self.assertTrue(wait_until(lambda: client.replay.future.done()))
+        self.assertEqual(client.replay.replayed, 1)
+        self.assertEqual(len(client.store), 0)
+        self.assertTrue(client._reconnect_future.done())
+
+        # but a disconnected client stays disconnected
+        self.assertEqual(client.disconnect_mqtt(), 0)
+        self.assertTrue(broker.closed.wait(2))
+        self.assertFalse(client._connection_wanted)
+        self.assertIsNone(client._reconnect_future)
+        client.loop_stop()
+        scheduler.stop()
+        client.store.close()
+        store_path.cleanup()
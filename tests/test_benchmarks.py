@@ -0,0 +1,79 @@
+# tests/test_benchmarks.py
+from unittest import TestCase
+
+from benchmarks.compensation import run_compensation
+from benchmarks.load import run_load
+from benchmarks.pipeline import compare, percentile, report, run_pipeline
+from benchmarks.serializers import run_serializers
+from ha_mqtt_pi_smbus.serializer import available_serializers
+
+
+class TestBenchmarks(TestCase):
+    def test_percentile(self):
+        values = list(range(100))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile(values, 1.0), 99)
+
+    def test_compare(self):
+        baseline = [
+            {
+                'mode': 'thread',
+                'rate': 200.0,
+                'qos': 0,
+                'messages_per_sec': 200.0,
+                'latency_p50_ms': 1.0,
+                'latency_p99_ms': 2.0,
+                'cpu_ms_per_msg': 0.5,
+            }
+        ]
+        result = dict(baseline[0], messages_per_sec=140.0, latency_p99_ms=2.4)
+        self.assertEqual(
+            compare([result], baseline, 0.25),
+            ['thread messages_per_sec: 200.0 -> 140.0'],
+        )
+        self.assertEqual(len(compare([result], baseline, 0.1)), 2)
+        self.assertEqual(compare([dict(result, qos=1)], baseline, 0.1), [])
+
+    def test_run_pipeline(self):
+        for mode in ('thread', 'asyncio'):
+            result = run_pipeline(mode, rate=100, duration=0.2)
+            self.assertGreater(result['messages'], 10)
+            self.assertEqual(result['messages'], result['samples'])
+            self.assertGreater(result['latency_p50_ms'], 0)
+            self.assertIn(mode, report([result]))
+
+    def test_run_load(self):
+        for mode, clients in (('thread', None), ('asyncio', 2)):
+            result = run_load(
+                6,
+                rate=10,
+                duration=0.3,
+                mode=mode,
+                nack_rate=0.2,
+                seed=1,
+                clients=clients,
+            )
+            self.assertEqual(result['clients'], clients or 6)
+            self.assertGreater(result['messages'], 6)
+            self.assertGreater(result['sample_failures'], 0)
+            self.assertEqual(result['sample_failures'], result['bus_errors'])
+
+    def test_run_serializers(self):
+        results = run_serializers(number=10)
+        self.assertEqual(
+            [r['serializer'] for r in results], available_serializers()
+        )
+        for result in results:
+            self.assertGreater(result['state_bytes'], 0)
+            self.assertGreater(result['discovery_us'], 0)
+        self.assertIn('serializer', report(results))
+
+    def test_run_compensation(self):
+        results = run_compensation(number=5, sizes=(1, 10))
+        self.assertEqual([r['burst'] for r in results[:2]], [1, 1])
+        self.assertEqual(results[0]['method'], 'library')
+        self.assertEqual(results[0]['speedup'], 1.0)
+        for result in results:
+            self.assertGreater(result['us_per_reading'], 0)
+        self.assertIn('us_per_reading', report(results))
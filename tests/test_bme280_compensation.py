@@ -0,0 +1,68 @@
+import array
+import random
+import types
+from unittest import TestCase
+
+import bme280
+
+from benchmarks.compensation import raw_burst
+from example.pi_bme280 import compensation
+from example.pi_bme280.compensation import BME280Compensation
+from example.pi_bme280.simulator import BME280_SIMULATED_CALIBRATION
+
+from .mock_data import requires_numpy, without_numpy
+
+
+def compensated_readings(params, burst):
+    readings = [
+        bme280.compensated_readings(
+            types.SimpleNamespace(temperature=t, pressure=p, humidity=h), params
+        )
+        for t, p, h in zip(burst['temperature'], burst['pressure'], burst['humidity'])
+    ]
+    return {
+        field: [getattr(reading, field) for reading in readings]
+        for field in ('temperature', 'pressure', 'humidity')
+    }
+
+
+class TestBME280Compensation(TestCase):
+    def setUp(self):
+        self.params = bme280.params(BME280_SIMULATED_CALIBRATION)
+        self.burst = raw_burst(50)
+        # and raw values across the whole range of the ADCs
+        rng = random.Random(11)
+        for field, bits in (('temperature', 20), ('pressure', 20), ('humidity', 16)):
+            self.burst[field] += [rng.randrange(1 << bits) for _ in range(200)]
+
+    def compensate(self, params=None, burst=None):
+        burst = burst or self.burst
+        return BME280Compensation(params or self.params)(
+            burst['temperature'], burst['pressure'], burst['humidity']
+        )
+
+    def check_compensation(self):
+        expected = compensated_readings(self.params, self.burst)
+        result = self.compensate()
+        for field, values in expected.items():
+            self.assertIsInstance(result[field], array.array)
+            self.assertEqual(result[field].typecode, 'd')
+            # the same operations in the same order give the same doubles
+            self.assertEqual(list(result[field]), values, field)
+        burst = {'temperature': [519888], 'pressure': [415148], 'humidity': [0]}
+        self.assertEqual(list(self.compensate(burst=burst)['humidity']), [0.0])
+        burst['humidity'] = [65535]
+        self.assertEqual(list(self.compensate(burst=burst)['humidity']), [100.0])
+        # the datasheet returns 0 rather than divide by zero
+        params = bme280.params(self.params, dig_P1=0)
+        self.assertEqual(list(self.compensate(params, burst)['pressure']), [0.0])
+        empty = {'temperature': [], 'pressure': [], 'humidity': []}
+        self.assertEqual(len(self.compensate(burst=empty)['pressure']), 0)
+
+    def test_compensation_loop(self):
+        with without_numpy(compensation):
+            self.check_compensation()
+
+    @requires_numpy
+    def test_compensation_numpy(self):
+        self.check_compensation()
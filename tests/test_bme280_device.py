@@ -4,6 +4,8 @@ import logging
 from unittest import TestCase
 from unittest.mock import patch
 
+from .mock_data import MockBME280Bus
+
 
 class TestDevice(TestCase):
     @patch('example.pi_bme280.device.BME280')
@@ -56,11 +58,20 @@ class TestDevice(TestCase):
         self.assertEqual(data['pressure'], 1010)
         self.assertEqual(data['humidity'], 99)
 
-    @patch('ha_mqtt_pi_smbus.device.get_cpu_info', return_value={'cpu': {'Model': 'B'}})
-    @patch('bme280.sample')
-    @patch('bme280.load_calibration_params', return_value=123.456)
-    @patch('ha_mqtt_pi_smbus.device.SMBus')
-    def test_bme280(self, mock_smbus, mock_calibration, mock_sample, mock_get_cpu_info):
+    def setUp(self):
+        from ha_mqtt_pi_smbus.device import SharedSMBus
+
+        SharedSMBus.close_all()
+
+    def tearDown(self):
+        from ha_mqtt_pi_smbus.device import SharedSMBus
+
+        SharedSMBus.close_all()
+
+    @patch('example.pi_bme280.device.time.sleep')
+    @patch('ha_mqtt_pi_smbus.device.SMBus', return_value=MockBME280Bus())
+    def test_bme280(self, mock_smbus, mock_sleep):
+        import bme280
         from example.pi_bme280.device import BME280
 
         device = BME280(bus=2, address=0x77)
@@ -69,14 +80,27 @@ class TestDevice(TestCase):
         self.assertEqual(device.temperature, -17.77777777777778)
         self.assertEqual(device.pressure, 0)
         self.assertEqual(device.humidity, 0)
-        self.assertEqual(device._calibration_params, 123.456)
+        self.assertEqual(
+            device._calibration_params,
+            bme280.load_calibration_params(MockBME280Bus(), 0x77),
+        )
         before = datetime.datetime.now()
         device.sample()
         after = datetime.datetime.now()
         last_update = device.last_update
         self.assertLess(before, last_update)
         self.assertLess(last_update, after)
-        mock_sample.assert_called_once()
+        expected = bme280.sample(MockBME280Bus(), 0x77, device._calibration_params)
+        self.assertEqual(device.temperature, expected.temperature)
+        self.assertEqual(device.pressure, expected.pressure)
+        self.assertEqual(device.humidity, expected.humidity)
+        # each sample swaps in a new reading
+        reading = device.reading
+        device.sample()
+        self.assertIsNot(device.reading, reading)
+        self.assertEqual(reading.last_update, last_update)
+        with self.assertRaises(AttributeError):
+            device.reading.temperature = 1
         device.temperature = 1
         device.pressure = 2
         device.humidity = 3
@@ -86,3 +110,45 @@ class TestDevice(TestCase):
         self.assertEqual(data['temperature'], 1)
         self.assertEqual(data['pressure'], 2)
         self.assertEqual(data['humidity'], 3)
+
+    @patch('example.pi_bme280.device.time.sleep')
+    @patch('ha_mqtt_pi_smbus.device.SMBus', return_value=MockBME280Bus())
+    def test_bme280_block_transactions(self, mock_smbus, mock_sleep):
+        from example.pi_bme280.device import BME280
+
+        device = BME280(bus=2, address=0x77)
+        bus = mock_smbus.return_value
+        # calibration is read in one combined transaction of two spans
+        self.assertEqual(bus.transactions, [('i2c_rdwr', 4)])
+        bus.transactions.clear()
+        device.sample()
+        self.assertEqual(
+            bus.transactions,
+            [
+                ('write_byte_data', 0xF2, 1),
+                ('write_byte_data', 0xF4, 0x25),
+                ('read_i2c_block_data', 0xF7, 8),
+            ],
+        )
+
+    @patch('ha_mqtt_pi_smbus.device.get_cpu_info', return_value={'cpu': {'Model': 'B'}})
+    @patch('ha_mqtt_pi_smbus.device.get_object_id', return_value='b827eb94a718')
+    @patch('example.pi_bme280.device.BME280')
+    def test_bmedevice_scheduler(
+        self, mock_bme280, mock_get_object_id, mock_get_cpu_info
+    ):
+        from unittest.mock import MagicMock
+        from example.pi_bme280.device import BME280_Device
+
+        scheduler = MagicMock()
+        device = BME280_Device(
+            'test',
+            'bme280/state',
+            'Bosch',
+            'BME280',
+            mock_bme280,
+            0.5,
+            scheduler=scheduler,
+        )
+        self.assertIsNone(device.sampler_thread)
+        scheduler.add_device.assert_called_once_with(mock_bme280, 0.5)
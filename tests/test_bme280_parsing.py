@@ -56,3 +56,62 @@ class TestParser(TestCase):
         self.assertEqual(config.bme280.bus, 2)
         self.assertEqual(config.bme280.sensor_name, 'tph281')
         self.assertEqual(config.bme280.polling_interval, 2)
+
+    @patch('ha_mqtt_pi_smbus.util.readfile', return_value=MOCK_CONFIG_DATA)
+    @patch(
+        'sys.argv',
+        ['me', '-I', '0.05', '--bme280_startup_delay', '1.5'],
+    )
+    def test_bmeparser_fractional_interval(self, mock_read):
+        parser = BME280Parser()
+        parser.parse_args()
+        config = dict_to_config(parser._config_dict)
+        self.assertEqual(config.bme280.polling_interval, 0.05)
+        self.assertEqual(config.bme280.startup_delay, 1.5)
+
+    @patch('ha_mqtt_pi_smbus.util.readfile', return_value=MOCK_CONFIG_DATA)
+    @patch(
+        'sys.argv',
+        [
+            'me',
+            '--bme280_statistics_window',
+            '60',
+            '--bme280_statistics',
+            'max',
+            'mean',
+        ],
+    )
+    def test_bmeparser_statistics(self, mock_read):
+        parser = BME280Parser()
+        parser.parse_args()
+        config = dict_to_config(parser._config_dict)
+        self.assertEqual(config.bme280.statistics_window, 60)
+        self.assertEqual(config.bme280.statistics, ['max', 'mean'])
+
+    @patch('ha_mqtt_pi_smbus.util.readfile', return_value=MOCK_CONFIG_DATA)
+    @patch(
+        'sys.argv', ['me', '-r', '1', '--bme280_burst', '5', '--bme280_filter', 'hampel']
+    )
+    def test_bme280_config_defaults(self, mock_read):
+        parser = BME280Parser()
+        parser.parse_args()
+        config = Config(parser._config_dict)
+        bme280 = dict_to_config(vars(config.bme280), Bme280Config())
+        self.assertIsInstance(bme280, Bme280Config)
+        # the options given and those of the config file are kept
+        self.assertEqual(bme280.burst, 5)
+        self.assertEqual(bme280.filter, 'hampel')
+        self.assertEqual(bme280.sensor_name, 'tph280')
+        # the others take the defaults of Bme280Config
+        self.assertEqual(bme280.startup_delay, 10.0)
+        self.assertEqual(bme280.temperature_deadband, 0.0)
+        self.assertIsNone(bme280.max_silence)
+        self.assertEqual(bme280.history_size, 0)
+        self.assertEqual(bme280.statistics_window, 0.0)
+        self.assertEqual(bme280.statistics, ())
+        self.assertEqual(bme280.ema_alpha, 0.3)
+        self.assertEqual(bme280.hampel_threshold, 3.0)
+        self.assertFalse(bme280.simulate)
+        clone = bme280.clone()
+        for name in ('bus', 'sensor_name', 'burst', 'startup_delay', 'statistics'):
+            self.assertEqual(getattr(clone, name), getattr(bme280, name))
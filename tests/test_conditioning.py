@@ -0,0 +1,92 @@
+import array
+import random
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from ha_mqtt_pi_smbus import conditioning
+from ha_mqtt_pi_smbus.conditioning import (
+    Conditioner,
+    ConditioningMetrics,
+    hampel,
+    median,
+)
+from ha_mqtt_pi_smbus.metrics import MetricsRegistry
+
+from .mock_data import numpy_and_fallback, requires_numpy
+
+
+class TestConditioning(TestCase):
+    def test_median(self):
+        self.assertEqual(median(array.array('d', [3.0, 1.0, 2.0])), 2.0)
+        self.assertEqual(median([4.0, 1.0, 2.0, 3.0]), 2.5)
+
+    def test_hampel(self):
+        burst = array.array('d', [21.50, 21.52, 85.0, 21.49])
+        value, outliers = hampel(burst)
+        self.assertAlmostEqual(value, 21.505)
+        self.assertEqual(outliers, 1)
+        # without outliers it is the mean
+        value, outliers = hampel([1.0, 2.0, 3.0])
+        self.assertEqual((value, outliers), (2.0, 0))
+        self.assertEqual(hampel([5.0]), (5.0, 0))
+
+    @requires_numpy
+    def test_numpy_matches_fallback(self):
+        rng = random.Random(5)
+        bursts = []
+        for size in (1, 2, 5, 10, 100):
+            burst = array.array('d', (rng.gauss(1013.0, 0.05) for _ in range(size)))
+            if size > 2:
+                burst[rng.randrange(size)] = 1100.0
+            bursts.append(burst)
+
+        def results():
+            ema = Conditioner('ema', alpha=0.3)
+            return [(median(burst), hampel(burst, 3.0), ema(burst)) for burst in bursts]
+
+        vectorized, fallback = numpy_and_fallback(conditioning, results)
+        for (v_median, v_hampel, v_ema), (f_median, f_hampel, f_ema) in zip(
+            vectorized, fallback
+        ):
+            self.assertEqual(v_median, f_median)
+            # the same reads are rejected as outliers
+            self.assertEqual(v_hampel[1], f_hampel[1])
+            self.assertAlmostEqual(v_hampel[0], f_hampel[0], places=9)
+            self.assertAlmostEqual(v_ema, f_ema, places=9)
+
+    def test_conditioner(self):
+        conditioner = Conditioner('ema', alpha=0.5)
+        self.assertIsNone(conditioner.value)
+        self.assertEqual(conditioner([10.0, 12.0]), 11.0)
+        self.assertEqual(conditioner([15.0]), 13.0)
+        conditioner = Conditioner('hampel')
+        conditioner([1.0, 1.0, 1.0, 50.0])
+        conditioner([1.0, 60.0, 1.0])
+        self.assertEqual(conditioner.outliers, 2)
+        self.assertEqual(conditioner.value, 1.0)
+        self.assertEqual(Conditioner()([1.0, 9.0, 2.0]), 2.0)
+        for kwargs in ({'filter': 'mean'}, {'alpha': 0}, {'threshold': 0}):
+            with self.assertRaises(Exception):
+                Conditioner(**kwargs)
+
+    def test_metrics(self):
+        metrics = MetricsRegistry()
+        smbus_device = MagicMock(bus=1, address=0x76)
+        columns = {
+            'temperature': array.array('d', [20.0, 20.0, 30.0, 20.0]),
+            'humidity': array.array('d', [40.0, 41.0, 42.0, 43.0]),
+        }
+        values = ConditioningMetrics(metrics).condition(
+            smbus_device, columns, {'temperature': Conditioner('hampel')}
+        )
+        self.assertEqual(values, {'temperature': 20.0, 'humidity': 43.0})
+        labels = {'bus': 1, 'address': '0x76'}
+        self.assertEqual(
+            metrics['smbus_filter_outliers_total'].get(field='temperature', **labels),
+            1,
+        )
+        self.assertEqual(metrics['smbus_burst_reads_total'].get(**labels), 4)
+        self.assertIn(
+            'smbus_filter_seconds_count{bus="1",address="0x76",field="temperature"} 1',
+            metrics.render(),
+        )
@@ -5,6 +5,8 @@ import time
 from unittest import TestCase
 from unittest.mock import patch
 
+from ha_mqtt_pi_smbus.metrics import MetricsRegistry
+
 from .mock_data import MOCK_CPUINFO_DATA
 
 FAKE_TIME = datetime.datetime(2020, 1, 1, 1, 23, 45)
@@ -70,6 +72,99 @@ class TestDevice(TestCase):
         ha_sensor = Temperature()
         self.assertEqual(ha_sensor.name, 'temperature')
 
+    @patch('ha_mqtt_pi_smbus.device.get_object_id', return_value='0123456789abcdef')
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=MOCK_CPUINFO_DATA)
+    def test_ha_sensor_deadband(self, mock_cpuinfo, mock_objectid):
+        from ha_mqtt_pi_smbus.device import HASensor
+        from example.pi_bme280.device import Temperature
+
+        ha_sensor = Temperature('me', expire_after=120)
+        self.assertEqual(ha_sensor.state_field, 'temperature')
+        self.assertEqual(ha_sensor.deadband, 0.0)
+        self.assertEqual(ha_sensor.max_silence, 60)
+        self.assertFalse(ha_sensor.changed(21.3, 21.3))
+        self.assertTrue(ha_sensor.changed(21.3, 21.4))
+        self.assertTrue(ha_sensor.changed(None, 21.3))
+        self.assertFalse(ha_sensor.changed('OK', 'OK'))
+        ha_sensor = Temperature('me', deadband=0.25, max_silence=10)
+        self.assertEqual(ha_sensor.max_silence, 10)
+        self.assertFalse(ha_sensor.changed(21.0, 20.75))
+        self.assertTrue(ha_sensor.changed(21.0, 20.7))
+        ha_sensor = HASensor('%', name='me', device_class='humidity', expire_after=0)
+        self.assertIsNone(ha_sensor.max_silence)
+
+    @patch('ha_mqtt_pi_smbus.device.get_object_id', return_value='0123456789abcdef')
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=MOCK_CPUINFO_DATA)
+    def test_ha_device_record_history(self, mock_cpuinfo, mock_objectid):
+        from ha_mqtt_pi_smbus.device import HADevice
+        from example.pi_bme280.device import Humidity, Temperature
+
+        ha_device = HADevice(
+            [Temperature('test', history=2), Humidity('test')],
+            name='Test device',
+            state_topic='my/topic',
+            manufacturer='manufact.',
+            model='model1234',
+        )
+        temperature, humidity = ha_device.sensors[:2]
+        self.assertIsNone(humidity.history)
+        self.assertEqual(temperature.history.capacity, 2)
+        for i, value in enumerate((20.5, 'bad', 21.5, 22.5)):
+            ha_device.record_history({'temperature': value, 'humidity': 50.0}, i)
+        ha_device.record_history({'humidity': 50.0})
+        timestamps, values = temperature.history.window()
+        self.assertEqual(list(timestamps), [2, 3])
+        self.assertEqual(list(values), [21.5, 22.5])
+
+    @patch('ha_mqtt_pi_smbus.device.get_object_id', return_value='0123456789abcdef')
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=MOCK_CPUINFO_DATA)
+    def test_ha_device_statistics(self, mock_cpuinfo, mock_objectid):
+        from ha_mqtt_pi_smbus.device import HADevice, HAStatisticSensor
+        from example.pi_bme280.device import Humidity, Temperature
+
+        def device(statistics_window):
+            return HADevice(
+                [
+                    Temperature('test', statistics=('max', 'mean')),
+                    Humidity('test'),
+                ],
+                name='Test device',
+                state_topic='my/topic',
+                manufacturer='manufact.',
+                model='model1234',
+                statistics_window=statistics_window,
+            )
+
+        self.assertEqual(len(device(None).sensors), 7)
+        self.assertIsNone(device(0).statistics_window)
+        ha_device = device(60)
+        self.assertEqual(ha_device.statistics_window, 60)
+        maximum, mean = ha_device.sensors[2:4]
+        self.assertIsInstance(maximum, HAStatisticSensor)
+        self.assertEqual(mean.state_field, 'temperature_mean')
+        self.assertEqual(mean.statistics, ())
+        self.assertIsNone(mean.max_silence)
+        self.assertEqual(
+            ha_device.discovery_payload['components']['test_temperature_max'],
+            {
+                'platform': 'sensor',
+                'device_class': 'temperature',
+                'unique_id': 'test_temperature_max',
+                'expire_after': 120,
+                'unit_of_measurement': f'{chr(176)}C',
+                'value_template': '{{ value_json.temperature_max }}',
+                'availability': maximum.availability.__dict__,
+                'name': 'temperature max',
+                'state_class': 'measurement',
+            },
+        )
+        self.assertTrue(ha_device.sensors[-1].diagnostic)
+        # the state would expire between windows
+        with self.assertRaises(Exception):
+            device(120)
+        with self.assertRaises(Exception):
+            Temperature('test', statistics=('median',))
+
     @patch('ha_mqtt_pi_smbus.device.get_object_id', return_value='0123456789abcdef')
     @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=MOCK_CPUINFO_DATA)
     def test_ha_device_base(self, mock_cpuinfo, mock_objectid):
@@ -141,6 +236,85 @@ class TestDevice(TestCase):
         self.assertEqual(ha_device.origin.support_url, 'http://www.example.com/support')
         self.assertEqual(ha_device.origin.suggested_area, 'race track')
 
+    @patch('ha_mqtt_pi_smbus.device.get_object_id', return_value='0123456789abcdef')
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=MOCK_CPUINFO_DATA)
+    def test_ha_device_object_id(self, mock_cpu_info, mock_object_id):
+        from ha_mqtt_pi_smbus.device import HADevice
+        from example.pi_bme280.device import Temperature
+
+        office = HADevice(
+            [Temperature('office')], 'office', 'office/state', 'Bosch', 'BME280'
+        )
+        garage = HADevice(
+            [Temperature('garage')],
+            'garage',
+            'garage/state',
+            'Bosch',
+            'BME280',
+            object_id='0123456789abcdef_garage',
+        )
+        self.assertEqual(
+            office.discovery_topic, 'homeassistant/device/0123456789abcdef/config'
+        )
+        self.assertEqual(
+            garage.discovery_topic,
+            'homeassistant/device/0123456789abcdef_garage/config',
+        )
+        # the devices no longer share their device and origin sections
+        self.assertIsNot(office.device, garage.device)
+        self.assertEqual(office.discovery_payload['device']['name'], 'office')
+        self.assertEqual(garage.discovery_payload['device']['name'], 'garage')
+        self.assertEqual(garage.device.serial_number, '0123456789abcdef')
+
+    @patch('ha_mqtt_pi_smbus.device.get_object_id', return_value='0123456789abcdef')
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=MOCK_CPUINFO_DATA)
+    def test_ha_device_cached_payloads(self, mock_cpuinfo, mock_objectid):
+        import json
+        from ha_mqtt_pi_smbus.device import HADevice
+        from example.pi_bme280.device import Temperature
+
+        sensor = Temperature('test')
+        ha_device = HADevice(
+            [sensor],
+            name='Test device',
+            state_topic='my/topic',
+            manufacturer='manufact.',
+            model='model1234',
+        )
+        discovery = ha_device.discovery_json()
+        self.assertIsInstance(discovery, bytes)
+        self.assertEqual(
+            json.loads(discovery), json.loads(json.dumps(ha_device.discovery_payload))
+        )
+        self.assertIs(ha_device.discovery_json(), discovery)
+        undiscovery = ha_device.undiscovery_json()
+        self.assertEqual(
+            json.loads(undiscovery),
+            json.loads(json.dumps(ha_device.undiscovery_payload1)),
+        )
+        self.assertIs(ha_device.undiscovery_json(), undiscovery)
+        self.assertEqual(sensor.availability_json(), b'{"availability": "Available"}')
+        self.assertEqual(
+            sensor.availability_json(False), b'{"availability": "Unavailable"}'
+        )
+        self.assertIs(sensor.json_payload(), sensor.json_payload())
+
+        # assigning a sensor attribute invalidates the device payloads
+        sensor.discovery_payload = dict(sensor.discovery_payload, expire_after=60)
+        ha_device.discovery_payload['components'][sensor.unique_id] = (
+            sensor.discovery_payload
+        )
+        self.assertIsNot(ha_device.discovery_json(), discovery)
+        self.assertIn(b'"expire_after": 60', ha_device.discovery_json())
+        self.assertIn('"expire_after": 60', sensor.json_payload())
+
+        # in place changes need an explicit invalidate()
+        discovery = ha_device.discovery_json()
+        ha_device.discovery_payload['qos'] = 1
+        self.assertIs(ha_device.discovery_json(), discovery)
+        ha_device.invalidate()
+        self.assertIn(b'"qos": 1', ha_device.discovery_json())
+
     @patch('ha_mqtt_pi_smbus.device.datetime.datetime', MockDatetime)
     @patch('ha_mqtt_pi_smbus.device.SMBus')
     def test_smbus_device_base(self, mock_smbus):
@@ -158,6 +332,51 @@ class TestDevice(TestCase):
         self.assertEqual(smbus_device.toJson(), '')
         self.assertEqual(str(smbus_device), 'bus: 2, address: 113')
 
+    def test_reading(self):
+        from ha_mqtt_pi_smbus.device import Reading
+
+        class PairReading(Reading):
+            __slots__ = ('a', 'b')
+
+        self.assertEqual(PairReading.fields, ('last_update', 'a', 'b'))
+        reading = PairReading(last_update=FAKE_TIME, a=1, b=2)
+        with self.assertRaises(AttributeError):
+            reading.a = 3
+        with self.assertRaises(AttributeError):
+            reading.c = 3
+        with self.assertRaises(AttributeError):
+            del reading.a
+        changed = reading.replace(a=3)
+        self.assertIsInstance(changed, PairReading)
+        self.assertEqual((reading.a, changed.a, changed.b), (1, 3, 2))
+        self.assertEqual(changed, PairReading(last_update=FAKE_TIME, a=3, b=2))
+        self.assertNotEqual(changed, reading)
+        self.assertEqual(len({reading, reading.replace()}), 1)
+        self.assertEqual(
+            repr(reading),
+            'PairReading(last_update=datetime.datetime(2020, 1, 1, 1, 23, 45),'
+            ' a=1, b=2)',
+        )
+        with self.assertRaises(TypeError):
+            PairReading(last_update=FAKE_TIME, a=1)
+        with self.assertRaises(TypeError):
+            PairReading(last_update=FAKE_TIME, a=1, b=2, c=3)
+
+    @patch('ha_mqtt_pi_smbus.device.datetime.datetime', MockDatetime)
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_smbus_device_reading_swapped(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SMBusDevice
+
+        smbus_device = SMBusDevice(bus=2, address=0x71)
+        earlier = FAKE_TIME.replace(year=2019)
+        smbus_device.last_update = earlier
+        reading = smbus_device.reading
+        smbus_device.sample()
+        # the previous reading is replaced, not changed
+        self.assertIsNot(smbus_device.reading, reading)
+        self.assertEqual(reading.last_update, earlier)
+        self.assertEqual(smbus_device.last_update, FAKE_TIME)
+
     @patch(
         'ha_mqtt_pi_smbus.device.SMBusDevice.sample', return_value={'last_update': 2}
     )
@@ -193,3 +412,348 @@ class TestDevice(TestCase):
         assert mock_sample()['last_update'] == 2
         thread.do_run = False
         thread.join()
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_smbus_device_wait_for_sample(self, mock_smbus):
+        import threading
+        from ha_mqtt_pi_smbus.device import SMBusDevice
+
+        smbus_device = SMBusDevice(bus=2, address=0x71)
+        self.assertEqual(smbus_device.sequence, 0)
+        self.assertEqual(smbus_device.wait_for_sample(0, timeout=0.01), 0)
+        self.assertEqual(smbus_device.notify_sample(), 1)
+        self.assertEqual(smbus_device.wait_for_sample(0), 1)
+
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(smbus_device.wait_for_sample(1))
+        )
+        waiter.start()
+        time.sleep(0.05)
+        self.assertEqual(results, [])
+        smbus_device.notify_sample()
+        waiter.join(1)
+        self.assertEqual(results, [2])
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_smbus_device_wait_for_sample_stop(self, mock_smbus):
+        import threading
+        from ha_mqtt_pi_smbus.device import SMBusDevice
+
+        smbus_device = SMBusDevice(bus=2, address=0x71)
+        stop = []
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(
+                smbus_device.wait_for_sample(0, stop=lambda: bool(stop))
+            )
+        )
+        waiter.start()
+        time.sleep(0.05)
+        stop.append(True)
+        smbus_device.wake()
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(results, [0])
+
+    def test_next_deadline(self):
+        from ha_mqtt_pi_smbus.device import next_deadline
+
+        self.assertEqual(next_deadline(10.0, 0.5, 10.2), (10.5, 0))
+        self.assertEqual(next_deadline(10.0, 0.5, 10.5), (10.5, 0))
+        self.assertEqual(next_deadline(10.0, 0.5, 10.6), (11.0, 1))
+        self.assertEqual(next_deadline(10.0, 0.5, 11.7), (12.0, 3))
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_smbus_device_sampler_thread_fractional(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SMBusDevice, SMBusDevice_Sampler_Thread
+
+        smbus_device = SMBusDevice(bus=2, address=0x71)
+        thread = SMBusDevice_Sampler_Thread(smbus_device, 0.05, startup_delay=0)
+        thread.start()
+        time.sleep(0.32)
+        thread.clear_do_run()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertGreaterEqual(smbus_device.sequence, 5)
+        self.assertLessEqual(smbus_device.sequence, 8)
+        self.assertEqual(thread.missed_deadlines, 0)
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_smbus_device_sampler_thread_missed_deadlines(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SMBusDevice, SMBusDevice_Sampler_Thread
+
+        class SlowDevice(SMBusDevice):
+            def sample(self):
+                super().sample()
+                time.sleep(0.12)
+
+        smbus_device = SlowDevice(bus=2, address=0x71)
+        thread = SMBusDevice_Sampler_Thread(smbus_device, 0.05, startup_delay=0)
+        thread.start()
+        time.sleep(0.3)
+        thread.do_run = False
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertGreaterEqual(thread.missed_deadlines, 2)
+
+    def test_smbus_device_sampler_thread_bad_interval(self):
+        from ha_mqtt_pi_smbus.device import SMBusDevice_Sampler_Thread
+
+        with self.assertRaises(Exception):
+            SMBusDevice_Sampler_Thread(None, 0)
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_smbus_device_sampler_thread_stop_during_startup(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SMBusDevice, SMBusDevice_Sampler_Thread
+
+        smbus_device = SMBusDevice(bus=2, address=0x71)
+        thread = SMBusDevice_Sampler_Thread(smbus_device, 1, startup_delay=30)
+        thread.start()
+        thread.clear_do_run()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(smbus_device.sequence, 0)
+
+
+class TestSMBusScheduler(TestCase):
+    def setUp(self):
+        from ha_mqtt_pi_smbus.device import SharedSMBus
+
+        SharedSMBus.close_all()
+
+    def tearDown(self):
+        from ha_mqtt_pi_smbus.device import SharedSMBus
+
+        SharedSMBus.close_all()
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_shared_smbus(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SharedSMBus, SMBusDevice
+
+        device1 = SMBusDevice(bus=1, address=0x76)
+        device2 = SMBusDevice(bus=1, address=0x77)
+        device3 = SMBusDevice(bus=2, address=0x76)
+        self.assertIs(device1._smbus, device2._smbus)
+        self.assertIsNot(device1._smbus, device3._smbus)
+        self.assertIs(device1._smbus, SharedSMBus.get(1))
+        self.assertEqual(mock_smbus.call_count, 2)
+        self.assertEqual(str(device1._smbus), 'bus: 1')
+
+        mock_smbus.return_value.read_byte_data.return_value = 42
+        self.assertEqual(device1._smbus.read_byte_data(0x76, 0xD0), 42)
+        mock_smbus.return_value.read_byte_data.assert_called_once_with(0x76, 0xD0)
+        mock_smbus.return_value.fd = 3
+        self.assertEqual(device1._smbus.fd, 3)
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_shared_smbus_serializes(self, mock_smbus):
+        import threading
+        from ha_mqtt_pi_smbus.device import SharedSMBus
+
+        shared = SharedSMBus.get(1)
+        active = []
+        overlaps = []
+
+        def transaction(*args):
+            active.append(1)
+            overlaps.append(len(active))
+            time.sleep(0.01)
+            active.pop()
+
+        mock_smbus.return_value.read_byte_data.side_effect = transaction
+        threads = [
+            threading.Thread(target=shared.read_byte_data, args=(0x76, i))
+            for i in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [1] * 5)
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_scheduler_interleaves_devices(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SMBus_Scheduler_Thread, SMBusDevice
+
+        fast = SMBusDevice(bus=1, address=0x76)
+        slow = SMBusDevice(bus=1, address=0x77)
+        scheduler = SMBus_Scheduler_Thread(1, startup_delay=0)
+        scheduler.add_device(fast, 0.05)
+        scheduler.add_device(slow, 0.2)
+        scheduler.start()
+        time.sleep(0.43)
+        scheduler.clear_do_run()
+        scheduler.join(1)
+        self.assertFalse(scheduler.is_alive())
+        self.assertGreaterEqual(fast.sequence, 7)
+        self.assertLessEqual(fast.sequence, 10)
+        self.assertEqual(slow.sequence, 3)
+        self.assertEqual(scheduler.missed_deadlines, 0)
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_scheduler_add_remove_while_running(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SMBus_Scheduler_Thread, SMBusDevice
+
+        device = SMBusDevice(bus=1, address=0x76)
+        scheduler = SMBus_Scheduler_Thread(1, startup_delay=0)
+        scheduler.start()
+        time.sleep(0.05)
+        scheduler.add_device(device, 0.05)
+        time.sleep(0.12)
+        scheduler.remove_device(device)
+        sequence = device.sequence
+        self.assertGreaterEqual(sequence, 2)
+        time.sleep(0.12)
+        self.assertEqual(device.sequence, sequence)
+        scheduler.do_run = False
+        scheduler.join(1)
+        self.assertFalse(scheduler.is_alive())
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_scheduler_failing_device(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SMBus_Scheduler_Thread, SMBusDevice
+
+        class FailingDevice(SMBusDevice):
+            def sample(self):
+                raise OSError(121, 'Remote I/O error')
+
+        failing = FailingDevice(bus=1, address=0x76)
+        device = SMBusDevice(bus=1, address=0x77)
+        metrics = MetricsRegistry()
+        scheduler = SMBus_Scheduler_Thread(1, startup_delay=0, metrics=metrics)
+        scheduler.add_device(failing, 0.05)
+        scheduler.add_device(device, 0.05)
+        scheduler.start()
+        time.sleep(0.17)
+        scheduler.clear_do_run()
+        scheduler.join(1)
+        self.assertEqual(failing.sequence, 0)
+        self.assertGreaterEqual(device.sequence, 3)
+        failures = metrics['smbus_sample_failures_total']
+        samples = metrics['smbus_samples_total']
+        self.assertGreaterEqual(failures.get(bus=1, address='0x76'), 3)
+        self.assertEqual(samples.get(bus=1, address='0x76'), 0)
+        self.assertEqual(samples.get(bus=1, address='0x77'), device.sequence)
+        self.assertEqual(
+            metrics['smbus_sample_seconds'].get(bus=1, address='0x77'),
+            device.sequence,
+        )
+        self.assertIn(
+            'smbus_sample_failures_total{bus="1",address="0x76"}', metrics.render()
+        )
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_scheduler_wrong_bus(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SMBus_Scheduler_Thread, SMBusDevice
+
+        scheduler = SMBus_Scheduler_Thread(1)
+        with self.assertRaises(Exception):
+            scheduler.add_device(SMBusDevice(bus=2, address=0x76), 1)
+        with self.assertRaises(Exception):
+            scheduler.add_device(SMBusDevice(bus=1, address=0x76), 0)
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_scheduler_stop_during_startup(self, mock_smbus):
+        from ha_mqtt_pi_smbus.device import SMBus_Scheduler_Thread, SMBusDevice
+
+        device = SMBusDevice(bus=1, address=0x76)
+        scheduler = SMBus_Scheduler_Thread(1, startup_delay=30)
+        scheduler.add_device(device, 1)
+        scheduler.start()
+        scheduler.clear_do_run()
+        scheduler.join(1)
+        self.assertFalse(scheduler.is_alive())
+        self.assertEqual(device.sequence, 0)
+
+
+class TestSMBusRegisters(TestCase):
+    def setUp(self):
+        from ha_mqtt_pi_smbus.device import SharedSMBus
+
+        SharedSMBus.close_all()
+
+    def tearDown(self):
+        from ha_mqtt_pi_smbus.device import SharedSMBus
+
+        SharedSMBus.close_all()
+
+    def test_register_decode(self):
+        from ha_mqtt_pi_smbus.device import SMBusRegister
+
+        self.assertEqual(SMBusRegister('a', 0x88, 2).decode([0x70, 0x6B]), 27504)
+        self.assertEqual(
+            SMBusRegister('a', 0x8C, 2, signed=True).decode([0x18, 0xFC]), -1000
+        )
+        self.assertEqual(
+            SMBusRegister('a', 0xF7, 3, byteorder='big', shift=4).decode(
+                [0x65, 0x5A, 0xC0]
+            ),
+            415148,
+        )
+
+    def test_register_map_spans(self):
+        from ha_mqtt_pi_smbus.device import SMBusRegister, SMBusRegisterMap
+
+        register_map = SMBusRegisterMap(
+            [
+                SMBusRegister('c', 0xE1, 2),
+                SMBusRegister('a', 0x88, 2),
+                SMBusRegister('b', 0x8C),
+                SMBusRegister('d', 0xE3),
+            ]
+        )
+        self.assertEqual(register_map.spans, [(0x88, 5), (0xE1, 3)])
+        self.assertEqual(
+            register_map.decode([[1, 0, 9, 9, 2], [3, 0, 4]]),
+            {'a': 1, 'b': 2, 'c': 3, 'd': 4},
+        )
+        self.assertEqual(
+            SMBusRegisterMap(
+                [SMBusRegister('a', 0x88), SMBusRegister('b', 0x8C)], max_gap=0
+            ).spans,
+            [(0x88, 1), (0x8C, 1)],
+        )
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_read_block(self, mock_smbus):
+        from .mock_data import MockBME280Bus, mock_bme280_registers
+        from ha_mqtt_pi_smbus.device import SMBusDevice
+
+        bus = MockBME280Bus()
+        mock_smbus.return_value = bus
+        device = SMBusDevice(bus=1, address=0x76)
+        registers = mock_bme280_registers()
+        self.assertEqual(device.read_block(0x88, 26), list(registers[0x88:0xA2]))
+        self.assertEqual(bus.transactions, [('read_i2c_block_data', 0x88, 26)])
+        bus.transactions.clear()
+        self.assertEqual(device.read_block(0x88, 64), list(registers[0x88:0xC8]))
+        self.assertEqual(bus.transactions, [('i2c_rdwr', 2)])
+
+    @patch('ha_mqtt_pi_smbus.device.SMBus')
+    def test_read_registers(self, mock_smbus):
+        from .mock_data import MockBME280Bus, MOCK_BME280_RAW
+        from ha_mqtt_pi_smbus.device import (
+            SMBusDevice,
+            SMBusRegister,
+            SMBusRegisterMap,
+        )
+
+        bus = MockBME280Bus()
+        mock_smbus.return_value = bus
+        device = SMBusDevice(bus=1, address=0x76)
+        measurement = SMBusRegisterMap(
+            [
+                SMBusRegister('pressure', 0xF7, 3, byteorder='big', shift=4),
+                SMBusRegister('temperature', 0xFA, 3, byteorder='big', shift=4),
+                SMBusRegister('humidity', 0xFD, 2, byteorder='big'),
+            ]
+        )
+        self.assertEqual(device.read_registers(measurement), MOCK_BME280_RAW)
+        self.assertEqual(bus.transactions, [('read_i2c_block_data', 0xF7, 8)])
+        bus.transactions.clear()
+        split = SMBusRegisterMap(
+            [SMBusRegister('t1', 0x88, 2), SMBusRegister('h1', 0xA1)], max_gap=0
+        )
+        self.assertEqual(device.read_registers(split), {'t1': 27504, 'h1': 75})
+        self.assertEqual(bus.transactions, [('i2c_rdwr', 4)])
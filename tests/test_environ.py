@@ -1,9 +1,12 @@
 # tests/test_environ.py
 import builtins
+import datetime
 import importlib
 import logging
+import os
 import subprocess
 import sys
+import tempfile
 import types
 import unittest
 from unittest import mock
@@ -15,7 +18,16 @@ import ha_mqtt_pi_smbus.environ as ha_env
 from .mock_data import MOCK_CPUINFO_DATA, MOCK_OSRELEASE_DATA
 
 
+NO_SYSFS = '/nonexistent/sys/class/net'
+
+
 class TestDevice(unittest.TestCase):
+    def setUp(self):
+        ha_env.refresh_identity()
+
+    def tearDown(self):
+        ha_env.refresh_identity()
+
     @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=43812)
     def test_get_temperature(self, mock_readfile):
         temperature = ha_env.get_temperature()
@@ -31,21 +43,41 @@ class TestDevice(unittest.TestCase):
         osinfo = ha_env.get_os_info()
         self.assertEqual(osinfo['ID'], 'debian')
 
-    @patch(
-        'ha_mqtt_pi_smbus.environ.get_command_data',
-        return_value='up 20 hours, 57 minutes'
-    )
-    def test_get_uptime(self, mock_readfile):
+    @patch('ha_mqtt_pi_smbus.environ.get_command_data')
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value='75420.31 290012.57\n')
+    def test_get_uptime(self, mock_readfile, mock_getcmd):
         uptime = ha_env.get_uptime()
         self.assertEqual(uptime, 'up 20 hours, 57 minutes')
+        mock_readfile.assert_called_once_with('/proc/uptime')
+        mock_getcmd.assert_not_called()
+
+    def test_format_uptime(self):
+        self.assertEqual(ha_env.format_uptime(42), 'up 0 minutes')
+        self.assertEqual(ha_env.format_uptime(61), 'up 1 minute')
+        self.assertEqual(ha_env.format_uptime(7200), 'up 2 hours')
+        self.assertEqual(
+            ha_env.format_uptime(8 * 86400 + 3600 + 120),
+            'up 1 week, 1 day, 1 hour, 2 minutes',
+        )
+        self.assertEqual(ha_env.format_uptime(2 * 365 * 86400), 'up 2 years')
 
+    @patch('ha_mqtt_pi_smbus.environ.get_command_data')
     @patch(
-        'ha_mqtt_pi_smbus.environ.get_command_data',
-        return_value='2025-08026 17:42:54'
+        'ha_mqtt_pi_smbus.environ.readfile',
+        return_value='cpu  1 2 3 4\nintr 5\nctxt 6\nbtime 1756248174\nprocesses 7\n',
     )
-    def test_get_last_restart(self, mock_readfile):
+    def test_get_last_restart(self, mock_readfile, mock_getcmd):
         last_restart = ha_env.get_last_restart()
-        self.assertEqual(last_restart, '2025-08026 17:42:54')
+        self.assertEqual(
+            last_restart,
+            datetime.datetime.fromtimestamp(1756248174).strftime('%Y-%m-%d %H:%M:%S'),
+        )
+        mock_readfile.assert_called_once_with('/proc/stat')
+        mock_getcmd.assert_not_called()
+
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value='cpu  1 2 3 4\n')
+    def test_get_last_restart_no_btime(self, mock_readfile):
+        self.assertIsNone(ha_env.get_last_restart())
 
     @patch(
         'ha_mqtt_pi_smbus.environ.get_command_data',
@@ -54,6 +86,7 @@ class TestDevice(unittest.TestCase):
             ether b8:27:eb:94:a7:18  txqueuelen 1000  (Ethernet)
         ''',
     )
+    @patch('ha_mqtt_pi_smbus.environ.SYS_CLASS_NET', NO_SYSFS)
     def test_mac_address_eth_success(self, mock_getcmd):
         mac = ha_env.get_mac_address_by_interface('eth0')
         self.assertEqual(mac, 'b8:27:eb:94:a7:18')
@@ -65,6 +98,7 @@ class TestDevice(unittest.TestCase):
             ether b8:27:eb:94:a7:19  txqueuelen 1000  (Ethernet)
         ''',
     )
+    @patch('ha_mqtt_pi_smbus.environ.SYS_CLASS_NET', NO_SYSFS)
     def test_mac_address_wlan_success(self, mock_getcmd):
         mac = ha_env.get_mac_address_by_interface('wlan0')
         self.assertEqual(mac, 'b8:27:eb:94:a7:19')
@@ -78,6 +112,7 @@ class TestDevice(unittest.TestCase):
         ''',
         ],
     )
+    @patch('ha_mqtt_pi_smbus.environ.SYS_CLASS_NET', NO_SYSFS)
     def test_mac_address_fake_except(self, mock_getcmd):
         mac = ha_env.get_mac_address_by_interface('fake0')
         self.assertIsNone(mac)
@@ -90,6 +125,7 @@ class TestDevice(unittest.TestCase):
         ''',
         ],
     )
+    @patch('ha_mqtt_pi_smbus.environ.SYS_CLASS_NET', NO_SYSFS)
     def test_mac_address_no_parm_but_eth(self, mock_getcmd):
         mac = ha_env.get_mac_address()
         self.assertEqual(mac, 'b8:27:eb:94:a7:19')
@@ -103,6 +139,7 @@ class TestDevice(unittest.TestCase):
         ''',
         ],
     )
+    @patch('ha_mqtt_pi_smbus.environ.SYS_CLASS_NET', NO_SYSFS)
     def test_mac_address_no_parm_but_wlan(self, mock_getcmd):
         mac = ha_env.get_mac_address()
         self.assertEqual(mac, 'b8:27:eb:94:a7:19')
@@ -116,10 +153,53 @@ class TestDevice(unittest.TestCase):
         ''',
         ],
     )
+    @patch('ha_mqtt_pi_smbus.environ.SYS_CLASS_NET', NO_SYSFS)
     def test_get_object_id(self, mock_getcmd):
         objectId = ha_env.get_object_id()
         self.assertEqual(objectId, 'b827eb94a719')
     
+    @patch('ha_mqtt_pi_smbus.environ.get_command_data')
+    def test_mac_address_sysfs(self, mock_getcmd):
+        with tempfile.TemporaryDirectory() as sysfs:
+            for interface, address in (
+                ('lo', '00:00:00:00:00:00'),
+                ('end0', 'B8:27:EB:94:A7:20'),
+                ('wlan0', 'b8:27:eb:94:a7:19'),
+            ):
+                os.mkdir(os.path.join(sysfs, interface))
+                with open(os.path.join(sysfs, interface, 'address'), 'w') as f:
+                    f.write(address + '\n')
+            with patch('ha_mqtt_pi_smbus.environ.SYS_CLASS_NET', sysfs):
+                self.assertEqual(
+                    ha_env.get_mac_address_by_interface('wlan0'), 'b8:27:eb:94:a7:19'
+                )
+                self.assertIsNone(ha_env.get_sysfs_mac_address('lo'))
+                self.assertIsNone(ha_env.get_sysfs_mac_address('eth0'))
+                # wlan0 is preferred over other interfaces
+                self.assertEqual(ha_env.get_object_id(), 'b827eb94a719')
+                os.remove(os.path.join(sysfs, 'wlan0', 'address'))
+                # the identity is cached until refreshed
+                self.assertEqual(ha_env.get_object_id(), 'b827eb94a719')
+                ha_env.refresh_identity()
+                self.assertEqual(ha_env.get_mac_address(), 'b8:27:eb:94:a7:20')
+        mock_getcmd.assert_not_called()
+
+    @patch('ha_mqtt_pi_smbus.environ.SYS_CLASS_NET', NO_SYSFS)
+    @patch('ha_mqtt_pi_smbus.environ.get_command_data', return_value=None)
+    def test_mac_address_none_not_cached(self, mock_getcmd):
+        self.assertIsNone(ha_env.get_mac_address())
+        self.assertIsNone(ha_env.get_mac_address())
+        self.assertEqual(mock_getcmd.call_count, 4)
+
+    @patch('ha_mqtt_pi_smbus.environ.readfile', return_value=MOCK_CPUINFO_DATA)
+    def test_get_cpu_info_cached(self, mock_readfile):
+        cpu_info = ha_env.get_cpu_info()
+        self.assertIs(ha_env.get_cpu_info(), cpu_info)
+        mock_readfile.assert_called_once()
+        ha_env.refresh_identity()
+        self.assertIsNot(ha_env.get_cpu_info(), cpu_info)
+        self.assertEqual(mock_readfile.call_count, 2)
+
     @patch(
             'ha_mqtt_pi_smbus.environ.readfile', return_value='''[project]
 version = 'v0.1.3'
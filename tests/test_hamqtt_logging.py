@@ -5,7 +5,7 @@ import logging
 from unittest import TestCase
 from unittest.mock import patch, mock_open
 
-from ha_mqtt_pi_smbus.hamqtt_logging import loggerConfig
+from ha_mqtt_pi_smbus.hamqtt_logging import PublishTrace, loggerConfig
 
 from .mock_data import MOCK_CPUINFO_DATA, MOCK_OSRELEASE_DATA, MOCK_LOGGING_CONFIG_DATA
 
@@ -90,3 +90,64 @@ class TestLogging(TestCase):
         self.assertEqual(logger_config['version'], 1)
         self.assertIn('loggers', logger_config)
         self.assertEqual(logger_config['disable_existing_loggers'], False)
+
+
+class TestPublishTrace(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test.publish_trace')
+        self.logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        self.logger.setLevel(logging.NOTSET)
+
+    def test_trace_sampled_and_truncated(self):
+        trace = PublishTrace(
+            self.logger, summary_interval=0, sample_every=3, payload_limit=5
+        )
+        with self.assertLogs(self.logger, logging.DEBUG) as logs:
+            for _ in range(7):
+                trace.record('a/state', '0123456789', 0, False, 0)
+            trace.record('b/state', b'abc', 1, True, 0)
+        self.assertEqual(len(logs.records), 4)
+        self.assertIn('publish #1 topic=a/state', logs.output[0])
+        self.assertIn('payload=01234...', logs.output[0])
+        self.assertIn('publish #4 ', logs.output[1])
+        self.assertIn('publish #7 ', logs.output[2])
+        self.assertIn('payload=abc', logs.output[3])
+
+    def test_trace_not_formatted_when_disabled(self):
+        self.logger.setLevel(logging.WARNING)
+        trace = PublishTrace(self.logger, summary_interval=0)
+        with patch.object(trace, 'truncate') as mock_truncate:
+            trace.record('a/state', 'payload', 0, False, 0)
+        mock_truncate.assert_not_called()
+        self.assertEqual(trace.summary()['a/state']['messages'], 1)
+
+    def test_summary(self):
+        self.logger.setLevel(logging.INFO)
+        trace = PublishTrace(self.logger, summary_interval=0)
+        start = trace._since
+        trace.record('a/state', '1234', 0, False, 0)
+        trace.record('a/state', '1234', 0, False, 4)
+        trace.record('b/state', '12', 0, False, 0)
+        summary = trace.summary(start + 2)
+        self.assertEqual(
+            summary['a/state'],
+            {'messages': 2, 'bytes': 8, 'failures': 1, 'rate': 1.0},
+        )
+        self.assertEqual(summary['b/state']['rate'], 0.5)
+        with self.assertLogs(self.logger, logging.INFO) as logs:
+            trace.log_summary(start + 2)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('published 3 messages, 10 bytes in 2s', logs.output[0])
+        self.assertIn('a/state 2 (1.00/s, 1 failed)', logs.output[0])
+        self.assertEqual(trace.summary(), {})
+
+    def test_summary_interval(self):
+        self.logger.setLevel(logging.INFO)
+        trace = PublishTrace(self.logger, summary_interval=60)
+        trace._since -= 61
+        with self.assertLogs(self.logger, logging.INFO) as logs:
+            trace.record('a/state', '1234', 0, False, 0)
+        self.assertIn('published 1 messages', logs.output[0])
+        self.assertEqual(trace.summary(), {})
@@ -0,0 +1,92 @@
+import array
+import random
+from unittest import TestCase
+
+from ha_mqtt_pi_smbus import history as history_module
+from ha_mqtt_pi_smbus.history import History
+
+from .mock_data import numpy_and_fallback, requires_numpy, without_numpy
+
+SECOND = 1_000_000_000
+
+
+class TestHistory(TestCase):
+    def filled(self, capacity, count):
+        history = History(capacity)
+        for i in range(count):
+            history.append(float(i), i * SECOND)
+        return history
+
+    def test_append(self):
+        history = History(4)
+        self.assertEqual(len(history), 0)
+        self.assertIsNone(history.latest())
+        self.assertEqual(history.nbytes, 4 * 12)
+        history.append(1.5, 10)
+        # the clock stepped back, the points stay in order
+        history.append(2.5, 5)
+        self.assertEqual(history.latest(), (10, 2.5))
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history.appended, 2)
+
+    def test_ring(self):
+        history = self.filled(4, 10)
+        self.assertEqual(len(history), 4)
+        self.assertEqual(history.appended, 10)
+        timestamps, values = history.window()
+        self.assertEqual(list(values), [6.0, 7.0, 8.0, 9.0])
+        self.assertEqual(list(timestamps), [i * SECOND for i in range(6, 10)])
+        self.assertEqual(history.latest(), (9 * SECOND, 9.0))
+        history.clear()
+        self.assertEqual(len(history), 0)
+        self.assertEqual(list(history.window()[1]), [])
+
+    def test_window(self):
+        # the window spans the wrap of the ring
+        history = self.filled(5, 7)
+        for start, end, expected in (
+            (None, None, [2, 3, 4, 5, 6]),
+            (3 * SECOND, None, [3, 4, 5, 6]),
+            (3 * SECOND + 1, 6 * SECOND, [4, 5]),
+            (None, 5 * SECOND, [2, 3, 4]),
+            (5 * SECOND, 5 * SECOND, []),
+            (10 * SECOND, None, []),
+        ):
+            self.assertEqual(
+                list(history.window(start, end)[1]), expected, (start, end)
+            )
+        self.assertEqual(list(history.since(2.5, now_ns=7 * SECOND)[1]), [5, 6])
+
+    def test_array_fallback(self):
+        with without_numpy(history_module):
+            history = self.filled(3, 5)
+            timestamps, values = history.window(3 * SECOND)
+        self.assertIsInstance(timestamps, array.array)
+        self.assertEqual(timestamps.typecode, 'q')
+        self.assertEqual(values.typecode, 'f')
+        self.assertEqual(list(values), [3.0, 4.0])
+
+    @requires_numpy
+    def test_numpy_matches_array(self):
+        rng = random.Random(7)
+        points = [(rng.uniform(-40, 85), i * SECOND // 4) for i in range(300)]
+        queries = [(None, None)] + [
+            tuple(sorted(rng.randrange(-SECOND, 80 * SECOND) for _ in range(2)))
+            for _ in range(50)
+        ]
+
+        def results():
+            history = History(128)
+            for value, timestamp in points:
+                history.append(value, timestamp)
+            return [
+                [list(column) for column in history.window(start, end)]
+                for start, end in queries
+            ] + [[list(column) for column in history.since(5, now_ns=70 * SECOND)]]
+
+        vectorized, fallback = numpy_and_fallback(history_module, results)
+        self.assertEqual(vectorized, fallback)
+
+    def test_bad_capacity(self):
+        with self.assertRaises(Exception):
+            History(0)
@@ -0,0 +1,98 @@
+# tests/test_metrics.py
+import math
+from unittest import TestCase
+
+from ha_mqtt_pi_smbus.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    format_value,
+)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_format_value(self):
+        self.assertEqual(format_value(3), '3')
+        self.assertEqual(format_value(True), '1')
+        self.assertEqual(format_value(0.25), '0.25')
+        self.assertEqual(format_value(math.inf), '+Inf')
+        self.assertEqual(format_value(-math.inf), '-Inf')
+        self.assertEqual(format_value(math.nan), 'NaN')
+
+    def test_counter(self):
+        counter = self.registry.counter('sent_total', 'messages sent', ('topic',))
+        self.assertIsInstance(counter, Counter)
+        self.assertIs(
+            self.registry.counter('sent_total', 'ignored', ('topic',)), counter
+        )
+        counter.inc(topic='a')
+        counter.inc(2, topic='a')
+        counter.inc(topic='b"\n')
+        self.assertEqual(counter.get(topic='a'), 3)
+        self.assertEqual(counter.get(topic='c'), 0)
+        with self.assertRaises(Exception):
+            counter.inc(-1, topic='a')
+        with self.assertRaises(Exception):
+            counter.inc(other='a')
+        acked = [1, 2]
+        counter.set_function(lambda: len(acked), topic='d')
+        acked.append(3)
+        self.assertEqual(counter.get(topic='d'), 3)
+        self.assertIn('sent_total{topic="d"} 3', counter.render())
+        counter.remove(topic='d')
+        self.assertEqual(counter.get(topic='d'), 0)
+        self.assertEqual(
+            counter.render(),
+            [
+                '# HELP sent_total messages sent',
+                '# TYPE sent_total counter',
+                'sent_total{topic="a"} 3',
+                'sent_total{topic="b\\"\\n"} 1',
+            ],
+        )
+
+    def test_gauge(self):
+        gauge = self.registry.gauge('depth', 'queue depth', ('client',))
+        self.assertIsInstance(gauge, Gauge)
+        gauge.set(5, client='a')
+        gauge.inc(-2, client='a')
+        queue = [1, 2]
+        gauge.set_function(lambda: len(queue), client='b')
+        queue.append(3)
+        self.assertEqual(gauge.get(client='a'), 3)
+        self.assertEqual(gauge.get(client='b'), 3)
+        self.assertIn('depth{client="b"} 3', gauge.render())
+        gauge.remove(client='b')
+        self.assertNotIn('depth{client="b"} 3', gauge.render())
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('seconds', 'duration', buckets=(0.1, 1))
+        self.assertIsInstance(histogram, Histogram)
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value)
+        self.assertEqual(histogram.get(), 4)
+        self.assertEqual(
+            histogram.render()[2:],
+            [
+                'seconds_bucket{le="0.1"} 1',
+                'seconds_bucket{le="1"} 3',
+                'seconds_bucket{le="+Inf"} 4',
+                'seconds_sum 6.05',
+                'seconds_count 4',
+            ],
+        )
+
+    def test_registry(self):
+        self.registry.gauge('b', 'second').set(1)
+        self.registry.counter('a', 'first').inc()
+        with self.assertRaises(Exception):
+            self.registry.gauge('a', 'first')
+        self.assertIsInstance(self.registry['a'], Counter)
+        text = self.registry.render()
+        self.assertTrue(text.endswith('\n'))
+        self.assertLess(text.index('# HELP a first'), text.index('# HELP b second'))
+        self.assertIn('\nb 1\n', text)
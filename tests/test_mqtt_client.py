@@ -1,22 +1,28 @@
 # tests/test_mqtt_client.py
+import datetime
+import json
 import logging
+import os
 import pytest
+import tempfile
 import time
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 
-from paho.mqtt.client import MQTTMessage,MQTTErrorCode
+from paho.mqtt.client import MQTTMessage, MQTTMessageInfo, MQTTErrorCode
 
-from ha_mqtt_pi_smbus.device import HADevice, HASensor
+from ha_mqtt_pi_smbus.device import HADevice, HASensor, SMBusDevice
 from ha_mqtt_pi_smbus.mqtt_client import (
     State,
     MQTTClient,
+    MQTT_Diagnostics_Thread,
     MQTT_Publisher_Thread,
     get_temp,
 )
-from ha_mqtt_pi_smbus.environ import DEGREE
+from ha_mqtt_pi_smbus.environ import DEGREE, PACKAGE_VERSION
 from ha_mqtt_pi_smbus.mqtt_client import get_temp
 from ha_mqtt_pi_smbus.config import Config,MqttConfig
+from ha_mqtt_pi_smbus.metrics import MetricsRegistry
 
 from .mock_data import (
     MOCK_SUBPROCESS_CHECK_OUTPUT_SIDE_EFFECT,
@@ -105,27 +111,26 @@ class TestMQTTClient(TestCase):
         "ha_mqtt_pi_smbus.environ.get_command_data",
         side_effect=[MOCK_IFCONFIG_WLAN0_DATA],
     )
+    @patch("paho.mqtt.client.Client.publish", return_value=(0, 1))
     @patch("paho.mqtt.client.Client.is_connected", side_effect=[False] * 20)
     @patch("paho.mqtt.client.Client.connect", return_value=0)
-    @patch(
-        "ha_mqtt_pi_smbus.device.SMBusDevice.getdata",
-        side_effect=[{"last_update": i} for i in range(1, 11)],
-    )
-    @patch("ha_mqtt_pi_smbus.device.SMBusDevice", return_value=(1, 0x76))
+    @patch("ha_mqtt_pi_smbus.device.SMBus")
     def test_mqtt_client_publisher_thread(
         self,
         mock_smbus,
-        mock_data,
         mock_connect,
         mock_is_connected,
+        mock_publish,
         mock_subprocess_check_output,
         mock_read,
         mock_object_id,
     ):
+        smbus_device = SMBusDevice(bus=1, address=0x76)
+        smbus_device.last_update = datetime.datetime(2020, 1, 1, 1, 23, 45)
         mqtt_client = MQTTClient(
             client_prefix="me",
             device=(BME280_Device()),
-            smbus_device=mock_smbus,
+            smbus_device=smbus_device,
             config=self.config,
         )
         thread = MQTT_Publisher_Thread(
@@ -141,7 +146,7 @@ class TestMQTTClient(TestCase):
                 "God",
                 "WASP",
             ),
-            mock_smbus,
+            smbus_device,
         )
         obj = {
             "Connected": False,
@@ -153,11 +158,121 @@ class TestMQTTClient(TestCase):
         assert mqtt_client.connect_mqtt() == 0
         assert not mqtt_client.is_connected()
         thread.start()
-        assert thread.data["last_update"] == 2
-        time.sleep(1.1)
-        assert thread.data["last_update"] == 3
+        # nothing is published until the device announces a sample
+        time.sleep(0.1)
+        mock_publish.assert_not_called()
+        # nor while the device is not discovered
+        smbus_device.sample()
+        smbus_device.notify_sample()
+        for _ in range(100):
+            if thread.sequence:
+                break
+            time.sleep(0.01)
+        assert thread.sequence == 1
+        mock_publish.assert_not_called()
+        mqtt_client.state.discovered = True
+        smbus_device.sample()
+        smbus_device.notify_sample()
+        for _ in range(100):
+            if mock_publish.call_count:
+                break
+            time.sleep(0.01)
+        mock_publish.assert_called_once()
+        assert mock_publish.call_args[0][0] == "my/state"
+        assert thread.sequence == 2
+        assert thread.data["state"] == "OK"
+        assert thread.data["last_update"] == smbus_device.getdata()["last_update"]
         thread.clear_do_run()
-        thread.join()
+        thread.join(1)
+        assert not thread.is_alive()
+        assert mock_publish.call_count == 1
+
+    @patch("ha_mqtt_pi_smbus.device.get_object_id", return_value="0123456789abcdef")
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    def test_mqtt_client_publisher_deadband(self, mock_read, mock_object_id):
+        smbus_device = MagicMock()
+        client = MagicMock()
+        client.metrics = MetricsRegistry()
+        thread = MQTT_Publisher_Thread(
+            client,
+            HADevice(
+                [
+                    HASensor(
+                        DEGREE,
+                        name="me",
+                        device_class="temperature",
+                        deadband=0.5,
+                        max_silence=30,
+                    ),
+                    HASensor("%", name="me", device_class="humidity", expire_after=120),
+                ],
+                "me",
+                "my/state",
+                "God",
+                "WASP",
+            ),
+            smbus_device,
+        )
+        data = {"temperature": 20.0, "humidity": 50.0, "state": "OK"}
+        # the first sample is always published
+        assert thread.should_publish(data, 100.0)
+        thread.published = data
+        thread.published_at = 100.0
+        # within the deadband and without a humidity change
+        assert not thread.should_publish(dict(data, temperature=20.5), 110.0)
+        assert thread.should_publish(dict(data, temperature=20.6), 110.0)
+        # the humidity sensor has no deadband
+        assert thread.should_publish(dict(data, humidity=50.1), 110.0)
+        # the heartbeat is the shortest max_silence of the sensors
+        assert not thread.should_publish(dict(data), 129.9)
+        assert thread.should_publish(dict(data), 130.0)
+        # a field which disappears is a change
+        assert thread.should_publish({"humidity": 50.0}, 110.0)
+        thread.record_suppressed()
+        assert thread.suppressed == 1
+        suppressed = client.metrics["mqtt_state_suppressed_total"]
+        assert suppressed.get(topic="my/state") == 1
+
+    @patch("ha_mqtt_pi_smbus.device.get_object_id", return_value="0123456789abcdef")
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    def test_mqtt_client_publisher_statistics(self, mock_read, mock_object_id):
+        client = MagicMock()
+        client.metrics = MetricsRegistry()
+        device = HADevice(
+            [
+                HASensor(
+                    DEGREE,
+                    name="me",
+                    device_class="temperature",
+                    statistics=("min", "max"),
+                ),
+            ],
+            "me",
+            "my/state",
+            "God",
+            "WASP",
+            statistics_window=30,
+        )
+        thread = MQTT_Publisher_Thread(client, device, MagicMock())
+        for now, temperature in ((100.0, 20.0), (110.0, 25.0), (120.0, 21.0)):
+            assert not thread.aggregate({"temperature": temperature}, now)
+        data = {"temperature": 22.0}
+        assert thread.aggregate(data, 130.0)
+        assert data == {
+            "temperature": 22.0,
+            "temperature_min": 20.0,
+            "temperature_max": 25.0,
+        }
+        # the statistics sensors are new fields, so the state is published
+        assert thread.should_publish(data, 130.0)
+        thread.record_published(data, 130.0)
+        assert thread.aggregator.held == 3
+        # a device without a window publishes every sample
+        thread = MQTT_Publisher_Thread(
+            client, HADevice([], "me", "my/state", "God", "WASP"), MagicMock()
+        )
+        assert thread.aggregate({"temperature": 20.0}, 100.0)
+        assert thread.aggregator is None
 
     @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
     @patch("subprocess.check_output", side_effect = [
@@ -206,6 +321,26 @@ class TestMQTTClient(TestCase):
         assert mqtt_client.disconnect_mqtt() == 1
         assert not mqtt_client.is_discovered()
 
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    @patch("ha_mqtt_pi_smbus.environ.get_mac_address", return_value="12:34:56")
+    @patch("ha_mqtt_pi_smbus.environ.get_object_id", return_value="123456")
+    @patch("paho.mqtt.client.Client.disconnect", return_value=0)
+    @patch("paho.mqtt.client.Client.connect", return_value=0)
+    def test_metrics_removed_on_disconnect(
+        self, mock_connect, mock_disconnect, mock_object_id, mock_mac, mock_cpuinfo
+    ):
+        metrics = MetricsRegistry()
+        client = MQTTClient("me", BME280_Device(), None, self.config, metrics=metrics)
+        assert 'mqtt_outbox_acked_total{client="me"} 0' in metrics.render()
+        assert 'mqtt_connected{client="me"}' in metrics.render()
+        # the registry no longer refers to a disconnected client
+        assert client.disconnect_mqtt() == 0
+        assert 'client="me"' not in metrics.render()
+        assert client.connect_mqtt() == 0
+        assert 'mqtt_outbox_acked_total{client="me"} 0' in metrics.render()
+        client.disconnect()
+        assert 'client="me"' not in metrics.render()
+
     @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
     @patch(
         "subprocess.check_output",
@@ -354,6 +489,10 @@ class TestMQTTClient(TestCase):
         assert len(rc) == 2
 
     @patch("ha_mqtt_pi_smbus.mqtt_client.get_temperature", return_value=30000)
+    @patch(
+        "ha_mqtt_pi_smbus.mqtt_client.get_last_restart",
+        return_value="2025-08-26 17:42:54",
+    )
     @patch(
         "ha_mqtt_pi_smbus.mqtt_client.get_uptime",
         return_value="up 1 week, 11 hours, 13 minutes",
@@ -366,7 +505,7 @@ class TestMQTTClient(TestCase):
     @patch("paho.mqtt.client.Client.publish", return_value=(0, 1))
     @patch("paho.mqtt.client.Client.is_connected", side_effect=[False] * 20)
     @patch("paho.mqtt.client.Client.connect", return_value=0)
-    @patch("ha_mqtt_pi_smbus.device.SMBusDevice", return_value=(1, 0x76))
+    @patch("ha_mqtt_pi_smbus.device.SMBus")
     def test_mqtt_client_publish_ok(
         self,
         mock_smbus,
@@ -376,6 +515,7 @@ class TestMQTTClient(TestCase):
         mock_subprocess_check_output,
         mock_builtin_open,
         mock_uptime,
+        mock_last_restart,
         mock_temperature,
     ):
         sensor1 = HASensor(DEGREE, name="temperature", device_class="temperature")
@@ -392,11 +532,13 @@ class TestMQTTClient(TestCase):
             "God",
             "WASP",
         )
+        metrics = MetricsRegistry()
         mqtt_client = MQTTClient(
             client_prefix="me",
             device=device,
-            smbus_device=mock_smbus,
+            smbus_device=SMBusDevice(),
             config=self.config,
+            metrics=metrics,
         )
         obj = {
             "Connected": False,
@@ -413,9 +555,187 @@ class TestMQTTClient(TestCase):
         rc = mqtt_client.subscribe("my/state")
         assert len(rc) == 2
         mqtt_client.publish_discovery(mqtt_client.device)
+        topic, message = mock_subscribe.call_args_list[0][0][:2]
+        assert topic == device.discovery_topic
+        assert message is device.discovery_json()
+        assert mqtt_client.diagnostics_thread.is_alive()
+        calls = mock_subscribe.call_count
         mqtt_client.publish_available(mqtt_client.device)
+        topics = [c[0][0] for c in mock_subscribe.call_args_list[calls:]]
+        # three availability messages and one diagnostics snapshot
+        assert len(topics) == 4
+        assert topics.count(device.diagnostics_topic) == 1
+        mock_uptime.assert_called_once()
+        summary = mqtt_client.publish_trace.summary()
+        assert summary[device.diagnostics_topic]["messages"] == 1
+        assert sum(t["messages"] for t in summary.values()) == calls + 4
+        published = metrics["mqtt_published_total"]
+        assert published.get(topic=device.diagnostics_topic) == 1
+        assert metrics["mqtt_publish_seconds"].get(client="me") == calls + 4
+        assert metrics["mqtt_publish_failures_total"].get(topic="my/state") == 0
+        assert metrics["mqtt_connected"].get(client="me") == 1
+        assert metrics["mqtt_queued_packets"].get(client="me") >= 0
         mqtt_client.clear_discovery(mqtt_client.device)
+        assert mock_subscribe.call_args_list[-1][0][1] is device.undiscovery_json()
+        assert mqtt_client.diagnostics_thread is None
 
+    @patch("ha_mqtt_pi_smbus.mqtt_client.get_temperature", return_value=42.0)
+    @patch(
+        "ha_mqtt_pi_smbus.mqtt_client.get_last_restart",
+        return_value="2025-08-26 17:42:54",
+    )
+    @patch("ha_mqtt_pi_smbus.mqtt_client.get_uptime", return_value="up 5 minutes")
+    @patch(
+        "ha_mqtt_pi_smbus.mqtt_client.get_object_id", return_value="0123456789abcdef"
+    )
+    @patch("ha_mqtt_pi_smbus.device.get_object_id", return_value="0123456789abcdef")
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    @patch("paho.mqtt.client.Client.publish", return_value=(0, 1))
+    @patch("ha_mqtt_pi_smbus.device.SMBus")
+    def test_mqtt_client_multiple_devices(
+        self,
+        mock_smbus,
+        mock_publish,
+        mock_read,
+        mock_device_object_id,
+        mock_object_id,
+        mock_uptime,
+        mock_last_restart,
+        mock_temperature,
+    ):
+        def make_device(name):
+            return HADevice(
+                [HASensor(DEGREE, name=name, device_class="temperature")],
+                name,
+                f"{name}/state",
+                "Bosch",
+                "BME280",
+                object_id=f"0123456789abcdef_{name}",
+            )
+
+        office, garage, attic = (
+            make_device(name) for name in ("office", "garage", "attic")
+        )
+        self.config.mqtt.diagnostics_interval = 0
+        mqtt_client = MQTTClient("me", office, SMBusDevice(), self.config)
+        mqtt_client.add_device(garage, SMBusDevice(address=0x77))
+        with self.assertRaises(Exception):
+            mqtt_client.add_device(make_device("garage"), SMBusDevice())
+        assert list(mqtt_client.devices) == [
+            office.discovery_topic,
+            garage.discovery_topic,
+        ]
+
+        mqtt_client.publish_discovery()
+        assert mqtt_client.state.discovered
+        topics = [c[0][0] for c in mock_publish.call_args_list]
+        assert topics == [office.discovery_topic, garage.discovery_topic]
+        entries = list(mqtt_client.devices.values())
+        assert all(entry.publisher.is_alive() for entry in entries)
+        assert mqtt_client.publisher_thread is entries[0].publisher
+
+        # one diagnostics snapshot is taken for all the devices
+        mock_publish.reset_mock()
+        mqtt_client.publish_available()
+        topics = [c[0][0] for c in mock_publish.call_args_list]
+        assert topics == [
+            "homeassistant/office/availability",
+            "office/diagnostics/state",
+            "homeassistant/garage/availability",
+            "garage/diagnostics/state",
+        ]
+        mock_uptime.assert_called_once()
+
+        # a device added to a discovered client is discovered at once
+        mock_publish.reset_mock()
+        mqtt_client.add_device(attic, SMBusDevice())
+        assert mock_publish.call_args_list[0][0][0] == attic.discovery_topic
+        assert mqtt_client.devices[attic.discovery_topic].publisher.is_alive()
+
+        # Home Assistant coming online rediscovers every device
+        mock_publish.reset_mock()
+        mqtt_client.rediscovery_jitter = 0
+        msg = MQTTMessage(topic=mqtt_client.status_topic.encode("utf-8"))
+        msg.payload = b"online"
+        mqtt_client.on_message(None, None, msg)
+        mqtt_client.rediscovery.join(5)
+        topics = [c[0][0] for c in mock_publish.call_args_list]
+        for device in (office, garage, attic):
+            assert topics.count(device.discovery_topic) == 1
+
+        publisher = entries[1].publisher
+        mqtt_client.remove_device(garage)
+        assert not publisher.is_alive()
+        assert garage.discovery_topic not in mqtt_client.devices
+        assert mqtt_client.state.discovered
+        with self.assertRaises(Exception):
+            mqtt_client.publish_discovery(garage)
+        # the client's own device stays
+        with self.assertRaises(Exception):
+            mqtt_client.remove_device(office)
+        assert mqtt_client.device is office
+        assert office.discovery_topic in mqtt_client.devices
+        assert mqtt_client.devices[office.discovery_topic].publisher.is_alive()
+
+        mqtt_client.clear_discovery()
+        assert not mqtt_client.state.discovered
+        assert all(e.publisher is None for e in mqtt_client.devices.values())
+
+    @patch("ha_mqtt_pi_smbus.mqtt_client.get_temperature", return_value=42.0)
+    @patch(
+        "ha_mqtt_pi_smbus.mqtt_client.get_last_restart",
+        return_value="2025-08-26 17:42:54",
+    )
+    @patch("ha_mqtt_pi_smbus.mqtt_client.get_uptime", return_value="up 5 minutes")
+    @patch(
+        "ha_mqtt_pi_smbus.mqtt_client.get_object_id", return_value="0123456789abcdef"
+    )
+    @patch("ha_mqtt_pi_smbus.device.get_object_id", return_value="0123456789abcdef")
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    @patch("paho.mqtt.client.Client.publish", return_value=(0, 1))
+    @patch("ha_mqtt_pi_smbus.device.SMBus")
+    def test_mqtt_client_diagnostics_thread(
+        self,
+        mock_smbus,
+        mock_publish,
+        mock_read,
+        mock_device_object_id,
+        mock_object_id,
+        mock_uptime,
+        mock_last_restart,
+        mock_temperature,
+    ):
+        device = BME280_Device()
+        self.config.mqtt.diagnostics_interval = 0
+        mqtt_client = MQTTClient("me", device, SMBusDevice(), self.config)
+        mqtt_client.start_diagnostics()
+        assert mqtt_client.diagnostics_thread is None
+        mqtt_client.diagnostics_interval = 0.02
+        mqtt_client.start_diagnostics()
+        thread = mqtt_client.diagnostics_thread
+        mqtt_client.start_diagnostics()
+        assert mqtt_client.diagnostics_thread is thread
+        for _ in range(100):
+            if thread.publications >= 3:
+                break
+            time.sleep(0.01)
+        mqtt_client.stop_diagnostics()
+        assert not thread.is_alive()
+        assert thread.publications >= 3
+        assert mock_publish.call_count == thread.publications
+        topic, message = mock_publish.call_args[0][:2]
+        assert topic == "Office/diagnostics/state"
+        assert json.loads(message) == {
+            "status": "OK",
+            "cpu_temperature": 42.0,
+            "version": PACKAGE_VERSION,
+            "uptime": "up 5 minutes",
+            "last_restart": "2025-08-26 17:42:54",
+        }
+        with self.assertRaises(Exception):
+            MQTT_Diagnostics_Thread(mqtt_client, 0)
+
+    @patch("ha_mqtt_pi_smbus.mqtt_client.get_diagnostics", return_value={})
     @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
     @patch("ha_mqtt_pi_smbus.environ.get_mac_address", return_value="12:34:56")
     @patch("ha_mqtt_pi_smbus.environ.get_object_id", return_value="123456")
@@ -428,14 +748,281 @@ class TestMQTTClient(TestCase):
         mock_object_id,
         mock_mac_address,
         mock_cpuinfo,
+        mock_diagnostics,
     ):
+        self.config.mqtt.rediscovery_jitter = 0
         client = MQTTClient(None, BME280_Device(), None, self.config)
-        client.is_discovered = True
+        client.state.discovered = True
         msg = MQTTMessage(topic=client.status_topic.encode("utf-8"))
         msg.payload = b"online"
         client.on_message(None, None, msg)
-        mock_discovery.assert_called_once()
+        # the devices are announced by a thread, not the network loop
+        client.rediscovery.join(5)
+        mock_discovery.assert_called_once_with(client.device)
         mock_available.assert_called_once()
+        assert mock_available.call_args[0][0] is client.device
+        assert client.rediscovery.status == {client.device.discovery_topic: "done"}
+
+    @patch("ha_mqtt_pi_smbus.mqtt_client.get_diagnostics", return_value={})
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    @patch("ha_mqtt_pi_smbus.device.get_object_id", return_value="123456")
+    @patch("ha_mqtt_pi_smbus.mqtt_client.MQTTClient.publish_available")
+    @patch("ha_mqtt_pi_smbus.mqtt_client.MQTTClient.publish_discovery")
+    def test_rediscovery_rate_limited(
+        self,
+        mock_discovery,
+        mock_available,
+        mock_object_id,
+        mock_cpuinfo,
+        mock_diagnostics,
+    ):
+        devices = [
+            HADevice(
+                [HASensor(DEGREE, name=f"d{i}", device_class="temperature")],
+                f"d{i}",
+                f"d{i}/state",
+                "Bosch",
+                "BME280",
+                object_id=f"123456_d{i}",
+            )
+            for i in range(6)
+        ]
+        self.config.mqtt.rediscovery_rate = 50
+        self.config.mqtt.rediscovery_burst = 2
+        self.config.mqtt.rediscovery_jitter = 0
+        metrics = MetricsRegistry()
+        client = MQTTClient("me", devices[0], None, self.config, metrics=metrics)
+        for device in devices[1:]:
+            client.add_device(device, None)
+        mock_discovery.side_effect = lambda device: (
+            None if device is not devices[3] else 1 / 0
+        )
+        start = time.monotonic()
+        client.start_rediscovery()
+        client.rediscovery.join(5)
+        # two at once, then the other four at 50 per second
+        assert time.monotonic() - start >= 0.07
+        assert mock_discovery.call_count == 6
+        assert mock_available.call_count == 5
+        # the devices share one diagnostics snapshot
+        mock_diagnostics.assert_called_once()
+        status = client.rediscovery.status
+        assert status[devices[3].discovery_topic] == "failed"
+        assert list(status.values()).count("done") == 5
+        assert metrics["mqtt_rediscovery_pending"].get(client="me") == 0
+
+        # a second online message restarts the rediscovery
+        self.config.mqtt.rediscovery_rate = 0.1
+        client.rediscovery_rate = 0.1
+        client.start_rediscovery()
+        first = client.rediscovery
+        client.start_rediscovery()
+        first.join(1)
+        assert not first.is_alive()
+        assert 0 < metrics["mqtt_rediscovery_pending"].get(client="me") <= 6
+        client.stop_rediscovery()
+        client.rediscovery.join(1)
+        assert not client.rediscovery.is_alive()
+
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    @patch("ha_mqtt_pi_smbus.device.get_object_id", return_value="123456")
+    def test_rediscovery_config_invalid(self, mock_object_id, mock_cpuinfo):
+        device = BME280_Device()
+        for name, value in (
+            ("rediscovery_rate", 0),
+            ("rediscovery_rate", -1),
+            ("rediscovery_burst", 0),
+            ("rediscovery_jitter", -0.5),
+        ):
+            config = Config({"mqtt": {name: value}})
+            with self.assertRaises(Exception) as raised:
+                MQTTClient("me", device, None, config)
+            assert name in str(raised.exception)
+        config = Config({"mqtt": {"rediscovery_burst": 1, "rediscovery_jitter": 0}})
+        client = MQTTClient("me", device, None, config)
+        assert client.rediscovery_burst == 1
+        assert client.rediscovery_jitter == 0
+
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    @patch("ha_mqtt_pi_smbus.environ.get_mac_address", return_value="12:34:56")
+    @patch("ha_mqtt_pi_smbus.environ.get_object_id", return_value="123456")
+    @patch("paho.mqtt.client.Client.publish")
+    def test_publish_inflight_window(
+        self, mock_publish, mock_object_id, mock_mac, mock_cpuinfo
+    ):
+        mids = iter(range(1, 100))
+
+        def publish(topic, payload, qos, retain, properties):
+            info = MQTTMessageInfo(next(mids))
+            info.rc = MQTTErrorCode.MQTT_ERR_SUCCESS
+            return info
+
+        mock_publish.side_effect = publish
+        self.config.mqtt.max_inflight = 2
+        self.config.mqtt.max_queued = 2
+        metrics = MetricsRegistry()
+        client = MQTTClient(
+            "me", BME280_Device(), None, self.config, metrics=metrics
+        )
+        assert client.max_inflight_messages == 2
+        # QoS 0 messages are not held back
+        for _ in range(3):
+            assert client.publish("zero", "0", qos=0) is not None
+        assert client.outbox.inflight == 0
+        assert client.publish("a", "1", qos=1).mid == 4
+        assert client.publish("b", "1", qos=2).mid == 5
+        assert client.publish("c", "1", qos=1) is None
+        assert client.publish("c", "2", qos=1) is None
+        assert client.publish("d", "1", qos=1) is None
+        assert client.publish("e", "1", qos=1) is None
+        assert mock_publish.call_count == 5
+        assert metrics["mqtt_outbox_queued"].get(client="me") == 2
+        assert metrics["mqtt_outbox_coalesced_total"].get(client="me") == 1
+        assert metrics["mqtt_outbox_dropped_total"].get(client="me") == 1
+
+        # QoS 0 acknowledgements do not open the window
+        MQTTClient.on_publish(client, client, 1, None)
+        assert mock_publish.call_count == 5
+        MQTTClient.on_publish(client, client, 4, None)
+        assert mock_publish.call_args[0][:2] == ("d", "1")
+        MQTTClient.on_publish(client, client, 5, None)
+        assert mock_publish.call_args[0][:2] == ("e", "1")
+        assert client.outbox.stats() == {
+            "inflight": 2,
+            "queued": 0,
+            "published": 4,
+            "acked": 2,
+            "coalesced": 1,
+            "dropped": 1,
+        }
+        assert metrics["mqtt_outbox_acked_total"].get(client="me") == 2
+
+        # a message paho refuses gives its slot back
+        mock_publish.side_effect = None
+        mock_publish.return_value = MQTTMessageInfo(0)
+        mock_publish.return_value.rc = MQTTErrorCode.MQTT_ERR_QUEUE_SIZE
+        MQTTClient.on_publish(client, client, 6, None)
+        MQTTClient.on_publish(client, client, 7, None)
+        with self.assertLogs("ha_mqtt_pi_smbus.mqtt_client", "ERROR"):
+            client.publish("f", "1", qos=1)
+        assert client.outbox.inflight == 0
+
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    @patch("ha_mqtt_pi_smbus.environ.get_mac_address", return_value="12:34:56")
+    @patch("ha_mqtt_pi_smbus.environ.get_object_id", return_value="123456")
+    @patch("paho.mqtt.client.Client.is_connected", return_value=False)
+    @patch("paho.mqtt.client.Client.publish", return_value=(0, 1))
+    def test_store_and_replay(
+        self, mock_publish, mock_is_connected, mock_object_id, mock_mac, mock_cpuinfo
+    ):
+        device = BME280_Device()
+        metrics = MetricsRegistry()
+        with tempfile.TemporaryDirectory() as path:
+            self.config.mqtt.store_path = path
+            self.config.mqtt.replay_rate = 100
+            self.config.mqtt.replay_burst = 2
+            client = MQTTClient("me", device, None, self.config, metrics=metrics)
+            # while disconnected the state is kept in the store
+            for i in range(5):
+                assert client.publish_state(device, {"value": i}) is None
+            mock_publish.assert_not_called()
+            assert len(client.store) == 5
+            assert metrics["mqtt_store_messages"].get(client="me") == 5
+            assert os.listdir(os.path.join(path, "me"))
+            client.start_replay()
+            client.replay.join(1)
+            assert client.replay.replayed == 0
+            mock_is_connected.return_value = True
+            # the state waits behind the stored messages
+            assert client.publish_state(device, {"value": 5}) is None
+            start = time.monotonic()
+            client.start_replay()
+            client.replay.join(5)
+            # two at once, then the other four at 100 per second
+            assert time.monotonic() - start >= 0.03
+            payloads = [
+                json.loads(c[0][1])["value"] for c in mock_publish.call_args_list
+            ]
+            assert payloads == list(range(6))
+            assert all(c[0][0] == "me/state" for c in mock_publish.call_args_list)
+            assert not any(c[0][3] for c in mock_publish.call_args_list)
+            assert len(client.store) == 0
+            assert metrics["mqtt_replayed_total"].get(client="me") == 6
+            # with the store empty the state is published at once
+            assert client.publish_state(device, {"value": 6}) == (0, 1)
+            assert mock_publish.call_count == 7
+            client.start_replay()
+            assert not client.replay.is_alive()
+            client.store.close()
+
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    @patch("ha_mqtt_pi_smbus.device.get_object_id", return_value="123456")
+    def test_replay_config_invalid(self, mock_object_id, mock_cpuinfo):
+        device = BME280_Device()
+        for name, value in (
+            ("replay_rate", 0),
+            ("replay_rate", -1),
+            ("replay_burst", 0),
+        ):
+            config = Config({"mqtt": {name: value}})
+            with self.assertRaises(Exception) as raised:
+                MQTTClient("me", device, None, config)
+            assert name in str(raised.exception)
+        client = MQTTClient("me", device, None, Config({"mqtt": {"replay_burst": 1}}))
+        assert client.replay_burst == 1
+
+    @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
+    @patch("ha_mqtt_pi_smbus.environ.get_mac_address", return_value="12:34:56")
+    @patch("ha_mqtt_pi_smbus.environ.get_object_id", return_value="123456")
+    @patch("paho.mqtt.client.Client.publish", return_value=(0, 1))
+    @patch("ha_mqtt_pi_smbus.device.SMBus")
+    def test_state_coalescing(
+        self, mock_smbus, mock_publish, mock_object_id, mock_mac, mock_cpuinfo
+    ):
+        office = BME280_Device()
+        garage = HADevice(
+            [HASensor(DEGREE, name="t", device_class="temperature")],
+            "garage",
+            "garage/state",
+            "Bosch",
+            "BME280",
+            object_id="123456_garage",
+        )
+        self.config.mqtt.flush_interval = 0.05
+        self.config.mqtt.diagnostics_interval = 0
+        metrics = MetricsRegistry()
+        client = MQTTClient("me", office, SMBusDevice(), self.config, metrics=metrics)
+        client.add_device(garage, SMBusDevice())
+        for i in range(10):
+            assert client.publish_state(office, {"value": i}) is None
+        client.publish_state(garage, {"value": "garage"})
+        mock_publish.assert_not_called()
+        assert metrics["mqtt_state_pending"].get(client="me") == 2
+        assert metrics["mqtt_state_coalesced"].get(client="me") == 9
+        assert client.flush_states() == 2
+        assert [
+            (c[0][0], json.loads(c[0][1])) for c in mock_publish.call_args_list
+        ] == [("me/state", {"value": 9}), ("garage/state", {"value": "garage"})]
+        assert client.flush_states() == 0
+
+        # the flush thread runs while the devices are discovered
+        with patch("ha_mqtt_pi_smbus.mqtt_client.MQTTClient.publish") as publish:
+            client.publish_discovery()
+            assert client.flush_thread.is_alive()
+            client.publish_state(office, {"value": 10})
+            for _ in range(100):
+                if client.flush_thread.flushes:
+                    break
+                time.sleep(0.01)
+            assert client.flush_thread.flushes
+            assert ("me/state", {"value": 10}) in [
+                (c[0][0], json.loads(c[0][1])) for c in publish.call_args_list
+            ]
+            # the states not yet flushed are dropped with the discovery
+            client.publish_state(office, {"value": 11})
+            client.clear_discovery()
+            assert client.flush_thread is None
+            assert len(client.coalescer) == 0
 
     @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
     @patch("ha_mqtt_pi_smbus.environ.get_mac_address", return_value="12:34:56")
@@ -451,11 +1038,11 @@ class TestMQTTClient(TestCase):
         mock_cpuinfo,
     ):
         client = MQTTClient(None, BME280_Device(), None, self.config)
-        client.is_discovered = True
+        client.state.discovered = True
         msg = MQTTMessage(topic=client.status_topic.encode("utf-8"))
         msg.payload = b"offline"
         client.on_message(None, None, msg)
-        self.assertFalse(client.is_discovered)
+        self.assertFalse(client.is_discovered())
 
     @patch("ha_mqtt_pi_smbus.environ.readfile", return_value=MOCK_CPUINFO_DATA)
     @patch("ha_mqtt_pi_smbus.environ.get_mac_address", return_value="12:34:56")
@@ -473,7 +1060,7 @@ class TestMQTTClient(TestCase):
         mock_cpuinfo,
     ):
         client = MQTTClient(None, BME280_Device(), None, self.config)
-        client.is_discovered = True
+        client.state.discovered = True
         msg = MQTTMessage(topic=f'{client.config_topic}/get'.encode("utf-8"))
         msg.payload = b"anye"
         client.on_message(None, None, msg)
@@ -493,11 +1080,11 @@ class TestMQTTClient(TestCase):
         mock_cpuinfo,
     ):
         client = MQTTClient(None, BME280_Device(), None, self.config)
-        client.is_discovered = True
+        client.state.discovered = True
         msg = MQTTMessage(topic=client.status_topic.encode("utf-8"))
         msg.payload = b"bad"
         client.on_message(None, None, msg)
-        self.assertTrue(client.is_discovered)
+        self.assertTrue(client.is_discovered())
         mock_discovery.assert_not_called()
         mock_available.assert_not_called()
 
@@ -515,11 +1102,11 @@ class TestMQTTClient(TestCase):
         mock_cpuinfo,
     ):
         client = MQTTClient(None, BME280_Device(), None, self.config)
-        client.is_discovered = True
+        client.state.discovered = True
         msg = MQTTMessage(topic=b"bad")
         msg.payload = b"bad"
         client.on_message(None, None, msg)
-        self.assertTrue(client.is_discovered)
+        self.assertTrue(client.is_discovered())
         mock_discovery.assert_not_called()
         mock_available.assert_not_called()
 
@@ -0,0 +1,101 @@
+from unittest import TestCase
+
+from ha_mqtt_pi_smbus.outbox import Coalescer, Message, Outbox
+
+
+def message(topic, payload=b''):
+    return Message(topic, payload, 1, False)
+
+
+class TestOutbox(TestCase):
+    def test_window(self):
+        outbox = Outbox(max_inflight=2, max_queued=10)
+        self.assertTrue(outbox.put(message('a')))
+        outbox.sent(1)
+        self.assertTrue(outbox.put(message('b')))
+        self.assertEqual(outbox.inflight, 2)
+        # the slot is held until paho numbers the message
+        self.assertFalse(outbox.put(message('c')))
+        outbox.sent(2)
+        self.assertFalse(outbox.put(message('d')))
+        self.assertEqual(outbox.queued, 2)
+        self.assertEqual(outbox.ack(99), [])
+        self.assertEqual([m.topic for m in outbox.ack(1)], ['c'])
+        self.assertEqual(outbox.inflight, 2)
+        outbox.release()
+        self.assertEqual([m.topic for m in outbox.ack(2)], ['d'])
+        outbox.sent(3)
+        self.assertEqual(outbox.ack(3), [])
+        self.assertEqual(
+            outbox.stats(),
+            {
+                'inflight': 0,
+                'queued': 0,
+                'published': 3,
+                'acked': 3,
+                'coalesced': 0,
+                'dropped': 0,
+            },
+        )
+        # nothing waits once the window has room
+        self.assertTrue(outbox.put(message('e')))
+
+    def test_coalesce(self):
+        outbox = Outbox(max_inflight=1, max_queued=2)
+        self.assertTrue(outbox.put(message('a')))
+        outbox.sent(1)
+        self.assertFalse(outbox.put(message('b', b'1')))
+        self.assertFalse(outbox.put(message('c', b'1')))
+        self.assertFalse(outbox.put(message('b', b'2')))
+        self.assertEqual(outbox.coalesced, 1)
+        self.assertFalse(outbox.put(message('d')))
+        self.assertEqual(outbox.dropped, 1)
+        (waiting,) = outbox.ack(1)
+        outbox.sent(2)
+        self.assertEqual(waiting.topic, 'c')
+        (waiting,) = outbox.ack(2)
+        self.assertEqual(waiting.topic, 'd')
+
+    def test_drop_oldest(self):
+        outbox = Outbox(max_inflight=1, max_queued=2, policy='drop_oldest')
+        self.assertTrue(outbox.put(message('a')))
+        outbox.sent(1)
+        for payload in (b'1', b'2', b'3'):
+            self.assertFalse(outbox.put(message('b', payload)))
+        self.assertEqual(outbox.stats()['queued'], 2)
+        self.assertEqual(outbox.dropped, 1)
+        self.assertEqual(outbox.coalesced, 0)
+        (waiting,) = outbox.ack(1)
+        self.assertEqual(waiting.payload, b'2')
+
+    def test_no_queue(self):
+        outbox = Outbox(max_inflight=1, max_queued=0)
+        self.assertTrue(outbox.put(message('a')))
+        self.assertFalse(outbox.put(message('a')))
+        self.assertEqual(outbox.queued, 0)
+        self.assertEqual(outbox.dropped, 1)
+
+    def test_bad_parameters(self):
+        with self.assertRaises(Exception):
+            Outbox(max_inflight=0)
+        with self.assertRaises(Exception):
+            Outbox(max_queued=-1)
+        with self.assertRaises(Exception):
+            Outbox(policy='newest')
+
+
+class TestCoalescer(TestCase):
+    def test_coalescer(self):
+        coalescer = Coalescer()
+        self.assertEqual(coalescer.take(), {})
+        for i in range(5):
+            coalescer.put('a/state', str(i))
+        coalescer.put('b/state', 'b')
+        coalescer.put('a/state', 'last')
+        self.assertEqual(len(coalescer), 2)
+        self.assertEqual(coalescer.coalesced, 5)
+        self.assertEqual(
+            list(coalescer.take().items()), [('a/state', 'last'), ('b/state', 'b')]
+        )
+        self.assertEqual(len(coalescer), 0)
+        self.assertEqual(coalescer.flushed, 2)
@@ -167,3 +167,81 @@ class TestParser(TestCase):
         self.assertEqual(parser._config_dict['mqtt']['password'], 'password')
         self.assertEqual(parser._config_dict['mqtt']['polling_interval'], 117)
         self.assertEqual(parser._config_dict['mqtt']['qos'], 1)
+
+    @patch(
+        'sys.argv',
+        [
+            'me',
+            '--mqtt_asyncio',
+            '--mqtt_diagnostics_interval', '0',
+            '--mqtt_publish_summary_interval', '0',
+            '--mqtt_rediscovery_rate', '2.5',
+            '--mqtt_rediscovery_burst', '3',
+            '--mqtt_rediscovery_jitter', '0',
+            '--mqtt_max_inflight', '5',
+            '--mqtt_max_queued', '0',
+            '--mqtt_queue_policy', 'drop_oldest',
+            '--mqtt_store_path', '/var/lib/store',
+            '--mqtt_store_max_bytes', '0',
+            '--mqtt_replay_rate', '20',
+            '--mqtt_replay_burst', '4',
+            '--mqtt_flush_interval', '0',
+            '--mqtt_serializer', 'json',
+        ],
+    )
+    @patch('ha_mqtt_pi_smbus.environ.get_pyproject_version', return_value='v0.1.2')
+    @patch(
+        'ha_mqtt_pi_smbus.util.read_yaml',
+        return_value={'title': 'Title', 'subtitle': ''},
+    )
+    def test_parser_mqtt_publishing_args(self, mock_read_yaml, mock_pyproject_version):
+        parser = Parser()
+        parser.parse_args()
+        mqtt = parser._config_dict['mqtt']
+        self.assertEqual(mqtt['asyncio'], True)
+        # a 0 is kept rather than left to the default
+        self.assertEqual(mqtt['diagnostics_interval'], 0)
+        self.assertEqual(mqtt['publish_summary_interval'], 0)
+        self.assertEqual(mqtt['rediscovery_rate'], 2.5)
+        self.assertEqual(mqtt['rediscovery_burst'], 3)
+        self.assertEqual(mqtt['rediscovery_jitter'], 0)
+        self.assertEqual(mqtt['max_inflight'], 5)
+        self.assertEqual(mqtt['max_queued'], 0)
+        self.assertEqual(mqtt['queue_policy'], 'drop_oldest')
+        self.assertEqual(mqtt['store_path'], '/var/lib/store')
+        self.assertEqual(mqtt['store_max_bytes'], 0)
+        self.assertEqual(mqtt['replay_rate'], 20)
+        self.assertEqual(mqtt['replay_burst'], 4)
+        self.assertEqual(mqtt['flush_interval'], 0)
+        self.assertEqual(mqtt['serializer'], 'json')
+
+    @patch('sys.argv', ['me'])
+    @patch('ha_mqtt_pi_smbus.environ.get_pyproject_version', return_value='v0.1.2')
+    @patch(
+        'ha_mqtt_pi_smbus.util.read_yaml',
+        return_value={'title': 'Title', 'subtitle': ''},
+    )
+    def test_parser_mqtt_publishing_defaults(
+        self, mock_read_yaml, mock_pyproject_version
+    ):
+        parser = Parser()
+        parser.parse_args()
+        # the options not given are left to the config file and MqttConfig
+        for name in (
+            'asyncio',
+            'diagnostics_interval',
+            'publish_summary_interval',
+            'rediscovery_rate',
+            'rediscovery_burst',
+            'rediscovery_jitter',
+            'max_inflight',
+            'max_queued',
+            'queue_policy',
+            'store_path',
+            'store_max_bytes',
+            'replay_rate',
+            'replay_burst',
+            'flush_interval',
+            'serializer',
+        ):
+            self.assertNotIn(name, parser._config_dict['mqtt'])
@@ -56,6 +56,94 @@ class TestPiBME280(TestCase):
         mock_client.assert_called_once()
         mock_flask.assert_called_once()
 
+    @patch(
+        'sys.argv', ['me', '--bme280_address=118', '--bme280_bus=1', '--mqtt_asyncio']
+    )
+    @patch('example.pi_bme280.device.BME280')
+    @patch('example.pi_bme280.device.BME280_Device')
+    @patch('ha_mqtt_pi_smbus.async_mqtt_client.AsyncSMBus_Scheduler')
+    @patch('ha_mqtt_pi_smbus.async_mqtt_client.AsyncMQTTClient')
+    @patch('ha_mqtt_pi_smbus.mqtt_client.MQTTClient')
+    @patch('ha_mqtt_pi_smbus.web_server.HAFlask')
+    def test_pi_bme280_asyncio(
+        self,
+        mock_flask,
+        mock_client,
+        mock_async_client,
+        mock_scheduler,
+        mock_device,
+        mock_bme280,
+    ):
+        sys.modules.pop('example.pi_bme280.pi_bme280', None)
+        from example.pi_bme280.pi_bme280 import main
+
+        main([])
+        mock_scheduler.assert_called_once()
+        mock_client.assert_not_called()
+        mock_async_client.assert_called_once()
+        self.assertIs(
+            mock_async_client.call_args.kwargs['scheduler'],
+            mock_scheduler.return_value,
+        )
+        self.assertIs(
+            mock_device.call_args.kwargs['scheduler'], mock_scheduler.return_value
+        )
+
+    @patch(
+        'sys.argv',
+        ['me', '--bme280_address=118', '--bme280_bus=1', '--bme280_simulate'],
+    )
+    @patch('example.pi_bme280.device.BME280')
+    @patch('example.pi_bme280.device.BME280_Device')
+    @patch('ha_mqtt_pi_smbus.simulator.SMBusSimulator')
+    @patch('ha_mqtt_pi_smbus.mqtt_client.MQTTClient')
+    @patch('ha_mqtt_pi_smbus.web_server.HAFlask')
+    def test_pi_bme280_simulate(
+        self, mock_flask, mock_client, mock_simulator, mock_device, mock_bme280
+    ):
+        sys.modules.pop('example.pi_bme280.pi_bme280', None)
+        from example.pi_bme280.pi_bme280 import main
+
+        main([])
+        simulator = mock_simulator.return_value
+        simulator.add_device.assert_called_once()
+        self.assertEqual(simulator.add_device.call_args.args[:2], (1, 118))
+        simulator.install.assert_called_once()
+        mock_bme280.assert_called_once()
+
+    @patch(
+        'sys.argv',
+        [
+            'me',
+            '--bme280_address=118',
+            '--bme280_bus=1',
+            '--bme280_burst',
+            '5',
+            '--bme280_filter',
+            'hampel',
+        ],
+    )
+    @patch('example.pi_bme280.device.BME280')
+    @patch('example.pi_bme280.device.BME280_Device')
+    @patch('ha_mqtt_pi_smbus.mqtt_client.MQTTClient')
+    @patch('ha_mqtt_pi_smbus.web_server.HAFlask')
+    def test_pi_bme280_conditioning(
+        self, mock_flask, mock_client, mock_device, mock_bme280
+    ):
+        sys.modules.pop('example.pi_bme280.pi_bme280', None)
+        from example.pi_bme280.pi_bme280 import main
+
+        main([])
+        set_conditioning = mock_bme280.return_value.set_conditioning
+        set_conditioning.assert_called_once()
+        burst, conditioners = set_conditioning.call_args.args
+        self.assertEqual(burst, 5)
+        self.assertEqual(
+            sorted(conditioners), ['humidity', 'pressure', 'temperature']
+        )
+        self.assertEqual(conditioners['pressure'].filter, 'hampel')
+        self.assertEqual(conditioners['pressure'].threshold, 3.0)
+
     @patch('sys.argv', ['--bme280_address=118', '--bme280_bus=1'])
     @patch('example.pi_bme280.device.BME280')
     @patch('example.pi_bme280.device.BME280_Device')
@@ -0,0 +1,55 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch
+
+from ha_mqtt_pi_smbus.serializer import (
+    JsonSerializer,
+    available_serializers,
+    get_serializer,
+)
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class TestSerializer(TestCase):
+    def test_round_trip(self):
+        data = {
+            'temperature': 21.5,
+            'humidity': 40,
+            'name': 'garage °C',
+            'ok': True,
+            'last': None,
+            'values': [1, 2.5, 'three'],
+        }
+        self.assertIn('json', available_serializers())
+        for name in available_serializers():
+            encoded = get_serializer(name).dumps(data)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(json.loads(encoded), data)
+
+    def test_default(self):
+        for name in available_serializers():
+            serializer = get_serializer(name)
+            self.assertEqual(
+                json.loads(serializer.dumps({'p': Point(1, 2)}, default=vars)),
+                {'p': {'x': 1, 'y': 2}},
+            )
+            with self.assertRaises(TypeError):
+                serializer.dumps({'p': Point(1, 2)})
+
+    def test_auto(self):
+        self.assertEqual(get_serializer().name, available_serializers()[0])
+        with patch.dict('sys.modules', {'orjson': None, 'msgspec': None}):
+            self.assertEqual(available_serializers(), ['json'])
+            self.assertIsInstance(get_serializer('auto'), JsonSerializer)
+            self.assertEqual(get_serializer('auto').name, 'json')
+            with self.assertRaises(Exception):
+                get_serializer('orjson')
+
+    def test_unknown(self):
+        with self.assertRaises(Exception):
+            get_serializer('pickle')
@@ -0,0 +1,150 @@
+import errno
+import time
+from unittest import TestCase
+
+from smbus2 import i2c_msg
+
+from example.pi_bme280.device import BME280
+from example.pi_bme280.simulator import SimulatedBME280
+from ha_mqtt_pi_smbus.conditioning import Conditioner
+from ha_mqtt_pi_smbus.device import SharedSMBus, SMBus_Scheduler_Thread
+from ha_mqtt_pi_smbus.metrics import MetricsRegistry
+from ha_mqtt_pi_smbus.simulator import SimulatedDevice, SMBusSimulator
+
+
+class TestSMBusSimulator(TestCase):
+    def setUp(self):
+        self.simulator = SMBusSimulator(seed=1)
+        self.device = self.simulator.add_device(1, 0x40)
+        self.bus = self.simulator.open(1)
+
+    def test_registers(self):
+        self.bus.write_byte_data(0x40, 0x10, 0xAB)
+        self.assertEqual(self.bus.read_byte_data(0x40, 0x10), 0xAB)
+        self.bus.write_word_data(0x40, 0x20, 0x1234)
+        self.assertEqual(self.bus.read_word_data(0x40, 0x20), 0x1234)
+        self.assertEqual(self.device.registers[0x20:0x22], b'\x34\x12')
+        self.bus.write_i2c_block_data(0x40, 0x30, [1, 2, 3])
+        self.assertEqual(self.bus.read_i2c_block_data(0x40, 0x30, 3), [1, 2, 3])
+        self.bus.write_byte(0x40, 0x31)
+        self.assertEqual(self.bus.read_byte(0x40), 2)
+        self.assertEqual(self.bus.read_byte(0x40), 3)
+        self.assertEqual(self.simulator.transactions, 9)
+
+    def test_i2c_rdwr(self):
+        self.device.registers[0x50:0x54] = b'\x01\x02\x03\x04'
+        write = i2c_msg.write(0x40, [0x51])
+        read = i2c_msg.read(0x40, 3)
+        self.bus.i2c_rdwr(write, read)
+        self.assertEqual(list(read), [2, 3, 4])
+        self.assertEqual(self.device.pointer, 0x54)
+        self.bus.i2c_rdwr(i2c_msg.write(0x40, [0x60, 7, 8]))
+        self.assertEqual(self.device.registers[0x60:0x62], b'\x07\x08')
+
+    def test_nack(self):
+        with self.assertRaises(OSError) as context:
+            self.bus.read_byte_data(0x41, 0)
+        self.assertEqual(context.exception.errno, errno.EREMOTEIO)
+        self.device.nack = True
+        with self.assertRaises(OSError) as context:
+            self.bus.read_byte_data(0x40, 0)
+        self.assertEqual(context.exception.errno, errno.EREMOTEIO)
+        self.device.nack = False
+        self.simulator.remove_device(1, 0x40)
+        self.assertIsNone(self.simulator.device(1, 0x40))
+        with self.assertRaises(OSError):
+            self.bus.read_byte_data(0x40, 0)
+        self.assertEqual(self.simulator.errors, 3)
+
+    def test_error_injection(self):
+        self.simulator.error_rate = 1.0
+        with self.assertRaises(OSError) as context:
+            self.bus.read_byte_data(0x40, 0)
+        self.assertEqual(context.exception.errno, errno.EIO)
+        self.simulator.error_rate = 0.0
+        self.simulator.nack_rate = 0.5
+        failures = 0
+        for _ in range(200):
+            try:
+                self.bus.read_byte_data(0x40, 0)
+            except OSError as e:
+                self.assertEqual(e.errno, errno.EREMOTEIO)
+                failures += 1
+        self.assertTrue(50 < failures < 150, failures)
+        self.assertEqual(self.simulator.errors, failures + 1)
+
+    def test_latency(self):
+        self.simulator.latency = 0.01
+        self.simulator.byte_time = 0.001
+        start = time.perf_counter()
+        self.bus.read_i2c_block_data(0x40, 0, 9)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.02)
+
+    def test_install(self):
+        with self.simulator:
+            self.assertIsInstance(SharedSMBus.get(1)._smbus, type(self.bus))
+        self.assertIsNone(SharedSMBus.backend)
+
+
+class TestSimulatedBME280(TestCase):
+    def test_bme280(self):
+        simulator = SMBusSimulator()
+        simulated = simulator.add_device(1, 0x76, SimulatedBME280(noise=0))
+        self.assertIsInstance(simulated, SimulatedDevice)
+        with simulator:
+            bme280 = BME280(bus=1, address=0x76)
+            bme280.sample()
+        self.assertEqual(simulated.measurements, 1)
+        self.assertAlmostEqual(bme280.temperature, 25.08, places=1)
+        self.assertAlmostEqual(bme280.pressure, 1006.5, delta=1)
+        self.assertTrue(0 < bme280.humidity < 100)
+
+    def test_burst(self):
+        simulator = SMBusSimulator()
+        simulated = simulator.add_device(1, 0x76, SimulatedBME280(noise=0))
+        metrics = MetricsRegistry()
+        with simulator:
+            bme280 = BME280(bus=1, address=0x76)
+            bme280.sample()
+            single = bme280.getdata()
+            bme280.set_conditioning(
+                5, {'temperature': Conditioner('hampel')}, metrics=metrics
+            )
+            bme280.sample()
+        self.assertEqual(simulated.measurements, 6)
+        # without noise the burst filters to the single measurement
+        data = bme280.getdata()
+        for field in ('temperature', 'pressure', 'humidity'):
+            self.assertEqual(data[field], single[field])
+        self.assertEqual(bme280.temperature, bme280.conditioners['temperature'].value)
+        self.assertEqual(
+            metrics['smbus_burst_reads_total'].get(bus=1, address='0x76'), 5
+        )
+        with self.assertRaises(Exception):
+            bme280.set_conditioning(0)
+
+    def test_random_walk(self):
+        device = SimulatedBME280(seed=3)
+        for _ in range(1000):
+            device.measure()
+        start = device.start['temperature']
+        self.assertNotEqual(device.raw['temperature'], start)
+        self.assertTrue(0.95 * start <= device.raw['temperature'] <= 1.05 * start)
+
+    def test_scheduler_nack(self):
+        simulator = SMBusSimulator()
+        simulated = simulator.add_device(1, 0x76, SimulatedBME280())
+        metrics = MetricsRegistry()
+        with simulator:
+            bme280 = BME280(bus=1, address=0x76)
+            simulated.nack = True
+            scheduler = SMBus_Scheduler_Thread(1, startup_delay=0, metrics=metrics)
+            scheduler.add_device(bme280, 0.01)
+            with self.assertLogs('ha_mqtt_pi_smbus', 'ERROR'):
+                scheduler.start()
+                time.sleep(0.1)
+            scheduler.clear_do_run()
+            scheduler.join()
+        failures = metrics['smbus_sample_failures_total'].get(bus=1, address='0x76')
+        self.assertGreater(failures, 0)
+        self.assertEqual(metrics['smbus_samples_total'].get(bus=1, address='0x76'), 0)
@@ -0,0 +1,97 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from ha_mqtt_pi_smbus.store import ReadingStore
+
+
+class TestReadingStore(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.path))
+
+    def test_fifo(self):
+        store = ReadingStore(self.path, max_bytes=1000, segment_bytes=100)
+        self.assertIsNone(store.peek())
+        for i in range(10):
+            store.append('a/state', f'{{"value": {i}}}')
+        store.append('b/state', b'\x00\x01')
+        self.assertEqual(len(store), 11)
+        # each record is 8 bytes of header, 8 of topic and its payload
+        self.assertEqual(len(self.segments()), 4)
+        for i in range(10):
+            self.assertEqual(store.peek(), ('a/state', f'{{"value": {i}}}'.encode()))
+            self.assertEqual(store.peek(), ('a/state', f'{{"value": {i}}}'.encode()))
+            store.pop()
+        self.assertEqual(store.peek(), ('b/state', b'\x00\x01'))
+        self.assertEqual(len(self.segments()), 1)
+        store.pop()
+        self.assertIsNone(store.peek())
+        self.assertEqual(len(store), 0)
+        self.assertEqual(self.segments(), [])
+        store.pop()
+        # the store is started again after being emptied
+        store.append('a/state', 'again')
+        self.assertEqual(store.peek(), ('a/state', b'again'))
+        store.close()
+
+    def test_bounded(self):
+        store = ReadingStore(self.path, max_bytes=200, segment_bytes=100)
+        for i in range(20):
+            store.append('a/state', f'{i:02d}')
+        self.assertLessEqual(store.bytes, 200)
+        self.assertEqual(len(store) + store.dropped, 20)
+        self.assertGreater(store.dropped, 0)
+        # the most recent records are kept
+        self.assertEqual(store.peek(), ('a/state', f'{store.dropped:02d}'.encode()))
+        store.close()
+
+    def test_reopen(self):
+        store = ReadingStore(self.path, max_bytes=1000, segment_bytes=100)
+        for i in range(5):
+            store.append('a/state', str(i))
+        store.pop()
+        store.close()
+        # a torn record at the end of the last segment
+        last = os.path.join(self.path, self.segments()[-1])
+        with open(last, 'ab') as f:
+            f.write(b'\x00\x00\x00\x20\x12\x34')
+        with self.assertLogs('ha_mqtt_pi_smbus.store', 'WARNING'):
+            store = ReadingStore(self.path, max_bytes=1000, segment_bytes=100)
+        self.assertEqual(store.truncated, 6)
+        # the position of pop() is not kept
+        self.assertEqual(len(store), 5)
+        self.assertEqual(store.peek(), ('a/state', b'0'))
+        store.append('a/state', '5')
+        for i in range(6):
+            self.assertEqual(store.peek(), ('a/state', str(i).encode()))
+            store.pop()
+        self.assertIsNone(store.peek())
+        store.close()
+
+    def test_damaged(self):
+        store = ReadingStore(self.path, max_bytes=1000, segment_bytes=20)
+        for i in range(3):
+            store.append('a/state', str(i))
+        first = os.path.join(self.path, self.segments()[0])
+        with open(first, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'X')
+        with self.assertLogs('ha_mqtt_pi_smbus.store', 'ERROR'):
+            self.assertEqual(store.peek(), ('a/state', b'1'))
+        self.assertEqual(store.dropped, 1)
+        store.close()
+
+    def test_bad_parameters(self):
+        with self.assertRaises(Exception):
+            ReadingStore(self.path, max_bytes=100, segment_bytes=60)
+        with self.assertRaises(Exception):
+            ReadingStore(self.path, segment_bytes=0)
+        store = ReadingStore(self.path, max_bytes=1600)
+        self.assertEqual(store.segment_bytes, 100)
@@ -19,6 +19,7 @@ from ha_mqtt_pi_smbus.util import (
     ipaddress,
     readfile,
     get_command_data,
+    TokenBucket,
 )
 
 CONFIG_DATA = '''---
@@ -150,4 +151,22 @@ a:a
             stderr='Error output from command',
         )
         result = get_command_data(['echo', 'Hello! World!'])
-        self.assertIsNone(result)
\ No newline at end of file
+        self.assertIsNone(result)
+
+    def test_token_bucket(self):
+        now = [100.0]
+        bucket = TokenBucket(2, burst=3, clock=lambda: now[0])
+        # the burst is available at once, then a token every 0.5s
+        self.assertEqual([bucket.take() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(bucket.take(), 0.5)
+        self.assertEqual(bucket.take(), 1.0)
+        now[0] += 1.0
+        self.assertEqual(bucket.take(), 0.5)
+        # an idle bucket refills up to the burst only
+        now[0] += 60.0
+        self.assertEqual([bucket.take() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(bucket.take(), 0.5)
+        with self.assertRaises(Exception):
+            TokenBucket(0)
+        with self.assertRaises(Exception):
+            TokenBucket(1, burst=0)
@@ -4,6 +4,7 @@ from unittest import TestCase
 from unittest.mock import MagicMock
 
 from ha_mqtt_pi_smbus.config import Config
+from ha_mqtt_pi_smbus.metrics import MetricsRegistry
 from ha_mqtt_pi_smbus.state import State
 from ha_mqtt_pi_smbus.web_server import HAFlask
 
@@ -63,6 +64,61 @@ class TestHAFlask(TestCase):
             response = self.app.dispatch_request()
             self.assertIsNotNone(response)
 
+    def test_metrics(self):
+        self.mock_client.metrics = MetricsRegistry()
+        self.mock_client.metrics.counter('mqtt_published_total', 'sent').inc(3)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE mqtt_published_total counter', response.data)
+        self.assertIn(b'\nmqtt_published_total 3\n', response.data)
+
+    def test_history(self):
+        from ha_mqtt_pi_smbus.history import History
+
+        sensor = MagicMock(state_field='temperature', history=History(10))
+        sensor.history.append(21.5, 1_000_000_000)
+        sensor.history.append(22.5, 2_000_000_000)
+        self.mock_device.sensors = [
+            MagicMock(state_field='humidity', history=None),
+            sensor,
+        ]
+        response = self.client.get('/history/temperature')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.get_json(),
+            {
+                'field': 'temperature',
+                'timestamps': [1_000_000_000, 2_000_000_000],
+                'values': [21.5, 22.5],
+            },
+        )
+        # both points are in the distant past
+        response = self.client.get('/history/temperature?seconds=60')
+        self.assertEqual(response.get_json()['values'], [])
+        self.assertEqual(self.client.get('/history/humidity').status_code, 404)
+
+    def test_history_devices(self):
+        from ha_mqtt_pi_smbus.history import History
+
+        # without a device the sensors of every device of the client are searched
+        devices = {}
+        for name, value in (('office', 21.5), ('kitchen', 19.0)):
+            sensor = MagicMock(state_field='temperature', history=History(10))
+            sensor.history.append(value, 1_000_000_000)
+            device = MagicMock(sensors=[sensor])
+            device.device.name = name
+            devices[name] = MagicMock(device=device)
+        self.mock_client.devices = devices
+        self.app.device = None
+        response = self.client.get('/history/temperature')
+        self.assertEqual(response.get_json()['values'], [21.5])
+        response = self.client.get('/history/temperature?device=kitchen')
+        self.assertEqual(response.get_json()['values'], [19.0])
+        response = self.client.get('/history/temperature?device=garage')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/history/pressure').status_code, 404)
+
     def test_mqtt_toggle_not_connected(self):
         # State before toggle: disconnected
         self.mock_client.is_connected.side_effect = [False] * 4